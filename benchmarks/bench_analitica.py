@@ -0,0 +1,121 @@
+"""
+Benchmark y validación del módulo de analítica vectorizada
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Compara src/analitica.py con una implementación de referencia en pandas que
+sigue la semántica de las consultas SQL de la memoria (ventanas RANGE por
+actividad, DATE_BIN de 10 s), sobre varias actividades sintéticas:
+
+    python benchmarks/bench_analitica.py --actividades 50 --muestras 5000
+
+Con --influx ID_ACTIVIDAD compara además contra las consultas SQL originales
+ejecutadas en InfluxDB (requiere las variables INFLUX_*).
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import analitica  # noqa: E402
+from datos_sinteticos import generar_streams  # noqa: E402
+from main import streams_a_dataframe  # noqa: E402
+
+
+def generar_lote(n_actividades, n_muestras):
+    """
+    Concatena varias actividades sintéticas con su id_actividad.
+    """
+    partes = []
+    for i in range(n_actividades):
+        df = streams_a_dataframe(generar_streams(n_muestras, semilla=i),
+                                 datetime(2025, 1, 1, 8) + timedelta(days=i))
+        df['id_actividad'] = str(1000 + i)
+        partes.append(df)
+    return pd.concat(partes, ignore_index=True)
+
+
+def referencia_pandas(df, umbrales):
+    """
+    Mismas métricas con pandas, actividad a actividad.
+    """
+    filas = []
+    for id_actividad, grupo in df.groupby('id_actividad'):
+        serie = grupo.set_index('timestamp_real')
+        pulso = serie['heartrate'].astype(float)
+        eficiencia = (serie['velocity_smooth'].astype(float) / pulso).mean()
+        # RANGE INTERVAL '10 seconds' PRECEDING incluye ambos extremos: 11 s en pandas
+        fc_max = pulso.rolling('11s').mean().max()
+        bins = pulso.groupby(pulso.index.floor('10s')).mean()
+        zonas = pd.cut(bins, [-np.inf, *umbrales, np.inf], right=False, labels=analitica.ZONAS)
+        minutos = zonas.value_counts().reindex(analitica.ZONAS, fill_value=0) * 10 / 60
+        filas.append({'id_actividad': id_actividad, 'eficiencia_aerobica_sesion': eficiencia,
+                      'fc_max': fc_max, **minutos.to_dict()})
+    return pd.DataFrame(filas)
+
+
+def comparar_con_influx(id_actividad):
+    """
+    Ejecuta la consulta SQL de FC máxima de la memoria y la compara con analitica.
+    """
+    from influxdb_client_3 import InfluxDBClient3
+
+    client = InfluxDBClient3(host=os.getenv("INFLUX_HOST"), token=os.getenv("INFLUX_TOKEN"),
+                             org=os.getenv("INFLUX_ORG"), database=os.getenv("INFLUX_DATABASE"))
+    query = f"""
+    SELECT MAX(fc) AS fc_max FROM (
+      SELECT AVG(heartrate) OVER (ORDER BY time RANGE INTERVAL '10 seconds' PRECEDING) AS fc
+      FROM "Run" WHERE id_actividad = '{id_actividad}'
+    )
+    """
+    sql = client.query(query=query).to_pandas()['fc_max'].iloc[0]
+    crudo = client.query(
+        query=f"""SELECT time AS timestamp_real, heartrate, velocity_smooth FROM "Run" WHERE id_actividad = '{id_actividad}'"""
+    ).to_pandas()
+    client.close()
+    local = analitica.fc_max_movil(crudo)['fc_max'].iloc[0]
+    print(f"InfluxDB SQL: {sql:.3f}  analitica: {local:.3f}")
+    assert abs(sql - local) < 1e-6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de analitica.py")
+    parser.add_argument("--actividades", type=int, default=50)
+    parser.add_argument("--muestras", type=int, default=5000)
+    parser.add_argument("--influx", help="ID de actividad para validar contra InfluxDB")
+    args = parser.parse_args()
+
+    df = generar_lote(args.actividades, args.muestras)
+    umbrales = analitica.UMBRALES_POR_DEFECTO
+
+    inicio = time.perf_counter()
+    esperado = referencia_pandas(df, umbrales)
+    t_referencia = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    obtenido = analitica.metricas_por_actividad(df, umbrales)
+    t_vectorizado = time.perf_counter() - inicio
+
+    pd.testing.assert_frame_equal(
+        esperado.sort_values('id_actividad').reset_index(drop=True),
+        obtenido.sort_values('id_actividad').reset_index(drop=True),
+        check_dtype=False, atol=1e-6
+    )
+
+    print(f"Actividades: {args.actividades} x {args.muestras} muestras")
+    print(f"Referencia pandas: {t_referencia * 1000:8.1f} ms")
+    print(f"analitica.py:      {t_vectorizado * 1000:8.1f} ms  (x{t_referencia / t_vectorizado:.1f})")
+
+    if args.influx:
+        comparar_con_influx(args.influx)
+
+
+if __name__ == "__main__":
+    main()
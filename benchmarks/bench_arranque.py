@@ -0,0 +1,131 @@
+"""
+Presupuesto de tiempo de arranque de los puntos de entrada
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Ejecuta cada comando con `python -X importtime` en un directorio temporal y
+mide el tiempo de importación de los módulos propios y sus dependencias
+(descontando el arranque del intérprete, medido con `python -c pass`). Hay
+dos comprobaciones por comando:
+
+- el tiempo de importación (mediana de --repeticiones) no supera su
+  presupuesto en milisegundos, y
+- no se importa ninguna dependencia pesada (pandas, pyarrow, NumPy,
+  influxdb_client_3, requests, prometheus_client): esta es la que detecta
+  de forma fiable que alguien ha vuelto a poner un import pesado al
+  principio de un módulo.
+
+    python benchmarks/bench_arranque.py
+    python benchmarks/bench_arranque.py --repeticiones 10 --escala 2
+
+El código de salida es 1 si algún comando incumple su presupuesto.
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+SRC = os.path.abspath(os.path.join(DIRECTORIO, "..", "src"))
+
+PESADOS = ("numpy", "pandas", "pyarrow", "influxdb_client_3", "requests", "prometheus_client")
+
+# Nombre, argumentos de python y presupuesto de importación en ms
+CASOS = [
+    ("cli --help", [os.path.join(SRC, "cli.py"), "--help"], 150),
+    ("cli usuarios listar", [os.path.join(SRC, "cli.py"), "usuarios", "listar"], 150),
+    ("import main", ["-c", "import main"], 150),
+    ("import consultar_influxdb", ["-c", "import consultar_influxdb"], 150),
+    ("import carga_masiva", ["-c", "import carga_masiva"], 150),
+    ("import sincronizacion", ["-c", "import sincronizacion"], 150),
+    ("import importar_csv", ["-c", "import importar_csv"], 150),
+]
+
+
+def importaciones(argumentos, directorio, entorno):
+    """
+    Ejecuta `python -X importtime <argumentos>`. Devuelve (segundos de
+    importación de los módulos de primer nivel, módulos importados,
+    segundos de reloj del proceso).
+    """
+    inicio = time.perf_counter()
+    proceso = subprocess.run([sys.executable, "-X", "importtime", *argumentos], cwd=directorio, env=entorno,
+                             capture_output=True, text=True)
+    reloj = time.perf_counter() - inicio
+    if proceso.returncode != 0:
+        raise RuntimeError(f"{' '.join(argumentos)} terminó con código {proceso.returncode}:\n{proceso.stderr[-2000:]}")
+
+    total = 0
+    modulos = set()
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        _, acumulado, nombre = linea[len("import time:"):].split("|")
+        modulos.add(nombre.strip())
+        if not nombre.startswith("  "):
+            # Primer nivel: su tiempo acumulado incluye el de los que importa
+            total += int(acumulado)
+    return total / 1e6, modulos, reloj
+
+
+def medir(argumentos, repeticiones, directorio, entorno):
+    """
+    Mediana del tiempo de importación y del de reloj, y unión de los
+    módulos importados en todas las repeticiones.
+    """
+    tiempos, relojes, modulos = [], [], set()
+    for _ in range(repeticiones):
+        segundos, importados, reloj = importaciones(argumentos, directorio, entorno)
+        tiempos.append(segundos)
+        relojes.append(reloj)
+        modulos |= importados
+    return statistics.median(tiempos), statistics.median(relojes), modulos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Presupuesto de tiempo de arranque de la CLI y los scripts")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--escala", type=float, default=1.0,
+                        help="multiplica los presupuestos (p. ej. 2 en máquinas lentas de CI)")
+    args = parser.parse_args()
+
+    directorio = tempfile.mkdtemp(prefix="bench_arranque_")
+    entorno = dict(os.environ, PYTHONPATH=SRC, METRICAS_LOG="",
+                   REGISTRO_USUARIOS=os.path.join(directorio, "usuarios.json"))
+
+    try:
+        base, base_reloj, base_modulos = medir(["-c", "pass"], args.repeticiones, directorio, entorno)
+        print(f"🐍 Arranque del intérprete: {base * 1000:.0f} ms de importaciones, "
+              f"{base_reloj * 1000:.0f} ms de reloj\n")
+
+        print(f"{'comando':<28} {'importación':>12} {'presupuesto':>12} {'reloj':>9}  resultado")
+        fallos = 0
+        for nombre, argumentos, presupuesto in CASOS:
+            segundos, reloj, modulos = medir(argumentos, args.repeticiones, directorio, entorno)
+            milisegundos = max(segundos - base, 0) * 1000
+            limite = presupuesto * args.escala
+            pesados = sorted(m for m in PESADOS if m in modulos and m not in base_modulos)
+            if pesados:
+                resultado = f"❌ importa {', '.join(pesados)}"
+            elif milisegundos > limite:
+                resultado = "❌ fuera de presupuesto"
+            else:
+                resultado = "✅"
+            fallos += resultado != "✅"
+            print(f"{nombre:<28} {milisegundos:>9.0f} ms {limite:>9.0f} ms {reloj * 1000:>6.0f} ms  {resultado}")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    if fallos:
+        print(f"\n❌ {fallos} comandos incumplen el presupuesto de arranque")
+        sys.exit(1)
+    print("\n✅ Todos los comandos dentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark y validación de las curvas de mejor esfuerzo (curvas.py)
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Sobre un historial sintético de --actividades actividades de --muestras
+segundos, en un directorio temporal:
+
+- valida curva_media_maxima contra pandas (rolling(d).mean().max()) en
+  varias duraciones,
+- mide la curva de una actividad con sumas acumuladas frente a una ventana
+  móvil de pandas por duración,
+- compara lo que cuesta actualizar los récords tras una actividad nueva:
+  recalcular todo el historial, reconstruir las envolventes desde las curvas
+  guardadas o fusionar solo la actividad nueva (actualizar_curvas).
+
+    python benchmarks/bench_curvas.py --actividades 200 --muestras 3600
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import curvas  # noqa: E402
+from datos_sinteticos import generar_streams  # noqa: E402
+from main import streams_a_dataframe  # noqa: E402
+
+DURACIONES_VALIDACION = (1, 5, 30, 60, 300, 1200, 3600)
+
+
+def actividad(i, muestras):
+    return streams_a_dataframe(generar_streams(muestras, semilla=i), datetime(2024, 1, 1, 8) + timedelta(days=3 * i))
+
+
+def curva_pandas(df, metrica, duraciones):
+    """
+    Referencia: una media móvil de pandas por duración sobre la serie de 1 Hz.
+    """
+    serie = pd.Series(curvas.serie_por_segundo(df, metrica))
+    return np.array([serie.rolling(d).mean().max() if d <= len(serie) else np.nan for d in duraciones])
+
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Curvas de mejor esfuerzo: validación y coste de actualización")
+    parser.add_argument("--actividades", type=int, default=200)
+    parser.add_argument("--muestras", type=int, default=3600)
+    args = parser.parse_args()
+
+    df = actividad(0, args.muestras)
+
+    # Validación contra pandas
+    for metrica in curvas.METRICAS:
+        propia = curvas.curvas_actividad(df)[metrica]
+        posiciones = np.searchsorted(curvas.DURACIONES, DURACIONES_VALIDACION)
+        referencia = curva_pandas(df, metrica, DURACIONES_VALIDACION)
+        np.testing.assert_allclose(propia[posiciones], referencia, rtol=1e-6, equal_nan=True)
+    print(f"✅ Curvas iguales a rolling().mean().max() en {len(DURACIONES_VALIDACION)} duraciones")
+
+    # Una actividad: sumas acumuladas frente a pandas
+    _, segundos_pandas = cronometrar(curva_pandas, df, 'watts', curvas.DURACIONES)
+    _, segundos_propia = cronometrar(curvas.curvas_actividad, df, ('watts',))
+    print(f"\n📈 Curva de potencia de una actividad ({args.muestras} s, {len(curvas.DURACIONES)} duraciones)")
+    print(f"   pandas rolling:    {segundos_pandas * 1000:8.1f} ms")
+    print(f"   sumas acumuladas:  {segundos_propia * 1000:8.1f} ms  (x{segundos_pandas / segundos_propia:.0f})")
+
+    directorio = tempfile.mkdtemp(prefix="bench_curvas_")
+    try:
+        historial = [actividad(i, args.muestras) for i in range(args.actividades)]
+        for i, d in enumerate(historial):
+            curvas.guardar_curvas(curvas.curvas_actividad(d), "Alba", i, "Cycling", d['timestamp_real'].iloc[0],
+                                  directorio)
+        curvas.reconstruir_envolventes("Alba", directorio)
+        nueva = actividad(args.actividades, args.muestras)
+
+        def recalcular_todo():
+            for d in historial + [nueva]:
+                curvas.curvas_actividad(d)
+
+        _, recalcular = cronometrar(recalcular_todo)
+        _, reconstruir = cronometrar(curvas.reconstruir_envolventes, "Alba", directorio)
+        _, curva_nueva = cronometrar(curvas.curvas_actividad, nueva)
+        mejoras, incremental = cronometrar(curvas.actualizar_curvas, nueva, "Alba", args.actividades, "Cycling",
+                                           directorio)
+
+        print(f"\n🏆 Récords tras una actividad nueva ({args.actividades} en el historial)")
+        print(f"   recalcular el historial:             {recalcular * 1000:10.1f} ms")
+        print(f"   reconstruir desde curvas guardadas:  {reconstruir * 1000:10.1f} ms")
+        print(f"   actualizar_curvas (incremental):     {incremental * 1000:10.1f} ms"
+              f"  (de ellos {curva_nueva * 1000:.1f} ms de la curva)")
+        print(f"   duraciones mejoradas: {sum(mejoras.values())}")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Benchmark del esquema de tags de InfluxDB: clásico frente a compacto
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Con cada esquema (esquema_influx) sube --actividades actividades sintéticas
+de --muestras segundos, repartidas entre --usuarios usuarios, con
+main.subir_a_influxdb. La actividad N empieza N días después del 1 de enero
+de 2025. Mide:
+
+- escritura: puntos/s, bytes de line protocol y de gzip por punto, y series
+  distintas en la tabla del deporte y en total;
+- consultas de consultar_influxdb, con la caché vacía: una actividad,
+  50 actividades con IN, 1000 filas de un usuario y una semana de un
+  usuario por resolución. Se da la latencia mediana de --repeticiones y los
+  viajes a InfluxDB.
+
+    python benchmarks/bench_esquema.py --actividades 100 --usuarios 4 --latencia 0.002
+
+Antes de medir, con cada esquema y contra ServidorInfluxFalso guardando los
+puntos, sube dos actividades del mismo usuario en la misma hora, recorta la
+primera y vuelve a subirla (con el borrado de sus puntos obsoletos). Las dos
+deben leerse completas en la tabla del deporte, sus agregados y el Resumen;
+si no, el código de salida es 1.
+
+Sin --host se usa ServidorInfluxFalso. Las series y los bytes son los del
+line protocol real, pero el servidor falso no ejecuta las consultas. Solo
+mide el lado del cliente: transferencia, decodificación y viajes de ida y
+vuelta (el esquema compacto hace uno más para leer el rango en el Resumen).
+Para medir el motor de consultas, apunta a un InfluxDB 3 con --host,
+--token, --org y dos bases de datos vacías: --database-clasico y
+--database-compacto.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, SRC)
+
+import cache_consultas  # noqa: E402
+from datos_sinteticos import generar_streams  # noqa: E402
+from agregados import RESOLUCIONES, measurement_agregado  # noqa: E402
+from huellas import leer_huella  # noqa: E402
+from main import (  # noqa: E402
+    actualizar_huella,
+    preparar_dataframe_para_influx,
+    streams_a_dataframe,
+    subir_a_influxdb,
+)
+from resumen_actividad import MEASUREMENT_RESUMEN  # noqa: E402
+from servidores_falsos import ServidorInfluxFalso  # noqa: E402
+
+ESQUEMAS = ["clasico", "compacto"]
+INICIO = datetime(2025, 1, 1, 8)
+
+
+def actividades(n, muestras, usuarios):
+    """
+    Genera (usuario, id, DataFrame preparado) de las n actividades de Run.
+    """
+    for i in range(n):
+        usuario = f"Atleta{i % usuarios}"
+        df = streams_a_dataframe(generar_streams(muestras, semilla=i), INICIO + timedelta(days=i))
+        yield usuario, str(i), df
+
+
+def medir_escritura(config, args):
+    """
+    Sube el historial con el esquema de INFLUX_ESQUEMA. Devuelve los segundos
+    de subida (sin contar la generación de los datos).
+    """
+    segundos = 0.0
+    for usuario, id_actividad, df in actividades(args.actividades, args.muestras, args.usuarios):
+        datos = preparar_dataframe_para_influx(df, usuario, id_actividad, "Run")
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            correcto = subir_a_influxdb(datos, "Run", config['host'], config['token'], config['org'],
+                                        config['database'])
+        segundos += time.perf_counter() - inicio
+        if not correcto:
+            raise RuntimeError(f"No se pudo subir la actividad {id_actividad}")
+    return segundos
+
+
+def comprobar_misma_hora(esquema):
+    """
+    Sube dos actividades de 20 min del mismo usuario en la misma hora,
+    recorta 1 min por cada extremo de la primera y la vuelve a subir. Lee
+    los puntos que quedan en el servidor falso y devuelve la lista de
+    errores (vacía si las dos actividades están completas).
+    """
+    muestras, recorte = 1200, 60
+    inicio = datetime(2025, 3, 1, 10)
+    actividades = {"900001": inicio, "900002": inicio + timedelta(minutes=30)}
+    esperadas = {"900001": muestras - 2 * recorte, "900002": muestras}
+
+    os.environ["INFLUX_ESQUEMA"] = esquema
+    shutil.rmtree("data/huellas", ignore_errors=True)
+    with ServidorInfluxFalso(guardar_puntos=True) as servidor:
+        config = {'host': servidor.url, 'token': "token-falso", 'org': "org", 'database': "comprobacion"}
+
+        def subir(id_actividad, df):
+            datos = preparar_dataframe_para_influx(df, "Atleta0", id_actividad, "Run")
+            with contextlib.redirect_stdout(io.StringIO()):
+                subir_a_influxdb(datos, "Run", config['host'], config['token'], config['org'], config['database'])
+                actualizar_huella(df, "Atleta0", id_actividad, "Run", id_actividad,
+                                  anterior=leer_huella("Atleta0", id_actividad), config_influx=config)
+
+        for semilla, (id_actividad, comienzo) in enumerate(actividades.items()):
+            subir(id_actividad, streams_a_dataframe(generar_streams(muestras, semilla=semilla), comienzo))
+        recortada = streams_a_dataframe(generar_streams(muestras, semilla=0), inicio).iloc[recorte:-recorte]
+        subir("900001", recortada.reset_index(drop=True))
+
+        errores = []
+        measurements = ["Run"] + [measurement_agregado("Run", resolucion) for resolucion in RESOLUCIONES]
+        for measurement in measurements:
+            leidas = {}
+            for punto in servidor.leer_puntos(measurement):
+                leidas[punto['id_actividad']] = leidas.get(punto['id_actividad'], 0) + punto.get('muestras', 1)
+            if leidas != esperadas:
+                errores.append(f"{measurement}: muestras por actividad {leidas}, se esperaban {esperadas}")
+        resumen = {punto['id_actividad']: punto['muestras'] for punto in servidor.leer_puntos(MEASUREMENT_RESUMEN)}
+        if resumen != esperadas:
+            errores.append(f"{MEASUREMENT_RESUMEN}: {resumen}, se esperaba {esperadas}")
+    return errores
+
+
+def consultas(args):
+    """
+    Consultas a comparar: nombre -> función(client, database).
+    """
+    from consultar_influxdb import (
+        consultar_actividades,
+        consultar_por_actividad,
+        consultar_por_resolucion,
+        consultar_por_usuario,
+    )
+
+    id_actividad = str(args.actividades // 2)
+    ids = [str(i) for i in range(0, args.actividades, max(1, args.actividades // 50))][:50]
+    semana = (INICIO.isoformat(), (INICIO + timedelta(days=7)).isoformat())
+    return {
+        "una actividad": lambda c, db: consultar_por_actividad(c, "Run", id_actividad, db),
+        f"{len(ids)} actividades (IN)": lambda c, db: consultar_actividades(c, "Run", db, ids),
+        "usuario, 1000 filas": lambda c, db: consultar_por_usuario(c, "Run", "Atleta0", db, 1000),
+        "usuario, 1 semana": lambda c, db: consultar_por_resolucion(c, "Run", db, *semana,
+                                                                     filtros={'usuario': "Atleta0"}),
+    }
+
+
+def medir_consultas(client, database, args, servidor=None):
+    """
+    Devuelve nombre -> (mediana en segundos, viajes a InfluxDB o None).
+    """
+    resultados = {}
+    for nombre, funcion in consultas(args).items():
+        tiempos, viajes = [], None
+        for _ in range(args.repeticiones):
+            shutil.rmtree(cache_consultas.RUTA_CACHE, ignore_errors=True)
+            antes = servidor.estadisticas()['consultas'] if servidor else 0
+            inicio = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                funcion(client, database)
+            tiempos.append(time.perf_counter() - inicio)
+            if servidor:
+                viajes = servidor.estadisticas()['consultas'] - antes
+        resultados[nombre] = (statistics.median(tiempos), viajes)
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Esquema de tags clásico frente a compacto")
+    parser.add_argument("--actividades", type=int, default=100)
+    parser.add_argument("--muestras", type=int, default=3600)
+    parser.add_argument("--usuarios", type=int, default=4)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos añadidos por petición (falso)")
+    parser.add_argument("--host", help="InfluxDB 3 real en lugar del servidor falso")
+    parser.add_argument("--token", default="token-falso")
+    parser.add_argument("--org", default="org")
+    parser.add_argument("--database-clasico", default="strava_clasico")
+    parser.add_argument("--database-compacto", default="strava_compacto")
+    args = parser.parse_args()
+
+    from influxdb_client_3 import InfluxDBClient3
+
+    # Spool, caché y métricas en un directorio temporal
+    directorio = tempfile.mkdtemp(prefix="bench_esquema_")
+    anterior = os.getcwd()
+    os.chdir(directorio)
+    servidor = None
+    try:
+        fallos = 0
+        print("🧪 Dos actividades del mismo usuario en la misma hora, la primera recortada")
+        for esquema in ESQUEMAS:
+            errores = comprobar_misma_hora(esquema)
+            fallos += len(errores)
+            print(f"   {'❌' if errores else '✅'} {esquema}")
+            for error in errores:
+                print(f"      {error}")
+        if fallos:
+            return 1
+
+        servidor = None if args.host else ServidorInfluxFalso(latencia=args.latencia).iniciar()
+        escritura, lecturas = {}, {}
+        for esquema in ESQUEMAS:
+            os.environ["INFLUX_ESQUEMA"] = esquema
+            database = getattr(args, f"database_{esquema}")
+            config = {'host': args.host or servidor.url, 'token': args.token, 'org': args.org, 'database': database}
+            if servidor:
+                servidor.reiniciar_contadores()
+            segundos = medir_escritura(config, args)
+            escritura[esquema] = (segundos, servidor.estadisticas() if servidor else None)
+
+            extra = {} if args.host else {'query_port_overwrite': servidor.puerto_flight}
+            client = InfluxDBClient3(host=config['host'], token=args.token, org=args.org, database=database, **extra)
+            lecturas[esquema] = medir_consultas(client, database, args, servidor)
+            client.close()
+    finally:
+        os.environ.pop("INFLUX_ESQUEMA", None)
+        if servidor:
+            servidor.detener()
+        os.chdir(anterior)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    puntos_actividad = args.muestras
+    print(f"\n✍️  Escritura: {args.actividades} actividades de {args.muestras} s, {args.usuarios} usuarios")
+    print(f"{'esquema':<10} {'puntos/s':>10} {'LP/punto':>9} {'gzip/punto':>11} {'series Run':>11} {'series':>8}")
+    for esquema, (segundos, stats) in escritura.items():
+        puntos = stats['lineas'] if stats else args.actividades * puntos_actividad
+        fila = f"{esquema:<10} {puntos / segundos:>10,.0f}"
+        if stats:
+            series = stats['series']
+            fila += (f" {stats['bytes_line_protocol'] / puntos:>8.1f}B {stats['bytes_recibidos'] / puntos:>10.2f}B"
+                     f" {series.get('Run', 0):>11} {sum(series.values()):>8}")
+        print(fila)
+
+    fuente = args.host or "servidor falso: solo coste del cliente"
+    print(f"\n🔎 Consultas, caché vacía, mediana de {args.repeticiones} ({fuente})")
+    print(f"{'consulta':<24}" + "".join(f" {esquema:>20}" for esquema in ESQUEMAS))
+    for nombre in lecturas[ESQUEMAS[0]]:
+        celdas = []
+        for esquema in ESQUEMAS:
+            segundos, viajes = lecturas[esquema][nombre]
+            celdas.append(f"{segundos * 1000:.1f} ms" + (f" / {viajes} viajes" if viajes is not None else ""))
+        print(f"{nombre:<24}" + "".join(f" {celda:>20}" for celda in celdas))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Benchmark de la importación del archivo de CSV (importar_csv.py)
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+En un directorio temporal genera --archivos CSV sintéticos de --muestras
+segundos con guardar_csv. La mitad lleva también su _modificado.csv de
+preparar_csv_para_influx; el resto se resuelve con un manifiesto. Después,
+contra ServidorInfluxFalso:
+
+- compara la lectura de un CSV con pandas.read_csv (la de
+  subir_a_influxdb) y con pyarrow.csv (la de importar_csv.leer_csv),
+- mide la subida que hacía main.py, actividad a actividad en un proceso,
+  frente a importar_csv.importar con --procesos procesos,
+- repite la importación para comprobar que se reanuda sin subir nada.
+
+    python benchmarks/bench_importacion.py --archivos 100 --procesos 4 --objetivo 2000000
+
+El código de salida es 1 si la importación no llega a --objetivo puntos
+por minuto.
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import importar_csv  # noqa: E402
+from datos_sinteticos import generar_streams  # noqa: E402
+from main import guardar_csv, preparar_csv_para_influx, streams_a_dataframe, subir_a_influxdb  # noqa: E402
+from servidores_falsos import ServidorInfluxFalso  # noqa: E402
+
+
+def generar_archivo(n, muestras):
+    """
+    Crea los CSV en data/ y un manifiesto para los que no tienen _modificado.
+    Devuelve la ruta del manifiesto.
+    """
+    ruta_manifiesto = "manifiesto.csv"
+    with contextlib.redirect_stdout(io.StringIO()), open(ruta_manifiesto, "w", newline="") as f:
+        manifiesto = csv.writer(f)
+        manifiesto.writerow(['id_actividad', 'usuario', 'tipo_actividad'])
+        for i in range(n):
+            df = streams_a_dataframe(generar_streams(muestras, semilla=i), datetime(2024, 1, 1, 8) + timedelta(days=i))
+            ruta = guardar_csv(df, 1000 + i)
+            if i % 2:
+                preparar_csv_para_influx(ruta, "Alba", 1000 + i, "Run")
+            else:
+                manifiesto.writerow([1000 + i, "Alonso", "Ride"])
+    return ruta_manifiesto
+
+
+def cronometrar(funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultado = funcion(*args, **kwargs)
+    return resultado, time.perf_counter() - inicio
+
+
+def secuencial(config, archivos):
+    """
+    Lo que hace main.py por cada actividad: subir_a_influxdb del
+    _modificado.csv (leído con pandas.read_csv), una detrás de otra.
+    """
+    for ruta in archivos:
+        subir_a_influxdb(ruta, "Run", config['host'], config['token'], config['org'], config['database'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Importación masiva del archivo de CSV")
+    parser.add_argument("--archivos", type=int, default=40)
+    parser.add_argument("--muestras", type=int, default=3600)
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--objetivo", type=float, default=1_000_000, help="puntos por minuto exigidos")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    directorio = tempfile.mkdtemp(prefix="bench_importacion_")
+    anterior = os.getcwd()
+    os.chdir(directorio)
+    try:
+        ruta_manifiesto = generar_archivo(args.archivos, args.muestras)
+        archivos = importar_csv.descubrir_archivo("data/")
+        modificados = sorted(e['modificado'] for e in archivos.values() if e['modificado'])
+
+        print(f"📄 Lectura de un CSV de {args.muestras} filas")
+        _, con_pandas = cronometrar(pd.read_csv, modificados[0], parse_dates=['timestamp_real'],
+                                    dtype={'id_actividad': str})
+        _, con_pyarrow = cronometrar(importar_csv.leer_csv, modificados[0])
+        print(f"   pandas.read_csv:  {con_pandas * 1000:8.1f} ms")
+        print(f"   pyarrow.csv:      {con_pyarrow * 1000:8.1f} ms  (x{con_pandas / con_pyarrow:.1f})")
+
+        with ServidorInfluxFalso() as servidor:
+            config = {'host': servidor.url, 'token': "token-falso", 'org': "org", 'database': "strava"}
+
+            _, segundos = cronometrar(secuencial, config, modificados)
+            puntos = len(modificados) * args.muestras
+            print(f"\n🐢 main.py actividad a actividad ({len(modificados)} _modificado.csv)")
+            print(f"   {puntos:,} puntos en {segundos:.1f} s ({puntos / segundos * 60:,.0f} puntos/min)")
+
+            servidor.reiniciar_contadores()
+            resumen, segundos = cronometrar(importar_csv.importar, config, "data/", args.procesos, ruta_manifiesto)
+            ritmo = resumen['puntos'] / resumen['segundos'] * 60 if resumen['segundos'] else 0
+            print(f"\n🚀 importar_csv con {args.procesos} procesos ({resumen['importados']} actividades)")
+            print(f"   {resumen['puntos']:,} puntos en {resumen['segundos']:.1f} s ({ritmo:,.0f} puntos/min), "
+                  f"{servidor.estadisticas()['peticiones']} peticiones a InfluxDB")
+            print(f"   más {segundos - resumen['segundos']:.2f} s de descubrimiento y manifiesto")
+
+            repeticion, _ = cronometrar(importar_csv.importar, config, "data/", args.procesos, ruta_manifiesto)
+            print(f"\n🔁 Repetición: {repeticion['importados']} importadas, "
+                  f"{repeticion['ya_importados']} ya importadas")
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    completo = resumen['importados'] == args.archivos and not resumen['fallidos'] and repeticion['importados'] == 0
+    if not completo:
+        print("\n❌ La importación no subió todas las actividades o no se reanudó correctamente")
+        return 1
+    if ritmo < args.objetivo:
+        print(f"\n❌ {ritmo:,.0f} puntos/min no llega al objetivo de {args.objetivo:,.0f}")
+        return 1
+    print(f"\n✅ {ritmo:,.0f} puntos/min (objetivo {args.objetivo:,.0f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Benchmark del pico de memoria al leer los streams de una actividad grande
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Compara, sobre una respuesta sintética de Strava guardada en disco:
+
+- json:      cuerpo completo en memoria + json.loads (lo que hace
+             response.json()) + streams_a_dataframe
+- streaming: streams_json.leer_streams por fragmentos de 64 KB +
+             streams_a_dataframe
+
+El pico se mide con tracemalloc (NumPy y pandas registran sus buffers), así
+que incluye el cuerpo de la respuesta, los objetos intermedios y el
+DataFrame final:
+
+    python benchmarks/bench_memoria.py --muestras 100000,500000
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from datos_sinteticos import generar_streams  # noqa: E402
+from main import DTYPES_STREAMS, streams_a_dataframe  # noqa: E402
+from streams_json import TAMANO_FRAGMENTO, leer_streams  # noqa: E402
+
+START_DATE = datetime(2025, 12, 24, 8, 0, 0)
+
+
+def con_json(ruta):
+    with open(ruta, "rb") as f:
+        cuerpo = f.read()
+    return streams_a_dataframe(json.loads(cuerpo.decode("utf-8")), START_DATE)
+
+
+def con_streaming(ruta):
+    with open(ruta, "rb") as f:
+        fragmentos = iter(lambda: f.read(TAMANO_FRAGMENTO), b"")
+        return streams_a_dataframe(leer_streams(fragmentos, DTYPES_STREAMS), START_DATE)
+
+
+def medir_memoria(funcion, ruta):
+    """
+    Devuelve (DataFrame, segundos, pico de memoria en bytes). El tiempo se
+    mide en una ejecución aparte: tracemalloc ralentiza mucho más al parser
+    JSON (un objeto por muestra) que a la lectura incremental.
+    """
+    gc.collect()
+    inicio = time.perf_counter()
+    funcion(ruta)
+    segundos = time.perf_counter() - inicio
+
+    gc.collect()
+    tracemalloc.start()
+    df = funcion(ruta)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return df, segundos, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pico de memoria: response.json() frente a lectura incremental")
+    parser.add_argument("--muestras", default="100000,500000", help="tamaños de actividad, separados por comas")
+    args = parser.parse_args()
+
+    print(f"{'muestras':>9} {'JSON (MB)':>10} {'implementación':<15} {'pico (MB)':>10} {'x JSON':>7} {'tiempo':>9}")
+    for n in [int(t) for t in args.muestras.split(",")]:
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            f.write(json.dumps(generar_streams(n), separators=(",", ":")).encode("utf-8"))
+            ruta = f.name
+        try:
+            tamano = os.path.getsize(ruta)
+            resultados = {}
+            for nombre, funcion in (("json", con_json), ("streaming", con_streaming)):
+                df, segundos, pico = medir_memoria(funcion, ruta)
+                resultados[nombre] = df
+                print(f"{n:>9} {tamano / 1e6:>10.1f} {nombre:<15} {pico / 1e6:>10.1f} "
+                      f"{pico / tamano:>7.2f} {segundos * 1000:>7.0f} ms")
+                del df
+            # Ambas lecturas deben dar el mismo DataFrame
+            pd.testing.assert_frame_equal(resultados['json'], resultados['streaming'])
+        finally:
+            os.remove(ruta)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Benchmark offline del pipeline completo Strava → InfluxDB
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Arranca servidores_falsos.py en un proceso aparte (Strava e InfluxDB
+simulados) y mide por separado cada etapa del pipeline con el código de src/:
+
+- descarga:       GET de streams + decodificación JSON (peticion_get)
+- transformacion: streams_a_dataframe + preparar_dataframe_para_influx
+- escritura:      subir_a_influxdb (line protocol + HTTP)
+- consulta:       funciones de consultar_influxdb con la caché fría y caliente
+- ids_*:          50 actividades con 50 consultas o con una sola (IN)
+- backfill:       listar_actividades + cargar_actividades de extremo a extremo
+- backfill_async: el mismo backfill con el pipeline asíncrono (pipeline_async)
+- resync:         el backfill repetido sin --forzar: las actividades no han
+                  cambiado (huellas.py) y no se descargan ni se reescriben
+
+    python benchmarks/bench_pipeline.py --tamanos 1,10,100,1000 --latencia-strava 0.05
+    python benchmarks/bench_pipeline.py --comparar benchmarks/resultados/anterior.json
+
+El informe se guarda en JSON (--salida) y, con --comparar, se marcan las
+etapas que empeoran más de --umbral respecto a un informe anterior.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(DIRECTORIO, "..", "src"))
+
+import requests  # noqa: E402
+
+CONFIG_INFLUX = {'token': "token-falso", 'org': "benchmark", 'database': "benchmark"}
+
+
+def arrancar_servidores(args, actividades):
+    """
+    Lanza servidores_falsos.py y devuelve (proceso, direcciones).
+    """
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(DIRECTORIO, "servidores_falsos.py"),
+         "--actividades", str(actividades),
+         "--muestras", str(args.muestras),
+         "--latencia-strava", str(args.latencia_strava),
+         "--latencia-influx", str(args.latencia_influx),
+         "--filas-consulta", str(args.filas_consulta)],
+        stdout=subprocess.PIPE, text=True
+    )
+    direcciones = json.loads(proceso.stdout.readline())
+    return proceso, direcciones
+
+
+def estadisticas_servidor(url, reiniciar=False):
+    if reiniciar:
+        return requests.post(f"{url}/_reiniciar", timeout=10).json()
+    return requests.get(f"{url}/_estadisticas", timeout=10).json()
+
+
+def medir(funcion, *args):
+    """
+    Ejecuta `funcion` silenciando sus mensajes y devuelve (resultado, segundos).
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        return resultado, time.perf_counter() - inicio
+
+
+def resultado(etapa, actividades, segundos, muestras=0, **extra):
+    segundos = max(segundos, 1e-9)
+    fila = {
+        'etapa': etapa,
+        'actividades': actividades,
+        'segundos': round(segundos, 4),
+        'actividades_s': round(actividades / segundos, 2),
+        'muestras_s': round(muestras / segundos, 1),
+    }
+    fila.update(extra)
+    print(f"  {etapa:<15} {actividades:>5} act  {segundos * 1000:10.1f} ms  "
+          f"{fila['actividades_s']:10.1f} act/s  {fila['muestras_s']:12.0f} muestras/s")
+    return fila
+
+
+def etapa_descarga(n, hilos, limitador):
+    from cliente_strava import STRAVA_API_URL, peticion_get
+
+    headers = {'Authorization': "Bearer token-falso"}
+
+    def descargar(id_actividad):
+        url = f"{STRAVA_API_URL}/activities/{id_actividad}/streams?key_by_type=true"
+        response = peticion_get(url, headers, limitador=limitador)
+        return response.json(), len(response.content)
+
+    def todas():
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            return list(pool.map(descargar, range(1, n + 1)))
+
+    return medir(todas)
+
+
+def etapa_transformacion(n, payloads, start_date):
+    from main import preparar_dataframe_para_influx, streams_a_dataframe
+
+    def transformar():
+        frames = []
+        for i in range(n):
+            df = streams_a_dataframe(payloads[i % len(payloads)], start_date)
+            frames.append(preparar_dataframe_para_influx(df, "Alba", str(i + 1), "Run"))
+        return frames
+
+    return medir(transformar)
+
+
+def etapa_escritura(n, hilos, frames, host):
+    from main import subir_a_influxdb
+
+    def subir(i):
+        return subir_a_influxdb(frames[i % len(frames)], "Run", host, CONFIG_INFLUX['token'],
+                                CONFIG_INFLUX['org'], CONFIG_INFLUX['database'])
+
+    def todas():
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            return list(pool.map(subir, range(n)))
+
+    return medir(todas)
+
+
+def etapa_consulta(direcciones, ruta_salida):
+    """
+    Ejecuta las consultas del menú dos veces: con la caché vacía y con la
+    caché ya poblada. La exportación en streaming no pasa por la caché.
+    """
+    from influxdb_client_3 import InfluxDBClient3
+
+    import cache_consultas
+    from consultar_influxdb import (
+        consultar_actividades,
+        consultar_datos,
+        consultar_en_streaming,
+        consultar_por_actividad,
+        estadisticas_base_datos,
+        listar_measurements,
+    )
+
+    database = CONFIG_INFLUX['database']
+    client = InfluxDBClient3(host=direcciones['influx_url'], token=CONFIG_INFLUX['token'],
+                             org=CONFIG_INFLUX['org'], database=database,
+                             query_port_overwrite=direcciones['influx_puerto_flight'])
+
+    def menu():
+        estadisticas_base_datos(client, database)
+        listar_measurements(client, database)
+        consultar_datos(client, "Run", database, 1000)
+        consultar_por_actividad(client, "Run", "1", database)
+
+    shutil.rmtree(cache_consultas.RUTA_CACHE, ignore_errors=True)
+    _, fria = medir(menu)
+    _, caliente = medir(menu)
+    (_, filas), exportacion = medir(consultar_en_streaming, client, "Run", database,
+                                    None, None, None, None, 20, ruta_salida)
+
+    # Comparar 50 actividades: una consulta por actividad frente a un único IN
+    ids = [str(i) for i in range(50)]
+    shutil.rmtree(cache_consultas.RUTA_CACHE, ignore_errors=True)
+    _, individual = medir(lambda: [consultar_por_actividad(client, "Run", i, database) for i in ids])
+    shutil.rmtree(cache_consultas.RUTA_CACHE, ignore_errors=True)
+    _, masiva = medir(consultar_actividades, client, "Run", database, ids)
+    client.close()
+    return fria, caliente, exportacion, filas, individual, masiva
+
+
+def etapa_backfill(n, hilos, limitador, host, forzar=True):
+    from carga_masiva import cargar_actividades, listar_actividades
+
+    config_influx = dict(CONFIG_INFLUX, host=host)
+
+    def backfill():
+        actividades = listar_actividades("token-falso", limitador=limitador)[:n]
+        return cargar_actividades(actividades, "Alba", "token-falso", config_influx, hilos, limitador,
+                                  forzar=forzar)
+
+    return medir(backfill)
+
+
+def etapa_backfill_async(n, hilos, limitador, host):
+    import asyncio
+
+    from carga_masiva import listar_actividades
+    from pipeline_async import ejecutar_pipeline
+
+    config_influx = dict(CONFIG_INFLUX, host=host)
+    concurrencia = {'streams': hilos, 'escritura': hilos}
+
+    def backfill():
+        actividades = listar_actividades("token-falso", limitador=limitador)[:n]
+        return asyncio.run(ejecutar_pipeline("Alba", "token-falso", config_influx, actividades=actividades,
+                                             concurrencia=concurrencia, limitador=limitador,
+                                             intervalo_monitor=3600, forzar=True))
+
+    return medir(backfill)
+
+
+def ejecutar(args, direcciones):
+    from cli import precargar
+    from cliente_strava import LimitadorTasa
+
+    # Los módulos pesados se importan con su primer uso (bench_arranque.py
+    # mide ese coste); aquí se cargan antes para que no cuente en una etapa
+    precargar()
+
+    tamanos = [int(t) for t in args.tamanos.split(",")]
+    limitador = LimitadorTasa()
+    start_date = datetime(2025, 1, 1, 8)
+    filas = []
+
+    # Payloads y DataFrames de referencia (uno por variante del servidor)
+    descargados, _ = etapa_descarga(4, 1, limitador)
+    payloads = [payload for payload, _ in descargados]
+    frames, _ = etapa_transformacion(4, payloads, start_date)
+
+    for n in tamanos:
+        print(f"\n▶ {n} actividades")
+        estadisticas_servidor(direcciones['strava_url'], reiniciar=True)
+        descargados, segundos = etapa_descarga(n, args.hilos, limitador)
+        filas.append(resultado("descarga", n, segundos, n * args.muestras,
+                               bytes=sum(b for _, b in descargados)))
+        del descargados
+
+        _, segundos = etapa_transformacion(n, payloads, start_date)
+        filas.append(resultado("transformacion", n, segundos, n * args.muestras))
+
+        estadisticas_servidor(direcciones['influx_url'], reiniciar=True)
+        _, segundos = etapa_escritura(n, args.hilos, frames, direcciones['influx_url'])
+        influx = estadisticas_servidor(direcciones['influx_url'])
+        filas.append(resultado("escritura", n, segundos, n * args.muestras,
+                               bytes=influx['bytes_recibidos'], lineas=influx['lineas'],
+                               peticiones=influx['peticiones']))
+
+        estadisticas_servidor(direcciones['influx_url'], reiniciar=True)
+        resumen, segundos = etapa_backfill(n, args.hilos, limitador, direcciones['influx_url'])
+        strava = estadisticas_servidor(direcciones['strava_url'])
+        filas.append(resultado("backfill", n, segundos, resumen['muestras'],
+                               fallidas=len(resumen['fallidas']),
+                               peticiones_strava=sum(strava['peticiones'].values())))
+
+        resumen, segundos = etapa_backfill_async(n, args.hilos, limitador, direcciones['influx_url'])
+        filas.append(resultado("backfill_async", n, segundos, resumen['muestras'],
+                               fallidas=len(resumen['fallidas']), etapas=resumen['etapas']))
+
+        estadisticas_servidor(direcciones['strava_url'], reiniciar=True)
+        estadisticas_servidor(direcciones['influx_url'], reiniciar=True)
+        resumen, segundos = etapa_backfill(n, args.hilos, limitador, direcciones['influx_url'], forzar=False)
+        strava = estadisticas_servidor(direcciones['strava_url'])
+        influx = estadisticas_servidor(direcciones['influx_url'])
+        filas.append(resultado("resync", n, segundos, resumen['muestras'],
+                               sin_cambios=len(resumen['sin_cambios']),
+                               peticiones_strava=sum(strava['peticiones'].values()),
+                               lineas=influx['lineas']))
+
+    print("\n▶ Consultas")
+    fria, caliente, exportacion, total, individual, masiva = etapa_consulta(
+        direcciones, os.path.join(os.getcwd(), "export.parquet"))
+    filas.append(resultado("consulta_fria", 1, fria))
+    filas.append(resultado("consulta_cache", 1, caliente))
+    filas.append(resultado("exportacion", 1, exportacion, total))
+    filas.append(resultado("ids_individual", 50, individual))
+    filas.append(resultado("ids_en_bloque", 50, masiva))
+    return filas
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIRECTORIO,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(filas, ruta_anterior, umbral):
+    """
+    Compara los tiempos con un informe anterior y marca las regresiones.
+    Devuelve el número de etapas que empeoran más de `umbral` (fracción).
+    """
+    with open(ruta_anterior, encoding="utf-8") as f:
+        anteriores = {(r['etapa'], r['actividades']): r for r in json.load(f)['resultados']}
+
+    print("\n" + "="*60)
+    print(f"   COMPARACIÓN CON {ruta_anterior}")
+    print("="*60)
+    regresiones = 0
+    for fila in filas:
+        anterior = anteriores.get((fila['etapa'], fila['actividades']))
+        if anterior is None:
+            continue
+        cambio = fila['segundos'] / max(anterior['segundos'], 1e-9) - 1
+        marca = "⚠️ " if cambio > umbral else "✅"
+        regresiones += cambio > umbral
+        print(f"{marca} {fila['etapa']:<15} {fila['actividades']:>5} act  {cambio:+7.1%}")
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline del pipeline Strava → InfluxDB")
+    parser.add_argument("--tamanos", default="1,10,100", help="número de actividades por ronda, separados por comas")
+    parser.add_argument("--muestras", type=int, default=3600, help="muestras por actividad")
+    parser.add_argument("--hilos", type=int, default=4)
+    parser.add_argument("--latencia-strava", type=float, default=0.0, help="segundos añadidos por petición")
+    parser.add_argument("--latencia-influx", type=float, default=0.0, help="segundos añadidos por petición")
+    parser.add_argument("--filas-consulta", type=int, default=50_000)
+    parser.add_argument("--salida", default=os.path.join(DIRECTORIO, "resultados", "pipeline.json"))
+    parser.add_argument("--comparar", help="informe JSON anterior con el que comparar")
+    parser.add_argument("--umbral", type=float, default=0.10, help="empeoramiento tolerado (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    maximo = max(int(t) for t in args.tamanos.split(","))
+    proceso, direcciones = arrancar_servidores(args, max(maximo, 4))
+    os.environ['STRAVA_API_URL'] = direcciones['strava_api_url']
+    os.environ['STRAVA_AUTH_URL'] = direcciones['strava_auth_url']
+
+    # Directorio de trabajo temporal: almacén local, caché y tokens no tocan data/
+    salida = os.path.abspath(args.salida)
+    directorio_original = os.getcwd()
+    temporal = tempfile.mkdtemp(prefix="bench_pipeline_")
+    os.chdir(temporal)
+    try:
+        filas = ejecutar(args, direcciones)
+    finally:
+        os.chdir(directorio_original)
+        shutil.rmtree(temporal, ignore_errors=True)
+        proceso.terminate()
+        proceso.wait()
+
+    informe = {
+        'fecha': datetime.now().isoformat(timespec="seconds"),
+        'commit': commit_actual(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': vars(args),
+        'resultados': filas,
+    }
+    os.makedirs(os.path.dirname(salida), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Informe guardado en {salida}")
+
+    if args.comparar and comparar(filas, args.comparar, args.umbral):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
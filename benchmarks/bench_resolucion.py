@@ -0,0 +1,80 @@
+"""
+Benchmark de la descarga de streams por resolución
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Descarga la misma actividad sintética del servidor falso de Strava con cada
+resolución de la API (low, medium, high y completa) usando
+main.descargar_streams, y muestra los bytes de la respuesta, la latencia
+(mediana de --repeticiones) y las muestras recibidas:
+
+    python benchmarks/bench_resolucion.py --muestras 3600,20000 --latencia 0.05
+
+La latencia añadida por el servidor es fija por petición, así que las
+diferencias entre resoluciones salen del tamaño de la respuesta y de su
+lectura. Con --ancho-banda (Mbit/s) se estima además el tiempo de
+transferencia en una conexión real.
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from servidores_falsos import ServidorStravaFalso  # noqa: E402
+
+RESOLUCIONES = ["low", "medium", "high", None]
+
+
+def medir_resolucion(descargar_streams, resolucion, series_type, repeticiones):
+    """
+    Devuelve (mediana de segundos, muestras recibidas) de `repeticiones`
+    descargas de la actividad 1 con `resolucion`. La primera descarga no
+    cuenta: abre la conexión y hace que el servidor prepare la respuesta.
+    """
+    tiempos = []
+    for i in range(repeticiones + 1):
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            streams = descargar_streams(1, "token-falso", resolucion=resolucion, series_type=series_type)
+        if i:
+            tiempos.append(time.perf_counter() - inicio)
+    return statistics.median(tiempos), len(streams['time']['data'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes y latencia de los streams de Strava por resolución")
+    parser.add_argument("--muestras", default="3600,20000", help="tamaños de actividad, separados por comas")
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos añadidos por petición")
+    parser.add_argument("--series-type", default="distance", choices=["distance", "time"])
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--ancho-banda", type=float, default=20.0, help="Mbit/s para estimar la transferencia")
+    args = parser.parse_args()
+
+    print(f"{'muestras':>9} {'resolución':<11} {'recibidas':>10} {'bytes':>11} {'x completa':>10} "
+          f"{'latencia':>10} {'a ' + str(args.ancho_banda) + ' Mbit/s':>14}")
+    for n in [int(t) for t in args.muestras.split(",")]:
+        with ServidorStravaFalso(actividades=1, muestras=n, latencia=args.latencia, variantes=1) as servidor:
+            import main as modulo_main
+            modulo_main.STRAVA_API_URL = servidor.api_url
+
+            filas = []
+            for resolucion in RESOLUCIONES:
+                segundos, recibidas = medir_resolucion(modulo_main.descargar_streams, resolucion,
+                                                       args.series_type, args.repeticiones)
+                num_bytes = len(servidor.streams(1, resolucion, args.series_type))
+                filas.append((resolucion, segundos, num_bytes, recibidas))
+        completa = filas[-1][2]
+        for resolucion, segundos, num_bytes, recibidas in filas:
+            transferencia = num_bytes * 8 / (args.ancho_banda * 1e6)
+            print(f"{n:>9} {resolucion or 'completa':<11} {recibidas:>10} {num_bytes:>11} "
+                  f"{num_bytes / completa:>9.1%} {segundos * 1000:>7.1f} ms {transferencia * 1000:>11.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark de la conversión streams → DataFrame
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Compara la implementación original (listas de Python + apply fila a fila)
+con la vectorizada de main.streams_a_dataframe sobre una actividad sintética:
+
+    python benchmarks/bench_streams.py --muestras 50000
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from datos_sinteticos import generar_streams  # noqa: E402
+from main import streams_a_dataframe  # noqa: E402
+
+
+def streams_a_dataframe_original(streams, start_date):
+    """
+    Implementación anterior de descargar_datos_actividad, como referencia.
+    """
+    data_dict = {}
+    for key, value in streams.items():
+        if key == 'latlng':
+            data_dict['latitude'] = [x[0] for x in value['data']]
+            data_dict['longitude'] = [x[1] for x in value['data']]
+        else:
+            data_dict[key] = value['data']
+    df = pd.DataFrame(data_dict)
+    df['timestamp_real'] = df['time'].apply(lambda x: start_date + timedelta(seconds=x))
+    cols = ['timestamp_real', 'time'] + [c for c in df.columns if c not in ['timestamp_real', 'time']]
+    return df[cols]
+
+
+def medir(funcion, streams, start_date, repeticiones):
+    """
+    Devuelve el mejor tiempo (s) de `repeticiones` ejecuciones y el último resultado.
+    """
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        df = funcion(streams, start_date)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streams → DataFrame")
+    parser.add_argument("--muestras", type=int, default=50_000)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    streams = generar_streams(args.muestras)
+    start_date = datetime(2025, 12, 24, 8, 0, 0)
+
+    t_original, df_original = medir(streams_a_dataframe_original, streams, start_date, args.repeticiones)
+    t_nuevo, df_nuevo = medir(streams_a_dataframe, streams, start_date, args.repeticiones)
+
+    mem_original = df_original.memory_usage(deep=True).sum()
+    mem_nuevo = df_nuevo.memory_usage(deep=True).sum()
+
+    # Comprobar que ambos resultados son equivalentes
+    pd.testing.assert_frame_equal(df_original, df_nuevo, check_dtype=False, atol=1e-5)
+
+    print(f"Muestras: {args.muestras}")
+    print(f"Original:    {t_original * 1000:8.1f} ms   {mem_original / 1e6:6.2f} MB")
+    print(f"Vectorizado: {t_nuevo * 1000:8.1f} ms   {mem_nuevo / 1e6:6.2f} MB")
+    print(f"Aceleración: x{t_original / t_nuevo:.1f}   Memoria: -{(1 - mem_nuevo / mem_original) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
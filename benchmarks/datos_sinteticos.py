@@ -0,0 +1,43 @@
+"""
+Generación de actividades sintéticas con el mismo formato que la API de Strava
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+"""
+
+import numpy as np
+
+
+def generar_streams(n_muestras=50_000, semilla=0):
+    """
+    Devuelve un diccionario de streams como el que responde
+    /activities/{id}/streams?key_by_type=true, con `n_muestras` muestras a 1 Hz.
+    """
+    rng = np.random.default_rng(semilla)
+    time = np.arange(n_muestras)
+    velocidad = np.clip(3.0 + np.cumsum(rng.normal(0, 0.02, n_muestras)), 0.5, 8.0)
+    distancia = np.cumsum(velocidad)
+    rumbo = np.cumsum(rng.normal(0, 0.05, n_muestras))
+    lat = 40.4168 + np.cumsum(np.cos(rumbo) * velocidad) / 111_320
+    lng = -3.7038 + np.cumsum(np.sin(rumbo) * velocidad) / 85_000
+    altitud = 650 + np.cumsum(rng.normal(0, 0.1, n_muestras))
+    pulso = np.clip(140 + np.cumsum(rng.normal(0, 0.3, n_muestras)), 90, 195).astype(int)
+    cadencia = rng.integers(80, 95, n_muestras)
+    vatios = rng.integers(150, 350, n_muestras)
+    temp = np.full(n_muestras, 18)
+    pendiente = np.round(rng.normal(0, 3, n_muestras), 1)
+
+    def stream(datos):
+        return {'data': datos, 'series_type': 'distance', 'original_size': n_muestras, 'resolution': 'high'}
+
+    return {
+        'time': stream(time.tolist()),
+        'distance': stream(np.round(distancia, 1).tolist()),
+        'latlng': stream(np.round(np.column_stack([lat, lng]), 6).tolist()),
+        'altitude': stream(np.round(altitud, 1).tolist()),
+        'velocity_smooth': stream(np.round(velocidad, 3).tolist()),
+        'heartrate': stream(pulso.tolist()),
+        'cadence': stream(cadencia.tolist()),
+        'watts': stream(vatios.tolist()),
+        'temp': stream(temp.tolist()),
+        'grade_smooth': stream(pendiente.tolist()),
+    }
@@ -0,0 +1,540 @@
+"""
+Servidores locales que sustituyen a Strava e InfluxDB en los benchmarks
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+- ServidorStravaFalso: OAuth, listado paginado de actividades, detalle y
+  streams sintéticos (datos_sinteticos.generar_streams) con latencia opcional.
+  Los streams admiten `resolution` (low/medium/high) y `series_type` como
+  la API real.
+- ServidorInfluxFalso: endpoint HTTP de escritura que registra el line
+  protocol recibido (puntos, bytes y series distintas por measurement) y
+  servidor Arrow Flight que responde a las consultas con tablas sintéticas.
+  No ejecuta SQL: mide el coste del lado del cliente (transferencia,
+  decodificación Arrow, caché, viajes de ida y vuelta), no el del motor de
+  consultas. Con guardar_puntos=True guarda además los puntos como lo haría
+  InfluxDB (un punto por serie e instante, el último en llegar sobrescribe
+  sus fields) y aplica los borrados, para comprobar qué queda escrito.
+"""
+
+import argparse
+import gzip
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.flight as flight
+
+from datos_sinteticos import generar_streams
+
+# Cabeceras de límite de tasa holgadas para que el LimitadorTasa no pause
+CABECERAS_TASA = {
+    'X-RateLimit-Limit': "100000,1000000",
+    'X-RateLimit-Usage': "0,0",
+}
+
+# Measurement y tags de una línea de line protocol (los espacios escapados no cortan)
+_PATRON_SERIE = re.compile(rb"(?:[^ \\]|\\.)+")
+
+# Separadores de line protocol que no están escapados
+_PATRON_COMA = re.compile(rb"(?<!\\),")
+_PATRON_FIELD = re.compile(rb'((?:[^=,\\]|\\.)+)=("(?:[^"\\]|\\.)*"|[^,]*)')
+_PATRON_PREDICADO = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# Puntos de cada resolución de streams de la API de Strava
+PUNTOS_RESOLUCION = {'low': 100, 'medium': 1000, 'high': 10000}
+
+
+def remuestrear_streams(streams, resolucion, series_type="distance"):
+    """
+    Reduce los streams a los puntos de `resolucion`, equiespaciados a lo
+    largo de `series_type` (como hace Strava). Si la actividad tiene menos
+    puntos se devuelven todos.
+    """
+    eje = np.asarray(streams[series_type]['data'], dtype=float)
+    n = len(eje)
+    puntos = PUNTOS_RESOLUCION[resolucion]
+    if n <= puntos:
+        indices = np.arange(n)
+    else:
+        objetivos = np.linspace(eje[0], eje[-1], puntos)
+        indices = np.unique(np.clip(np.searchsorted(eje, objetivos), 0, n - 1))
+    return {
+        clave: {'data': [valor['data'][i] for i in indices], 'series_type': series_type,
+                'original_size': n, 'resolution': resolucion}
+        for clave, valor in streams.items()
+    }
+
+
+class _Servidor:
+    """
+    Arranca un ThreadingHTTPServer en un puerto libre en segundo plano.
+    """
+
+    def __init__(self, manejador):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), manejador)
+        self.httpd.daemon_threads = True
+        self.httpd.servidor = self
+        self.hilo = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def iniciar(self):
+        self.hilo.start()
+        return self
+
+    def detener(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.detener()
+
+
+def _responder_control(manejador):
+    """
+    Rutas de control: GET /_estadisticas devuelve los contadores del servidor
+    y POST /_reiniciar los pone a cero.
+    """
+    servidor = manejador.server.servidor
+    if manejador.path.startswith("/_reiniciar"):
+        servidor.reiniciar_contadores()
+    cuerpo = json.dumps(servidor.estadisticas()).encode()
+    manejador.send_response(200)
+    manejador.send_header("Content-Type", "application/json")
+    manejador.send_header("Content-Length", str(len(cuerpo)))
+    manejador.end_headers()
+    manejador.wfile.write(cuerpo)
+
+
+class _ManejadorStrava(BaseHTTPRequestHandler):
+    # HTTP/1.1 para que el pool de conexiones del cliente reutilice sockets
+    protocol_version = "HTTP/1.1"
+    # Sin Nagle: las respuestas pequeñas (cabeceras y cuerpo en dos envíos)
+    # no esperan al ACK retardado del cliente (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, cuerpo, estado=200):
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for nombre, valor in CABECERAS_TASA.items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_POST(self):
+        servidor = self.server.servidor
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/_"):
+            _responder_control(self)
+            return
+        servidor.esperar()
+        if self.path.startswith("/oauth/token"):
+            servidor.contar("token")
+            cuerpo = {
+                'access_token': "token-falso",
+                'refresh_token': "refresh-falso",
+                'expires_at': int(time.time()) + 6 * 3600,
+            }
+            self._responder(json.dumps(cuerpo).encode())
+        else:
+            self._responder(b"{}", 404)
+
+    def do_GET(self):
+        servidor = self.server.servidor
+        if self.path.startswith("/_"):
+            _responder_control(self)
+            return
+        servidor.esperar()
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path.endswith("/athlete/activities"):
+            servidor.contar("listado")
+            self._responder(servidor.pagina_actividades(int(params.get('page', 1)),
+                                                        int(params.get('per_page', 30))))
+            return
+
+        coincidencia = re.search(r"/activities/(\d+)(/streams)?$", url.path)
+        if coincidencia is None:
+            self._responder(b"{}", 404)
+        elif coincidencia.group(2):
+            resolucion = params.get('resolution')
+            servidor.contar(f"streams_{resolucion}" if resolucion else "streams")
+            self._responder(servidor.streams(int(coincidencia.group(1)), resolucion,
+                                             params.get('series_type', "distance")))
+        else:
+            servidor.contar("detalle")
+            self._responder(json.dumps(servidor.actividad(int(coincidencia.group(1)))).encode())
+
+
+class ServidorStravaFalso(_Servidor):
+    """
+    API de Strava simulada con `actividades` carreras de `muestras` muestras.
+    `latencia` (segundos) se añade a cada petición.
+    """
+
+    def __init__(self, actividades=10, muestras=3600, latencia=0.0, variantes=4):
+        super().__init__(_ManejadorStrava)
+        self.actividades = actividades
+        self.muestras = muestras
+        self.latencia = latencia
+        self.peticiones = {}
+        self._lock = threading.Lock()
+        # Pocas variantes de streams serializadas una sola vez: el servidor no
+        # debe ser el cuello de botella de la medición
+        self._originales = [generar_streams(muestras, semilla=i) for i in range(variantes)]
+        self._streams = [json.dumps(streams).encode() for streams in self._originales]
+        self._remuestreados = {}
+        self._inicio = datetime(2025, 1, 1, 8, tzinfo=timezone.utc)
+
+    @property
+    def api_url(self):
+        return f"{self.url}/api/v3"
+
+    @property
+    def auth_url(self):
+        return f"{self.url}/oauth/token"
+
+    def esperar(self):
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def contar(self, tipo):
+        with self._lock:
+            self.peticiones[tipo] = self.peticiones.get(tipo, 0) + 1
+
+    def actividad(self, id_actividad):
+        inicio = self._inicio + timedelta(hours=id_actividad)
+        return {
+            'id': id_actividad,
+            'name': f"Actividad sintética {id_actividad}",
+            'sport_type': "Run",
+            'type': "Run",
+            'start_date': inicio.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            'elapsed_time': self.muestras,
+        }
+
+    def pagina_actividades(self, pagina, por_pagina):
+        primero = (pagina - 1) * por_pagina + 1
+        ultimo = min(primero + por_pagina - 1, self.actividades)
+        return json.dumps([self.actividad(i) for i in range(primero, ultimo + 1)]).encode()
+
+    def streams(self, id_actividad, resolucion=None, series_type="distance"):
+        variante = id_actividad % len(self._streams)
+        if resolucion is None:
+            return self._streams[variante]
+        clave = (variante, resolucion, series_type)
+        with self._lock:
+            if clave not in self._remuestreados:
+                streams = remuestrear_streams(self._originales[variante], resolucion, series_type)
+                self._remuestreados[clave] = json.dumps(streams).encode()
+            return self._remuestreados[clave]
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'peticiones': dict(self.peticiones),
+                'bytes_streams': int(np.mean([len(s) for s in self._streams])),
+            }
+
+    def reiniciar_contadores(self):
+        with self._lock:
+            self.peticiones = {}
+
+
+class _ManejadorEscritura(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        _responder_control(self)
+
+    def do_POST(self):
+        servidor = self.server.servidor
+        cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/_"):
+            _responder_control(self)
+            return
+        servidor.esperar()
+        if "/api/v2/delete" in self.path:
+            servidor.registrar_borrado(cuerpo)
+            self.send_response(204)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if "write" not in self.path:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        servidor.registrar(cuerpo, self.headers.get("Content-Encoding") == "gzip")
+        self.send_response(204)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class _ServidorFlight(flight.FlightServerBase):
+    """
+    Responde a los tickets de influxdb_client_3 ({"sql_query", ...}) con
+    tablas sintéticas del tamaño pedido en el LIMIT (o `filas` por defecto).
+    """
+
+    def __init__(self, filas, latencia):
+        super().__init__("grpc+tcp://127.0.0.1:0")
+        self.filas = filas
+        self.latencia = latencia
+        self.consultas = 0
+        self._tabla = self._generar_tabla(filas)
+
+    @staticmethod
+    def _generar_tabla(filas):
+        streams = generar_streams(filas, semilla=0)
+        tiempos = np.datetime64("2025-01-01T08:00:00", "ns") + np.arange(filas).astype("timedelta64[s]")
+        return pa.table({
+            'time': tiempos,
+            'distance': streams['distance']['data'],
+            'heartrate': streams['heartrate']['data'],
+            'velocity_smooth': streams['velocity_smooth']['data'],
+            'id_actividad': pa.array(["1"] * filas),
+            'usuario': pa.array(["Alba"] * filas),
+        })
+
+    @staticmethod
+    def _tabla_resumen(consulta, parametros):
+        """
+        Una fila del Resumen por cada id_actividad pedido: la actividad N
+        empieza N días después del 1 de enero de 2025 y dura una hora.
+        """
+        nombres = re.findall(r'"id_actividad"\s*=\s*\$(\w+)', consulta)
+        nombres += [n for grupo in re.findall(r'"id_actividad"\s+IN\s*\(([^)]*)\)', consulta)
+                    for n in re.findall(r"\$(\w+)", grupo)]
+        ids = [str(parametros[n]) for n in nombres if n in parametros]
+        inicios = [np.datetime64("2025-01-01T08:00:00", "ns") + np.timedelta64(int(i) if i.isdigit() else 0, "D")
+                   for i in ids]
+        return pa.table({
+            'time': pa.array(inicios, pa.timestamp('ns')),
+            'fecha_fin': [str(inicio + np.timedelta64(1, "h")) for inicio in inicios],
+            'id_actividad': ids,
+            'usuario': ["Alba"] * len(ids),
+        })
+
+    def do_get(self, context, ticket):
+        if self.latencia:
+            time.sleep(self.latencia)
+        self.consultas += 1
+        peticion = json.loads(ticket.ticket.decode())
+        consulta = peticion['sql_query']
+        if re.search(r'FROM\s+"?Resumen"?', consulta):
+            tabla = self._tabla_resumen(consulta, peticion.get('params') or {})
+        elif re.search(r"SHOW\s+MEASUREMENTS", consulta, re.IGNORECASE):
+            tabla = pa.table({'iox::measurement': ["measurements"] * 3, 'name': ["Cycling", "Run", "Swimming"]})
+        elif re.search(r"COUNT\(", consulta, re.IGNORECASE):
+            tabla = pa.table({'time': pa.array([0], pa.timestamp('ns')), 'count': [self.filas]})
+        else:
+            limite = re.search(r"LIMIT\s+(\d+)", consulta, re.IGNORECASE)
+            tabla = self._tabla.slice(0, int(limite.group(1))) if limite else self._tabla
+        return flight.RecordBatchStream(tabla)
+
+
+class ServidorInfluxFalso(_Servidor):
+    """
+    InfluxDB simulado: escritura HTTP (line protocol) y borrado
+    (/api/v2/delete) en `url` y consultas Arrow Flight en `puerto_flight`.
+    """
+
+    def __init__(self, filas_consulta=50_000, latencia=0.0, guardar_puntos=False):
+        super().__init__(_ManejadorEscritura)
+        self.latencia = latencia
+        self.guardar_puntos = guardar_puntos
+        self.puntos = {}
+        self.peticiones = 0
+        self.lineas = 0
+        self.bytes_recibidos = 0
+        self.bytes_line_protocol = 0
+        self.measurements = {}
+        self.series = set()
+        self.borrados = []
+        self._lock = threading.Lock()
+        self.flight = _ServidorFlight(filas_consulta, latencia)
+        self._hilo_flight = threading.Thread(target=self.flight.serve, daemon=True)
+
+    @property
+    def puerto_flight(self):
+        return self.flight.port
+
+    def iniciar(self):
+        self._hilo_flight.start()
+        return super().iniciar()
+
+    def detener(self):
+        super().detener()
+        self.flight.shutdown()
+
+    def esperar(self):
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def registrar(self, cuerpo, comprimido):
+        texto = gzip.decompress(cuerpo) if comprimido else cuerpo
+        lineas = texto.count(b"\n") + (not texto.endswith(b"\n"))
+        # Un lote puede mezclar measurements (resumen y agregados de una actividad)
+        por_measurement = {}
+        claves = set()
+        for linea in texto.splitlines():
+            # Clave de la serie: measurement y tags, hasta el primer espacio sin escapar
+            clave = linea.split(b" ", 1)[0]
+            if clave.endswith(b"\\"):
+                clave = _PATRON_SERIE.match(linea).group()
+            measurement = clave.split(b",", 1)[0].decode()
+            por_measurement[measurement] = por_measurement.get(measurement, 0) + 1
+            claves.add(clave)
+        with self._lock:
+            if self.guardar_puntos:
+                self._guardar(texto)
+            self.series.update(claves)
+            self.peticiones += 1
+            self.lineas += lineas
+            self.bytes_recibidos += len(cuerpo)
+            self.bytes_line_protocol += len(texto)
+            for measurement, cuenta in por_measurement.items():
+                self.measurements[measurement] = self.measurements.get(measurement, 0) + cuenta
+
+    def _guardar(self, texto):
+        for linea in texto.splitlines():
+            clave = _PATRON_SERIE.match(linea).group()
+            campos, marca = linea[len(clave) + 1:].rsplit(b" ", 1)
+            measurement, *tags = _PATRON_COMA.split(clave)
+            serie = (measurement.decode(), tuple(sorted(tag.decode() for tag in tags)))
+            punto = self.puntos.setdefault(serie, {}).setdefault(int(marca), {})
+            for nombre, valor in _PATRON_FIELD.findall(campos):
+                punto[nombre.decode()] = _valor_field(valor)
+
+    def registrar_borrado(self, cuerpo):
+        borrado = json.loads(cuerpo)
+        with self._lock:
+            self.borrados.append(borrado)
+            if self.guardar_puntos:
+                self._borrar(borrado)
+
+    def _borrar(self, borrado):
+        condiciones = dict(_PATRON_PREDICADO.findall(borrado['predicate']))
+        measurement = condiciones.pop('_measurement')
+        tags = {f"{tag}={valor}" for tag, valor in condiciones.items()}
+        desde, hasta = _nanosegundos(borrado['start']), _nanosegundos(borrado['stop'])
+        for (nombre, tags_serie), puntos in self.puntos.items():
+            if nombre == measurement and tags <= set(tags_serie):
+                for marca in [marca for marca in puntos if desde <= marca <= hasta]:
+                    del puntos[marca]
+
+    def leer_puntos(self, measurement):
+        """
+        Puntos guardados de `measurement` (con guardar_puntos=True): lista de
+        diccionarios con time (ns), los tags y los fields.
+        """
+        with self._lock:
+            filas = []
+            for (nombre, tags), puntos in self.puntos.items():
+                if nombre != measurement:
+                    continue
+                valores_tags = dict(tag.split("=", 1) for tag in tags)
+                filas += [{'time': marca, **valores_tags, **campos} for marca, campos in puntos.items()]
+            return filas
+
+    def estadisticas(self):
+        with self._lock:
+            series = {}
+            for clave in self.series:
+                measurement = clave.split(b",", 1)[0].decode()
+                series[measurement] = series.get(measurement, 0) + 1
+            return {
+                'peticiones': self.peticiones,
+                'borrados': len(self.borrados),
+                'lineas': self.lineas,
+                'bytes_recibidos': self.bytes_recibidos,
+                'bytes_line_protocol': self.bytes_line_protocol,
+                'measurements': dict(self.measurements),
+                'series': series,
+                'consultas': self.flight.consultas,
+            }
+
+    def reiniciar_contadores(self):
+        with self._lock:
+            self.peticiones = self.lineas = self.bytes_recibidos = self.bytes_line_protocol = 0
+            self.measurements = {}
+            self.series = set()
+            self.borrados = []
+            self.puntos = {}
+            self.flight.consultas = 0
+
+
+def _valor_field(valor):
+    if valor.startswith(b'"'):
+        return valor[1:-1].replace(b'\\"', b'"').replace(b"\\\\", b"\\").decode()
+    if valor.endswith((b"i", b"u")):
+        return int(valor[:-1])
+    if valor in (b"t", b"T", b"true", b"True", b"f", b"F", b"false", b"False"):
+        return valor[:1] in (b"t", b"T")
+    return float(valor)
+
+
+def _nanosegundos(fecha):
+    """
+    Fecha RFC 3339 con nanosegundos de /api/v2/delete -> ns desde la época.
+    """
+    segundos, _, resto = fecha.rstrip("Z").partition(".")
+    inicio = datetime.strptime(segundos, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    return int(inicio.timestamp()) * 1_000_000_000 + int(resto.ljust(9, "0") or 0)
+
+
+def main():
+    """
+    Arranca ambos servidores en este proceso (para que no compitan por el GIL
+    con el código medido) e imprime sus direcciones como una línea JSON.
+    """
+    parser = argparse.ArgumentParser(description="Servidores falsos de Strava e InfluxDB")
+    parser.add_argument("--actividades", type=int, default=10)
+    parser.add_argument("--muestras", type=int, default=3600)
+    parser.add_argument("--latencia-strava", type=float, default=0.0, help="segundos por petición")
+    parser.add_argument("--latencia-influx", type=float, default=0.0, help="segundos por petición")
+    parser.add_argument("--filas-consulta", type=int, default=50_000)
+    args = parser.parse_args()
+
+    strava = ServidorStravaFalso(args.actividades, args.muestras, args.latencia_strava).iniciar()
+    influx = ServidorInfluxFalso(args.filas_consulta, args.latencia_influx).iniciar()
+    print(json.dumps({
+        'strava_api_url': strava.api_url,
+        'strava_auth_url': strava.auth_url,
+        'strava_url': strava.url,
+        'influx_url': influx.url,
+        'influx_puerto_flight': influx.puerto_flight,
+    }), flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        strava.detener()
+        influx.detener()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Agregados (rollups) a 10 s, 1 min y 1 h para paneles de rango largo
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Las tablas Run, Cycling y Swimming guardan los streams a 1 Hz. Un panel de
+Grafana de varios meses tendría que agregar millones de puntos en cada
+refresco, así que al subir cada actividad se escriben también sus agregados
+en los measurements <Tipo>_10s, <Tipo>_1m y <Tipo>_1h, con la media, el
+mínimo y el máximo de pulso, velocidad, potencia, cadencia y altitud por
+intervalo, y el número de muestras.
+
+El cálculo es incremental: cada actividad solo agrega sus propios puntos
+(con los mismos tags que la tabla original, según el esquema de
+esquema_influx), así que ingerir una actividad nueva nunca obliga a
+recalcular las anteriores. Los intervalos están alineados a la época Unix,
+por lo que los de distintas actividades coinciden; para combinar varias en
+un mismo intervalo, la media se pondera con `muestras`.
+
+Con el esquema compacto la serie es la del usuario, no la de la actividad:
+dos actividades en la misma hora escribirían el mismo punto de <Tipo>_1h.
+Por eso el primer intervalo de cada actividad lleva el timestamp de su
+primera muestra en lugar del inicio del intervalo. Así todos los agregados
+quedan dentro del rango de tiempo de su actividad y solo coinciden con los
+de otra si las actividades se solapan. Al agrupar por tiempo siguen cayendo
+en el mismo intervalo.
+
+Para generar los agregados de actividades ingeridas antes de que existiera
+este módulo, a partir del almacén local:
+
+    python src/agregados.py
+    python src/agregados.py --usuarios Alba --tipos Run
+"""
+
+import argparse
+from datetime import datetime, timezone
+
+from esquema_influx import adaptar_dataframe, series_por_actividad, tags_streams
+from metricas import medir
+
+# Nombre del sufijo -> segundos por intervalo, de la más fina a la más gruesa
+RESOLUCIONES = {'10s': 10, '1m': 60, '1h': 3600}
+
+CAMPOS_AGREGADOS = ['heartrate', 'velocity_smooth', 'watts', 'cadence', 'altitude']
+ESTADISTICOS = ['media', 'min', 'max']
+
+# Puntos por serie que se piden como máximo a InfluxDB (≈ ancho de un panel)
+PUNTOS_MAXIMOS = 2000
+
+
+def measurement_agregado(tipo_actividad, resolucion):
+    """
+    Nombre del measurement con los agregados de un tipo a una resolución ('10s', '1m', '1h').
+    """
+    return f"{tipo_actividad}_{resolucion}"
+
+
+def columnas_agregadas(campos=None):
+    """
+    Fields de los measurements agregados para los campos indicados.
+    """
+    return [f"{campo}_{sufijo}" for campo in (campos or CAMPOS_AGREGADOS) for sufijo in ESTADISTICOS] + ['muestras']
+
+
+def calcular_agregados(df, segundos, desde_primera_muestra=False):
+    """
+    Agrega el DataFrame de una actividad en intervalos de `segundos`
+    alineados a la época: media, mínimo y máximo de cada campo (ignorando
+    huecos) y número de muestras. Vectorizado con reduceat sobre los límites
+    de cada intervalo, ya que los streams vienen ordenados por tiempo. Con
+    `desde_primera_muestra` el primer intervalo lleva el timestamp de la
+    primera muestra (esquema compacto).
+    """
+    import numpy as np
+    import pandas as pd
+
+    tiempos = df['timestamp_real'].to_numpy(dtype="datetime64[ns]").view(np.int64)
+    orden = None
+    if len(tiempos) > 1 and (np.diff(tiempos) < 0).any():
+        orden = np.argsort(tiempos, kind="stable")
+        tiempos = tiempos[orden]
+    paso = segundos * 1_000_000_000
+    intervalo = tiempos - tiempos % paso
+    inicios = np.concatenate(([0], np.flatnonzero(np.diff(intervalo)) + 1))
+
+    marcas = intervalo[inicios]
+    if desde_primera_muestra and len(marcas):
+        marcas[0] = tiempos[0]
+    columnas = {'timestamp_real': marcas.view("datetime64[ns]")}
+    for campo in CAMPOS_AGREGADOS:
+        if campo not in df.columns:
+            continue
+        # Siempre float64: el tipo de un field no puede cambiar entre actividades
+        # (p. ej. heartrate int16 en una y float32 con huecos en otra)
+        valores = df[campo].to_numpy(dtype=np.float64, na_value=np.nan)
+        if orden is not None:
+            valores = valores[orden]
+        validos = ~np.isnan(valores)
+        if not validos.any():
+            # Sin datos (p. ej. sin potenciómetro): el field no se escribe
+            continue
+        suma = np.add.reduceat(np.where(validos, valores, 0.0), inicios)
+        cuenta = np.add.reduceat(validos, inicios)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # 3 decimales bastan y acortan el line protocol
+            columnas[f"{campo}_media"] = np.round(suma / cuenta, 3)
+        columnas[f"{campo}_min"] = np.fmin.reduceat(valores, inicios)
+        columnas[f"{campo}_max"] = np.fmax.reduceat(valores, inicios)
+    columnas['muestras'] = np.diff(np.append(inicios, len(tiempos)))
+    return pd.DataFrame(columnas)
+
+
+def dataframes_agregados(df, usuario, id_actividad, tipo_actividad, desde_primera_muestra=False):
+    """
+    Devuelve un diccionario measurement -> DataFrame con los agregados de la
+    actividad a cada resolución, listos para escribir en InfluxDB.
+    """
+    resultado = {}
+    for resolucion, segundos in RESOLUCIONES.items():
+        agregado = calcular_agregados(df, segundos, desde_primera_muestra)
+        agregado['usuario'] = usuario
+        agregado['id_actividad'] = str(id_actividad)
+        agregado['tipo_actividad'] = tipo_actividad
+        resultado[measurement_agregado(tipo_actividad, resolucion)] = agregado
+    return resultado
+
+
+def tablas_agregados(df, tipo_actividad, esquema=None):
+    """
+    Calcula los agregados de una actividad ya preparada (con las columnas de
+    tags) y los devuelve como tuplas (df, measurement, tags, timestamp) para
+    EscritorInflux.escribir_varios: las tres resoluciones suman ~1/8 de los
+    puntos originales y viajan juntas en un único lote. Los tags siguen el
+    esquema de InfluxDB (esquema_influx).
+    """
+    desde_primera_muestra = not series_por_actividad(esquema)
+    with medir("agregados", id_actividad=str(df['id_actividad'].iloc[0])):
+        agregados = dataframes_agregados(df, df['usuario'].iloc[0], df['id_actividad'].iloc[0], tipo_actividad,
+                                         desde_primera_muestra)
+    tags = tags_streams(esquema)
+    return [(adaptar_dataframe(agregado, esquema), measurement, tags, "timestamp_real")
+            for measurement, agregado in agregados.items()]
+
+
+def _a_timestamp(valor):
+    """
+    Fecha ISO 8601 (o None = ahora) -> pd.Timestamp en UTC.
+    """
+    import pandas as pd
+
+    if valor is None:
+        return pd.Timestamp(datetime.now(timezone.utc))
+    marca = pd.Timestamp(valor)
+    return marca.tz_localize("UTC") if marca.tzinfo is None else marca.tz_convert("UTC")
+
+
+def elegir_resolucion(desde, hasta=None, max_puntos=PUNTOS_MAXIMOS):
+    """
+    Elige la resolución para un rango de tiempo: la más fina cuyo número de
+    intervalos en el rango no supera `max_puntos`, empezando por los datos
+    originales a 1 Hz. Devuelve None para los datos originales o el sufijo
+    ('10s', '1m', '1h'); si ni la de 1 h cabe, se usa la de 1 h.
+    """
+    segundos = (_a_timestamp(hasta) - _a_timestamp(desde)).total_seconds()
+    if segundos <= max_puntos:
+        return None
+    for resolucion, paso in RESOLUCIONES.items():
+        if segundos / paso <= max_puntos:
+            return resolucion
+    return list(RESOLUCIONES)[-1]
+
+
+def main():
+    """
+    Genera los agregados de las actividades del almacén local.
+    """
+    from almacen_local import iterar_actividades
+    from cache_consultas import invalidar_measurement
+    from escritor_influx import obtener_escritor, reenviar_spool
+    from main import obtener_config_influx
+
+    parser = argparse.ArgumentParser(description="Genera los agregados 10s/1m/1h desde el almacén local")
+    parser.add_argument("--usuarios", nargs="+", help="Por defecto, todos")
+    parser.add_argument("--tipos", nargs="+", default=['Run', 'Cycling', 'Swimming'])
+    args = parser.parse_args()
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return
+    reenviar_spool(config_influx)
+    escritor = obtener_escritor(config_influx['host'], config_influx['token'],
+                                config_influx['org'], config_influx['database'])
+
+    columnas = ['timestamp_real', 'id_actividad', 'usuario', 'tipo_actividad'] + CAMPOS_AGREGADOS
+    for tipo in args.tipos:
+        print(f"⏳ {tipo}: generando agregados...")
+        procesadas = en_spool = 0
+        # Una actividad cada vez para no cargar todo el almacén en memoria
+        for tabla in iterar_actividades(columnas=columnas, usuarios=args.usuarios, tipos=tipo):
+            _, pendientes = escritor.escribir_varios(tablas_agregados(tabla.to_pandas(), tipo))
+            en_spool += pendientes
+            procesadas += 1
+        if not procesadas:
+            continue
+        for resolucion in RESOLUCIONES:
+            invalidar_measurement(measurement_agregado(tipo, resolucion), config_influx['host'],
+                                  config_influx['database'])
+        if en_spool:
+            print(f"⚠️  {tipo}: {en_spool} lotes pendientes en el spool")
+        else:
+            print(f"✅ {tipo}: agregados de {procesadas} actividades escritos")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⏹️  Proceso interrumpido por el usuario.")
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
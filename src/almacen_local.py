@@ -0,0 +1,182 @@
+"""
+Almacén local columnar (Parquet) de actividades de Strava
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Cada actividad se guarda como un Parquet comprimido, particionado por
+usuario, tipo de actividad y mes (particionado estilo Hive):
+
+    data/almacen/usuario=Alba/tipo_actividad=Run/mes=2025-12/<id_actividad>.parquet
+
+La lectura usa pyarrow.dataset, de modo que los filtros por usuario, tipo y
+rango de tiempo descartan particiones completas sin abrirlas, y el resto de
+filtros y la proyección de columnas se aplican al leer cada fichero.
+"""
+
+import glob
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from curvas import actualizar_curvas
+from geo import indexar_actividad
+from metricas import medir
+
+RUTA_ALMACEN = "data/almacen/"
+
+# Esquema fijo de los ficheros: las columnas que falten en una actividad se
+# guardan como nulos para que todas las particiones sean compatibles.
+ESQUEMA_ALMACEN = pa.schema([
+    ('timestamp_real', pa.timestamp('ns')),
+    ('time', pa.int32()),
+    ('distance', pa.float64()),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+    ('altitude', pa.float64()),
+    ('velocity_smooth', pa.float32()),
+    ('heartrate', pa.int16()),
+    ('cadence', pa.int16()),
+    ('watts', pa.int16()),
+    ('temp', pa.int8()),
+    ('grade_smooth', pa.float32()),
+    ('id_actividad', pa.string()),
+])
+
+PARTICIONADO = ds.partitioning(
+    pa.schema([('usuario', pa.string()), ('tipo_actividad', pa.string()), ('mes', pa.string())]),
+    flavor="hive"
+)
+
+
+def _a_tabla(df, id_actividad):
+    """
+    Convierte el DataFrame de una actividad en una tabla Arrow con ESQUEMA_ALMACEN.
+    """
+    n = len(df)
+    columnas = []
+    for campo in ESQUEMA_ALMACEN:
+        if campo.name == 'id_actividad':
+            columnas.append(pa.array([str(id_actividad)] * n, type=campo.type))
+        elif campo.name in df.columns:
+            columnas.append(pa.array(df[campo.name].to_numpy(), type=campo.type, from_pandas=True))
+        else:
+            columnas.append(pa.nulls(n, type=campo.type))
+    return pa.Table.from_arrays(columnas, schema=ESQUEMA_ALMACEN)
+
+
+def guardar_actividad(df, usuario, id_actividad, tipo_actividad, ruta_base=RUTA_ALMACEN):
+    """
+    Guarda una actividad en el almacén local. Si ya existía, se sobrescribe,
+    aunque haya cambiado de deporte o de mes y por tanto de partición.
+    También actualiza su entrada en el índice espacial (geo.py) y sus curvas
+    de mejor esfuerzo y los récords del usuario (curvas.py).
+    """
+
+    mes = pd.Timestamp(df['timestamp_real'].iloc[0]).strftime("%Y-%m")
+    directorio = os.path.join(ruta_base, f"usuario={usuario}", f"tipo_actividad={tipo_actividad}", f"mes={mes}")
+    os.makedirs(directorio, exist_ok=True)
+    archivo = os.path.join(directorio, f"{id_actividad}.parquet")
+    # Se escribe a un temporal y se renombra: un fallo a mitad no deja sin la
+    # copia anterior, y leer_actividades nunca ve un fichero a medio escribir
+    # (pyarrow.dataset ignora los nombres que empiezan por ".")
+    temporal = os.path.join(directorio, f".{id_actividad}.parquet.tmp")
+    with medir("parquet_local", id_actividad=str(id_actividad)):
+        pq.write_table(_a_tabla(df, id_actividad), temporal, compression="zstd")
+        os.replace(temporal, archivo)
+    # Una versión anterior en otra partición se leería como una actividad duplicada
+    for anterior in glob.glob(os.path.join(glob.escape(os.path.join(ruta_base, f"usuario={usuario}")),
+                                           "tipo_actividad=*", "mes=*", f"{glob.escape(str(id_actividad))}.parquet")):
+        if os.path.normpath(anterior) != os.path.normpath(archivo):
+            os.remove(anterior)
+    with medir("indice_geo", id_actividad=str(id_actividad)):
+        indexar_actividad(df, usuario, id_actividad, tipo_actividad)
+    with medir("curvas", id_actividad=str(id_actividad)):
+        actualizar_curvas(df, usuario, id_actividad, tipo_actividad)
+    print(f"✅ Actividad guardada en el almacén local: {archivo}")
+    return archivo
+
+
+def _lista(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, (str, int)):
+        return [str(valor)]
+    return [str(v) for v in valor]
+
+
+def _timestamp_naive(valor):
+    """
+    Normaliza una fecha a pd.Timestamp sin zona horaria (UTC implícito).
+    """
+    ts = pd.Timestamp(valor)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts
+
+
+def construir_filtro(usuarios=None, tipos=None, ids=None, desde=None, hasta=None):
+    """
+    Construye la expresión de filtro de pyarrow.dataset. Los filtros sobre
+    usuario, tipo y mes actúan sobre las particiones (predicate pushdown).
+    """
+    filtro = None
+
+    def y(expresion):
+        nonlocal filtro
+        filtro = expresion if filtro is None else filtro & expresion
+
+    usuarios, tipos, ids = _lista(usuarios), _lista(tipos), _lista(ids)
+    if usuarios:
+        y(ds.field('usuario').isin(usuarios))
+    if tipos:
+        y(ds.field('tipo_actividad').isin(tipos))
+    if ids:
+        y(ds.field('id_actividad').isin(ids))
+    if desde is not None:
+        desde = _timestamp_naive(desde)
+        y(ds.field('mes') >= desde.strftime("%Y-%m"))
+        y(ds.field('timestamp_real') >= pa.scalar(desde.as_unit('ns').value, type=pa.timestamp('ns')))
+    if hasta is not None:
+        hasta = _timestamp_naive(hasta)
+        y(ds.field('mes') <= hasta.strftime("%Y-%m"))
+        y(ds.field('timestamp_real') <= pa.scalar(hasta.as_unit('ns').value, type=pa.timestamp('ns')))
+    return filtro
+
+
+def leer_actividades(columnas=None, usuarios=None, tipos=None, ids=None, desde=None, hasta=None,
+                     ruta_base=RUTA_ALMACEN):
+    """
+    Lee actividades del almacén local como tabla Arrow.
+    `columnas` limita las columnas leídas; `usuarios`, `tipos` e `ids` aceptan
+    un valor o una lista; `desde` y `hasta` acotan timestamp_real.
+    Usa `.to_pandas()` sobre el resultado para obtener un DataFrame.
+    """
+    if not os.path.isdir(ruta_base):
+        return pa.table({})
+    filtro = construir_filtro(usuarios, tipos, ids, desde, hasta)
+    return _dataset(ruta_base).to_table(columns=columnas, filter=filtro)
+
+
+def iterar_actividades(columnas=None, usuarios=None, tipos=None, ids=None, desde=None, hasta=None,
+                       ruta_base=RUTA_ALMACEN):
+    """
+    Como leer_actividades, pero devuelve una tabla Arrow por actividad (un
+    fichero del almacén cada vez), con las columnas de partición incluidas.
+    Para recorrer todo el historial con la memoria acotada a una actividad.
+    """
+    if not os.path.isdir(ruta_base):
+        return
+    dataset = _dataset(ruta_base)
+    filtro = construir_filtro(usuarios, tipos, ids, desde, hasta)
+    for fragmento in dataset.get_fragments(filter=filtro):
+        tabla = fragmento.to_table(schema=dataset.schema, columns=columnas, filter=filtro)
+        if tabla.num_rows:
+            yield tabla
+
+
+def _dataset(ruta_base):
+    return ds.dataset(ruta_base, format="parquet", partitioning=PARTICIONADO,
+                      schema=pa.unify_schemas([ESQUEMA_ALMACEN, PARTICIONADO.schema]))
@@ -0,0 +1,249 @@
+"""
+Analítica vectorizada sobre actividades (zonas, GAP, eficiencia aeróbica, FC máxima)
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Reproduce con NumPy las métricas que la memoria calculaba con SQL en InfluxDB,
+sobre un DataFrame o una tabla Arrow (por ejemplo, del almacén local):
+
+- Zonas de entrenamiento: media de FC en ventanas fijas de 10 s (DATE_BIN)
+  clasificada según los umbrales del atleta.
+- Ritmo ajustado a la pendiente (GAP) con el polinomio de 5º grado.
+- Eficiencia aeróbica: media móvil de velocity_smooth / heartrate.
+- FC máxima observada: máximo de la media móvil de 10 s.
+
+Las ventanas móviles son temporales ([t - ventana, t], como
+RANGE INTERVAL '...' PRECEDING) y se calculan con sumas acumuladas, por lo que
+el coste no depende del tamaño de la ventana. Todas las funciones por lotes
+procesan muchas actividades a la vez sin bucles de Python por actividad.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Umbrales de FC (inicio de Z2, Z3, Z4 y Z5) usados en la memoria
+UMBRALES_POR_DEFECTO = (114, 133, 152, 171)
+ZONAS = ['Z1', 'Z2', 'Z3', 'Z4', 'Z5']
+
+# Separación entre actividades en la clave temporal de los cálculos por lotes
+_SEPARACION_ACTIVIDADES = 1e9
+
+
+def umbrales_usuario(usuario):
+    """
+    Devuelve los umbrales de zonas de FC de un usuario. Se configuran con la
+    variable de entorno ZONAS_FC_[USUARIO]="114,133,152,171"; si no existe se
+    usan los umbrales por defecto.
+    """
+    valor = os.getenv(f"ZONAS_FC_{usuario.upper()}") if usuario else None
+    if not valor:
+        return UMBRALES_POR_DEFECTO
+    umbrales = tuple(float(x) for x in valor.split(','))
+    if len(umbrales) != 4 or list(umbrales) != sorted(umbrales):
+        raise ValueError(f"ZONAS_FC_{usuario.upper()} debe tener 4 umbrales crecientes")
+    return umbrales
+
+
+def _a_dataframe(datos, columnas):
+    """
+    Acepta un DataFrame o una tabla Arrow y devuelve un DataFrame con las columnas pedidas.
+    """
+    if isinstance(datos, (pa.Table, pa.RecordBatch)):
+        presentes = [c for c in columnas if c in datos.column_names]
+        return datos.select(presentes).to_pandas()
+    return datos[[c for c in columnas if c in datos.columns]]
+
+
+def _columna(df, nombre):
+    """
+    Devuelve la columna como array float64 (NaN si no existe o es nula).
+    """
+    if nombre not in df.columns:
+        return np.full(len(df), np.nan)
+    return df[nombre].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _segundos(df, columna_tiempo='timestamp_real'):
+    """
+    Segundos epoch (float) de la columna de tiempo.
+    """
+    tiempos = df[columna_tiempo].to_numpy(dtype="datetime64[ns]")
+    return tiempos.astype(np.int64) / 1e9
+
+
+_COLUMNAS_LOTE = ['timestamp_real', 'velocity_smooth', 'heartrate', 'id_actividad']
+
+
+def _preparar_lote(datos, columnas=_COLUMNAS_LOTE, columna_tiempo='timestamp_real'):
+    """
+    Ordena por actividad y tiempo. Devuelve (df, orden, grupos, claves, primeros):
+    `grupos` es el índice de actividad de cada fila ordenada, `primeros` la
+    posición donde empieza cada actividad y `claves` un tiempo en segundos en el
+    que actividades distintas nunca caen en la misma ventana.
+    """
+    if isinstance(datos, tuple):
+        # Lote ya preparado (reutilizado por metricas_por_actividad)
+        return datos
+    df = _a_dataframe(datos, columnas)
+    segundos = _segundos(df, columna_tiempo)
+    if 'id_actividad' in df.columns:
+        grupos = pd.factorize(df['id_actividad'])[0]
+    else:
+        grupos = np.zeros(len(df), dtype=np.int64)
+    orden = np.lexsort((segundos, grupos))
+    grupos = grupos[orden]
+    segundos = segundos[orden]
+    relativos = segundos - segundos.min() if len(segundos) else segundos
+    primeros = np.flatnonzero(np.r_[True, grupos[1:] != grupos[:-1]]) if len(grupos) else np.array([], dtype=np.int64)
+    return df, orden, grupos, grupos * _SEPARACION_ACTIVIDADES + relativos, primeros
+
+
+def media_movil_tiempo(segundos, valores, ventana):
+    """
+    Media móvil de `valores` en la ventana temporal [t - ventana, t] para cada
+    muestra (ignora NaN). `segundos` debe estar ordenado.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    validos = ~np.isnan(valores)
+    suma = np.concatenate([[0.0], np.cumsum(np.where(validos, valores, 0.0))])
+    cuenta = np.concatenate([[0], np.cumsum(validos)])
+    inicio = np.searchsorted(segundos, segundos - ventana, side="left")
+    fin = np.arange(1, len(segundos) + 1)
+    n = cuenta[fin] - cuenta[inicio]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(n > 0, (suma[fin] - suma[inicio]) / n, np.nan)
+
+
+def fc_max_movil(datos, ventana=10.0):
+    """
+    FC máxima observada por actividad: máximo de la media móvil de `ventana`
+    segundos de heartrate. Devuelve un DataFrame (id_actividad, fc_max).
+    """
+    df, orden, _, claves, primeros = _preparar_lote(datos, ['timestamp_real', 'heartrate', 'id_actividad'])
+    medias = media_movil_tiempo(claves, _columna(df, 'heartrate')[orden], ventana)
+    return pd.DataFrame({
+        'id_actividad': _ids_por_actividad(df, orden, primeros),
+        'fc_max': np.fmax.reduceat(medias, primeros) if len(primeros) else [],
+    })
+
+
+def eficiencia_aerobica(datos, ventana=5.0):
+    """
+    Eficiencia aeróbica instantánea: media móvil de velocity_smooth / heartrate
+    en `ventana` segundos. Devuelve un array alineado con las filas de entrada.
+    """
+    df, orden, _, claves, _ = _preparar_lote(datos, ['timestamp_real', 'velocity_smooth', 'heartrate', 'id_actividad'])
+    pulso = _columna(df, 'heartrate')[orden]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cociente = np.where(pulso > 0, _columna(df, 'velocity_smooth')[orden] / pulso, np.nan)
+    medias = media_movil_tiempo(claves, cociente, ventana)
+    resultado = np.empty_like(medias)
+    resultado[orden] = medias
+    return resultado
+
+
+def eficiencia_aerobica_sesion(datos):
+    """
+    Eficiencia aeróbica media por actividad: AVG(velocity_smooth / heartrate).
+    Devuelve un DataFrame (id_actividad, eficiencia_aerobica_sesion).
+    """
+    df, orden, grupos, _, primeros = _preparar_lote(datos, ['timestamp_real', 'velocity_smooth', 'heartrate', 'id_actividad'])
+    pulso = _columna(df, 'heartrate')[orden]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cociente = np.where(pulso > 0, _columna(df, 'velocity_smooth')[orden] / pulso, np.nan)
+    validos = ~np.isnan(cociente)
+    suma = np.bincount(grupos, weights=np.where(validos, cociente, 0.0))
+    cuenta = np.bincount(grupos, weights=validos)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = suma / cuenta
+    return pd.DataFrame({'id_actividad': _ids_por_actividad(df, orden, primeros),
+                         'eficiencia_aerobica_sesion': media})
+
+
+def ratio_esfuerzo_pendiente(pendiente):
+    """
+    Factor de coste energético por pendiente (polinomio de 5º grado de la
+    memoria, normalizado por el coste en llano 3.6). `pendiente` en %.
+    """
+    g = np.asarray(pendiente, dtype=np.float64) / 100.0
+    return (155.4 * g**5 - 30.4 * g**4 - 43.3 * g**3 + 46.3 * g**2 + 19.5 * g + 3.6) / 3.6
+
+
+def ritmo_ajustado_pendiente(datos):
+    """
+    Ritmo real y ritmo ajustado a la pendiente (GAP) en min/km para cada fila.
+    Devuelve un DataFrame con ritmo_min_km y ritmo_min_km_ajustado.
+    """
+    df = _a_dataframe(datos, ['velocity_smooth', 'grade_smooth'])
+    velocidad = _columna(df, 'velocity_smooth')
+    velocidad_gap = velocidad * ratio_esfuerzo_pendiente(_columna(df, 'grade_smooth'))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return pd.DataFrame({
+            'ritmo_min_km': (1000.0 / velocidad) / 60.0,
+            'ritmo_min_km_ajustado': (1000.0 / velocidad_gap) / 60.0,
+        }, index=df.index)
+
+
+def clasificar_zonas(pulso, umbrales=UMBRALES_POR_DEFECTO):
+    """
+    Devuelve el índice de zona (0 = Z1 ... 4 = Z5) de cada valor de FC, o -1 si es NaN.
+    """
+    pulso = np.asarray(pulso, dtype=np.float64)
+    zonas = np.searchsorted(np.asarray(umbrales, dtype=np.float64), pulso, side="right")
+    return np.where(np.isnan(pulso), -1, zonas)
+
+
+def tiempo_en_zonas(datos, umbrales=UMBRALES_POR_DEFECTO, intervalo=10):
+    """
+    Minutos en cada zona por actividad. Igual que la consulta de la memoria:
+    media de FC en ventanas fijas de `intervalo` segundos alineadas a epoch
+    (DATE_BIN) y cada ventana cuenta `intervalo` segundos en su zona.
+    Devuelve un DataFrame con una fila por actividad y una columna por zona.
+    """
+    df, orden, grupos, _, primeros = _preparar_lote(datos, ['timestamp_real', 'heartrate', 'id_actividad'])
+    segundos = _segundos(df)[orden]
+    pulso = _columna(df, 'heartrate')[orden]
+
+    # Identificador de cada (actividad, ventana fija): las filas ya están
+    # ordenadas, así que basta con detectar dónde cambia la ventana
+    ventanas = np.floor(segundos / intervalo).astype(np.int64)
+    cambio = np.r_[True, (grupos[1:] != grupos[:-1]) | (ventanas[1:] != ventanas[:-1])]
+    bin_id = np.cumsum(cambio) - 1
+    validos = ~np.isnan(pulso)
+    suma = np.bincount(bin_id, weights=np.where(validos, pulso, 0.0))
+    cuenta = np.bincount(bin_id, weights=validos)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = np.where(cuenta > 0, suma / cuenta, np.nan)
+    grupo_bin = grupos[cambio]
+
+    zonas = clasificar_zonas(media, umbrales)
+    minutos = np.zeros((len(primeros), len(ZONAS)))
+    con_zona = zonas >= 0
+    np.add.at(minutos, (grupo_bin[con_zona], zonas[con_zona]), intervalo / 60.0)
+
+    resultado = pd.DataFrame(minutos, columns=ZONAS)
+    resultado.insert(0, 'id_actividad', _ids_por_actividad(df, orden, primeros))
+    return resultado
+
+
+def _ids_por_actividad(df, orden, primeros):
+    """
+    id_actividad de cada actividad del lote, en el orden de `primeros`.
+    """
+    if 'id_actividad' not in df.columns:
+        return [None] * len(primeros)
+    return df['id_actividad'].take(orden[primeros]).astype(str).tolist()
+
+
+def metricas_por_actividad(datos, umbrales=UMBRALES_POR_DEFECTO):
+    """
+    Calcula en lote, para todas las actividades de `datos`, la eficiencia
+    aeróbica media, la FC máxima (media móvil de 10 s) y los minutos en zona.
+    """
+    lote = _preparar_lote(datos)
+    resultado = eficiencia_aerobica_sesion(lote)
+    resultado['fc_max'] = fc_max_movil(lote)['fc_max'].to_numpy()
+    return resultado.merge(tiempo_en_zonas(lote, umbrales), on='id_actividad')
@@ -0,0 +1,288 @@
+"""
+Caché en disco de resultados de consultas a InfluxDB
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Los resultados se guardan como Parquet en data/cache_consultas/, indexados por
+el texto normalizado de la consulta, sus parámetros, el lenguaje, el servidor
+y la base de datos. Cada entrada caduca tras un TTL, el tamaño total está
+acotado con expulsión LRU y cualquier escritura en un measurement
+(subir_a_influxdb) invalida las entradas que lo consultan en ese mismo
+servidor y base de datos. La invalidación se registra en disco y el índice
+se actualiza con un lock de fichero, de modo que funciona aunque la carga y
+las consultas se ejecuten en procesos distintos.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from metricas import registrar_cache
+
+RUTA_CACHE = "data/cache_consultas/"
+TTL_POR_DEFECTO = int(os.getenv("CACHE_CONSULTAS_TTL", "300"))
+MAX_MB_POR_DEFECTO = int(os.getenv("CACHE_CONSULTAS_MAX_MB", "200"))
+
+_PATRON_FROM = re.compile(r'\bFROM\s+"?([\w:.-]+)"?', re.IGNORECASE)
+
+
+def normalizar_consulta(query):
+    """
+    Normaliza la consulta para que diferencias de espacios o saltos de línea
+    no generen entradas distintas.
+    """
+    return " ".join(query.split())
+
+
+def servidor(host):
+    """
+    Normaliza la URL de InfluxDB a "nombre:puerto" para que "localhost:8181",
+    "http://localhost:8181/" o la URL que guarda el cliente den el mismo valor.
+    """
+    from urllib.parse import urlsplit
+
+    partes = urlsplit(host if "://" in host else f"https://{host}")
+    puerto = partes.port or (80 if partes.scheme == "http" else 443)
+    return f"{(partes.hostname or '').lower()}:{puerto}"
+
+
+def servidor_cliente(client):
+    """
+    Servidor al que consulta un InfluxDBClient3 (normalizado con servidor()).
+    """
+    url = getattr(getattr(client, "_client", None), "url", None)
+    return servidor(url) if url else ""
+
+
+def destino(host, database):
+    """
+    Identificador del servidor y la base de datos para la clave y la invalidación.
+    """
+    return f"{servidor(host) if host else ''}/{database}"
+
+
+def measurements_de_consulta(query):
+    """
+    Devuelve los measurements que aparecen en las cláusulas FROM de la consulta.
+    Las consultas sin FROM (p. ej. SHOW MEASUREMENTS) dependen de todos ("*").
+    """
+    return sorted(set(_PATRON_FROM.findall(query))) or ["*"]
+
+
+class CacheConsultas:
+    """
+    Caché de resultados (tablas Arrow) con TTL, tamaño máximo LRU e
+    invalidación por measurement.
+    """
+
+    def __init__(self, ruta=RUTA_CACHE, ttl=TTL_POR_DEFECTO, max_bytes=MAX_MB_POR_DEFECTO * 1024 * 1024):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+
+    # --- ficheros de control ---
+
+    def _ruta_indice(self):
+        return os.path.join(self.ruta, "indice.json")
+
+    def _ruta_invalidaciones(self):
+        return os.path.join(self.ruta, "invalidaciones.json")
+
+    @contextmanager
+    def _bloqueo(self):
+        """
+        Exclusión entre hilos (threading.Lock) y entre procesos (lock sobre
+        indice.lock) para cada lectura-modificación-escritura del índice y de
+        las invalidaciones.
+        """
+        os.makedirs(self.ruta, exist_ok=True)
+        with self._lock, open(os.path.join(self.ruta, "indice.lock"), "a+b") as f:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if os.name == "nt":
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _leer_json(self, ruta):
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _escribir_json(self, ruta, datos):
+        os.makedirs(self.ruta, exist_ok=True)
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f)
+        os.replace(temporal, ruta)
+
+    def _archivo(self, clave):
+        return os.path.join(self.ruta, f"{clave}.parquet")
+
+    @staticmethod
+    def clave(query, database, language, parametros=None, host=None):
+        texto = f"{destino(host, database)}\n{language}\n{normalizar_consulta(query)}"
+        if parametros:
+            texto += "\n" + json.dumps(parametros, sort_keys=True, default=str)
+        return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+    # --- API ---
+
+    def obtener(self, query, database, language="influxql", parametros=None, host=None):
+        """
+        Devuelve la tabla cacheada si existe, no ha caducado y ningún measurement
+        consultado ha recibido escrituras desde que se guardó; si no, None.
+        """
+        clave = self.clave(query, database, language, parametros, host)
+        with self._bloqueo():
+            indice = self._leer_json(self._ruta_indice())
+            entrada = indice.get(clave)
+            if entrada and self._vigente(entrada) and os.path.exists(self._archivo(clave)):
+                import pyarrow.parquet as pq
+                try:
+                    tabla = pq.read_table(self._archivo(clave))
+                except Exception:
+                    tabla = None
+                if tabla is not None:
+                    entrada['ultimo_acceso'] = time.time()
+                    self._escribir_json(self._ruta_indice(), indice)
+                    self.aciertos += 1
+                    registrar_cache(True)
+                    return tabla
+            self.fallos += 1
+            registrar_cache(False)
+            return None
+
+    def _vigente(self, entrada, invalidaciones=None):
+        if time.time() - entrada['creado'] > self.ttl:
+            return False
+        if 'destino' not in entrada:
+            # Entrada de antes de separar la caché por servidor y base de datos
+            return False
+        if invalidaciones is None:
+            invalidaciones = self._leer_json(self._ruta_invalidaciones())
+        por_destino = invalidaciones.get(entrada['destino']) or {}
+        return all(por_destino.get(m, 0) < entrada['creado'] for m in entrada['measurements'])
+
+    def guardar(self, query, database, language, tabla, parametros=None, host=None, creado=None):
+        """
+        Guarda el resultado de una consulta y aplica la expulsión LRU.
+        `creado` es el instante en que se lanzó la consulta (por defecto,
+        ahora): una escritura que llegue mientras se ejecuta la invalida.
+        """
+        import pyarrow.parquet as pq
+
+        clave = self.clave(query, database, language, parametros, host)
+        with self._bloqueo():
+            pq.write_table(tabla, self._archivo(clave))
+            indice = self._leer_json(self._ruta_indice())
+            ahora = time.time()
+            indice[clave] = {
+                'destino': destino(host, database),
+                'measurements': measurements_de_consulta(query),
+                'creado': ahora if creado is None else creado,
+                'ultimo_acceso': ahora,
+                'bytes': os.path.getsize(self._archivo(clave)),
+            }
+            self._expulsar(indice)
+            self._escribir_json(self._ruta_indice(), indice)
+
+    def _expulsar(self, indice):
+        """
+        Elimina las entradas caducadas y, si se supera max_bytes, las menos
+        usadas recientemente.
+        """
+        invalidaciones = self._leer_json(self._ruta_invalidaciones())
+        for clave in [c for c, e in indice.items() if not self._vigente(e, invalidaciones)]:
+            self._borrar(indice, clave)
+        total = sum(e['bytes'] for e in indice.values())
+        for clave in sorted(indice, key=lambda c: indice[c]['ultimo_acceso']):
+            if total <= self.max_bytes:
+                break
+            total -= indice[clave]['bytes']
+            self._borrar(indice, clave)
+
+    def _borrar(self, indice, clave):
+        indice.pop(clave, None)
+        try:
+            os.remove(self._archivo(clave))
+        except OSError:
+            pass
+
+    def invalidar_measurement(self, measurement, host, database):
+        """
+        Marca como obsoletas todas las entradas que consultan `measurement`
+        en ese servidor y base de datos, y las que no dependen de un
+        measurement concreto.
+        """
+        with self._bloqueo():
+            invalidaciones = self._leer_json(self._ruta_invalidaciones())
+            por_destino = invalidaciones.setdefault(destino(host, database), {})
+            ahora = time.time()
+            por_destino[measurement] = ahora
+            por_destino["*"] = ahora
+            self._escribir_json(self._ruta_invalidaciones(), invalidaciones)
+
+    def estadisticas(self):
+        """
+        Devuelve aciertos, fallos, número de entradas y tamaño en disco.
+        """
+        indice = self._leer_json(self._ruta_indice())
+        return {
+            'aciertos': self.aciertos,
+            'fallos': self.fallos,
+            'entradas': len(indice),
+            'bytes': sum(e['bytes'] for e in indice.values()),
+        }
+
+
+_cache = CacheConsultas()
+
+
+def consulta_cacheada(client, query, database, language="influxql", cache=None, parametros=None):
+    """
+    Ejecuta la consulta pasando por la caché. `parametros` son los valores de
+    los $nombre de la consulta y forman parte de la clave, igual que el
+    servidor del cliente y la base de datos. Devuelve una tabla Arrow.
+    """
+    cache = cache or _cache
+    host = servidor_cliente(client)
+    tabla = cache.obtener(query, database, language, parametros, host)
+    if tabla is None:
+        # Antes de consultar: una invalidación durante la consulta la deja obsoleta
+        creado = time.time()
+        tabla = client.query(query=query, database=database, language=language, query_parameters=parametros)
+        cache.guardar(query, database, language, tabla, parametros, host, creado)
+    return tabla
+
+
+def invalidar_measurement(measurement, host, database, cache=None):
+    """
+    Invalida la caché de un measurement de `host`/`database` tras escribir en él.
+    """
+    (cache or _cache).invalidar_measurement(measurement, host, database)
+
+
+def estadisticas_cache(cache=None):
+    """
+    Devuelve las estadísticas de la caché por defecto.
+    """
+    return (cache or _cache).estadisticas()
@@ -0,0 +1,290 @@
+"""
+Script de carga masiva (backfill) de actividades de Strava en InfluxDB
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+from cliente_strava import STRAVA_API_URL, LimitadorTasa, cabeceras_autorizacion, peticion_get
+from main import (
+    actualizar_huella,
+    descargar_datos_actividad,
+    obtener_config_influx,
+    obtener_config_usuario,
+    obtener_proveedor_token,
+    preparar_dataframe_para_influx,
+    subir_a_influxdb,
+)
+from metricas import medir, registrar_descarga
+from registro_usuarios import elegir_usuario
+
+# Correspondencia entre el sport_type de Strava y las tablas de InfluxDB
+TIPOS_STRAVA = {
+    'Run': 'Run',
+    'TrailRun': 'Run',
+    'VirtualRun': 'Run',
+    'Ride': 'Cycling',
+    'VirtualRide': 'Cycling',
+    'GravelRide': 'Cycling',
+    'MountainBikeRide': 'Cycling',
+    'EBikeRide': 'Cycling',
+    'Swim': 'Swimming',
+}
+
+
+class ErrorListado(Exception):
+    """
+    Strava no ha devuelto todas las páginas del listado de actividades.
+    """
+
+
+def paginas_actividades(access_token, despues=None, antes=None, limitador=None, por_pagina=200, estricto=False):
+    """
+    Recorre el listado de actividades del atleta autenticado página a página.
+    `despues` y `antes` son timestamps epoch (segundos) opcionales. Si una
+    página falla, el listado se corta; con `estricto` se lanza ErrorListado
+    para que quien lo use sepa que está incompleto. `access_token` puede ser
+    una función que lo devuelve: se pide de nuevo en cada página.
+    """
+    url = f"{STRAVA_API_URL}/athlete/activities"
+    headers = cabeceras_autorizacion(access_token)
+    pagina = 1
+
+    while True:
+        params = {'page': pagina, 'per_page': por_pagina}
+        if despues is not None:
+            params['after'] = int(despues)
+        if antes is not None:
+            params['before'] = int(antes)
+
+        with medir("listado_get", pagina=pagina):
+            response = peticion_get(url, headers, params=params, limitador=limitador)
+        registrar_descarga("listado", len(response.content))
+        if response.status_code != 200:
+            if estricto:
+                raise ErrorListado(f"página {pagina}: HTTP {response.status_code} {response.text[:200]}")
+            print(f"❌ Error al listar actividades: {response.text}")
+            return
+
+        lote = response.json()
+        yield lote
+        if len(lote) < por_pagina:
+            return
+        pagina += 1
+
+
+def listar_actividades(access_token, despues=None, antes=None, limitador=None, por_pagina=200, estricto=False):
+    """
+    Lista las actividades del atleta autenticado, paginando hasta el final.
+    `despues` y `antes` son timestamps epoch (segundos) opcionales. Con
+    `estricto` lanza ErrorListado si alguna página falla.
+    """
+    actividades = []
+    for lote in paginas_actividades(access_token, despues, antes, limitador, por_pagina, estricto):
+        actividades.extend(lote)
+
+    print(f"📋 Actividades encontradas: {len(actividades)}")
+    return actividades
+
+
+def tipo_measurement(actividad):
+    """
+    Devuelve la tabla de InfluxDB de una actividad del listado, o None si
+    el deporte no se almacena.
+    """
+    return TIPOS_STRAVA.get(actividad.get('sport_type') or actividad.get('type'))
+
+
+def procesar_actividad(actividad, usuario, access_token, config_influx, limitador=None, forzar=False):
+    """
+    Descarga y sube una actividad del listado. Devuelve el número de muestras
+    escritas, o None si la actividad no ha cambiado desde la última ingesta
+    (huellas.py), y lanza una excepción si algo falla. Con `forzar` se
+    reescribe aunque no haya cambiado. `access_token` es el token o, en las
+    cargas largas, la función de obtener_proveedor_token.
+    """
+    from almacen_local import guardar_actividad
+    from huellas import guardar_huella, huella_metadatos, huella_streams, leer_huella, sin_cambios
+
+    activity_id = str(actividad['id'])
+    tipo_actividad = tipo_measurement(actividad)
+
+    # Listado idéntico al de la última ingesta: ni siquiera se descargan los streams
+    anterior = leer_huella(usuario, activity_id)
+    metadatos = huella_metadatos(actividad)
+    if not forzar and anterior is not None and metadatos and anterior.get('metadatos') == metadatos:
+        return None
+
+    df = descargar_datos_actividad(
+        activity_id,
+        access_token,
+        start_date=actividad.get('start_date'),
+        limitador=limitador
+    )
+    if df is None:
+        raise RuntimeError("no se pudieron descargar los streams")
+
+    # Metadatos editados (p. ej. el nombre) pero los mismos streams: no se reescribe
+    huella = huella_streams(df, actividad.get('updated_at'))
+    if not forzar and sin_cambios(anterior, huella, tipo_actividad):
+        guardar_huella(usuario, activity_id, dict(anterior, metadatos=metadatos))
+        return None
+
+    guardar_actividad(df, usuario, activity_id, tipo_actividad)
+    df_influx = preparar_dataframe_para_influx(df, usuario, activity_id, tipo_actividad)
+    exito = subir_a_influxdb(
+        df_influx,
+        tipo_actividad,
+        config_influx['host'],
+        config_influx['token'],
+        config_influx['org'],
+        config_influx['database'],
+        huella=huella,
+        anterior=anterior
+    )
+    if not exito:
+        raise RuntimeError("error al subir a InfluxDB")
+    actualizar_huella(df, usuario, activity_id, tipo_actividad, huella, anterior, metadatos, config_influx)
+    return len(df)
+
+
+def cargar_actividades(actividades, usuario, access_token, config_influx, max_hilos=4, limitador=None,
+                       forzar=False):
+    """
+    Descarga y sube varias actividades en paralelo con un pool de hilos.
+    Un fallo en una actividad no detiene el resto. Devuelve un resumen con
+    las actividades correctas, las fallidas y el rendimiento obtenido. Las
+    actividades sin cambios desde la última ingesta cuentan como correctas
+    y además se listan en resumen['sin_cambios'].
+    """
+    limitador = limitador or LimitadorTasa()
+    resumen = {'correctas': [], 'fallidas': {}, 'omitidas': [], 'sin_cambios': [], 'muestras': 0, 'segundos': 0.0}
+
+    pendientes = []
+    for actividad in actividades:
+        if tipo_measurement(actividad) is None:
+            resumen['omitidas'].append(actividad['id'])
+        else:
+            pendientes.append(actividad)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_hilos) as pool:
+        futuros = {
+            pool.submit(procesar_actividad, actividad, usuario, access_token, config_influx, limitador,
+                        forzar): actividad
+            for actividad in pendientes
+        }
+        for futuro in as_completed(futuros):
+            actividad = futuros[futuro]
+            try:
+                muestras = futuro.result()
+                resumen['correctas'].append(actividad)
+                if muestras is None:
+                    resumen['sin_cambios'].append(actividad)
+                else:
+                    resumen['muestras'] += muestras
+            except Exception as e:
+                print(f"❌ Actividad {actividad['id']} fallida: {e}")
+                resumen['fallidas'][actividad['id']] = str(e)
+
+    resumen['segundos'] = time.perf_counter() - inicio
+    mostrar_rendimiento(resumen)
+    return resumen
+
+
+def mostrar_rendimiento(resumen):
+    """
+    Muestra el rendimiento de una carga masiva.
+    """
+    segundos = max(resumen['segundos'], 1e-9)
+    print("\n" + "="*60)
+    print("   RESUMEN DE LA CARGA MASIVA")
+    print("="*60)
+    print(f"✅ Correctas: {len(resumen['correctas'])}")
+    print(f"⏸️  Sin cambios (no reescritas): {len(resumen['sin_cambios'])}")
+    print(f"❌ Fallidas: {len(resumen['fallidas'])}")
+    print(f"⏭️  Omitidas (deporte no soportado): {len(resumen['omitidas'])}")
+    print(f"⏱️  Tiempo total: {resumen['segundos']:.1f} s")
+    print(f"🚀 Actividades/min: {len(resumen['correctas']) * 60 / segundos:.1f}")
+    print(f"📈 Muestras/s: {resumen['muestras'] / segundos:.0f}")
+    print("="*60)
+
+
+def _leer_fecha(texto):
+    """
+    Convierte 'AAAA-MM-DD' en timestamp epoch UTC, o None si está vacío.
+    """
+    if not texto:
+        return None
+    return datetime.strptime(texto, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+
+
+def main():
+    """
+    Función principal del script de carga masiva
+    """
+    from escritor_influx import reenviar_spool
+
+    print("\n" + "="*60)
+    print("   CARGA MASIVA DE ACTIVIDADES STRAVA → InfluxDB")
+    print("="*60 + "\n")
+
+    usuario = elegir_usuario()
+    if usuario is None:
+        return
+
+    config = obtener_config_usuario(usuario)
+    if not all(config.values()):
+        print(f"❌ Error: Faltan credenciales de Strava para {usuario} en las variables de entorno")
+        return
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return
+    reenviar_spool(config_influx)
+
+    # Una función en lugar del token: la carga puede durar más que el token
+    access_token = obtener_proveedor_token(
+        config['client_id'],
+        config['client_secret'],
+        config['refresh_token'],
+        usuario
+    )
+    if not access_token:
+        print("❌ No se pudo obtener el token de acceso. Abortando.")
+        return
+
+    try:
+        despues = _leer_fecha(input("\n📅 Desde (AAAA-MM-DD, Enter para todo): ").strip())
+        antes = _leer_fecha(input("📅 Hasta (AAAA-MM-DD, Enter para hoy): ").strip())
+    except ValueError:
+        print("❌ Formato de fecha inválido.")
+        return
+
+    hilos_str = input("🧵 Descargas simultáneas (Enter para 4): ").strip()
+    max_hilos = int(hilos_str) if hilos_str.isdigit() and int(hilos_str) > 0 else 4
+
+    limitador = LimitadorTasa()
+    actividades = listar_actividades(access_token, despues=despues, antes=antes, limitador=limitador)
+    if not actividades:
+        print("ℹ️  No hay actividades que cargar.")
+        return
+
+    confirmar = input(f"\n¿Cargar {len(actividades)} actividades en InfluxDB? (S/N): ").strip().upper()
+    if confirmar != 'S':
+        print("\n⏹️  Carga cancelada.")
+        return
+
+    cargar_actividades(actividades, usuario, access_token, config_influx, max_hilos, limitador)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⏹️  Proceso interrumpido por el usuario.")
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
@@ -0,0 +1,437 @@
+"""
+Línea de comandos no interactiva para varios atletas
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Subcomandos:
+
+    python src/cli.py usuarios listar
+    python src/cli.py usuarios alta Carlos --client-id 123 --client-secret xxx --refresh-token yyy
+    python src/cli.py usuarios baja Carlos
+
+    python src/cli.py ingest --usuario Alba --ids 1234567890 1234567891
+    python src/cli.py ingest --usuario Alba --desde 2025-01-01 --hasta 2025-02-01 --deporte Run
+
+    python src/cli.py sync                       # todos los atletas registrados
+    python src/cli.py sync --usuarios Alba Carlos --paralelo 4
+
+    python src/cli.py query --deporte Run --usuario Alba --desde 2025-01-01 --limite 50
+    python src/cli.py export --deporte Run --ids 1234567890 --salida exportaciones/run.parquet
+    python src/cli.py export --origen local --usuario Alba --salida alba.csv
+
+    python src/cli.py import --ruta data/ --procesos 4     # archivo de CSV (importar_csv.py)
+
+    python src/cli.py --perfil data/perfiles/sync.prof sync
+
+    python src/cli.py servicio                   # proceso caliente (servicio.py)
+    python src/cli.py --servicio query --deporte Run --limite 5
+
+Las fechas son AAAA-MM-DD (UTC). El código de salida es 1 si algo falla.
+Los módulos pesados (pandas, pyarrow, influxdb_client_3) se importan dentro
+de cada subcomando, así que la ayuda y `usuarios` arrancan al momento.
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from carga_masiva import TIPOS_STRAVA, _leer_fecha, cargar_actividades, listar_actividades, tipo_measurement
+from cliente_strava import STRAVA_API_URL, LimitadorTasa, cabeceras_autorizacion, peticion_get
+from importar_csv import agregar_argumentos as agregar_argumentos_importacion
+from metricas import perfilar
+from main import obtener_config_influx, obtener_config_usuario, obtener_proveedor_token
+from registro_usuarios import eliminar_usuario, listar_usuarios, registrar_usuario
+
+DEPORTES = sorted(set(TIPOS_STRAVA.values()))
+
+# Clientes de InfluxDB reutilizados entre comandos (solo en el servicio)
+_clientes_compartidos = None
+
+
+# --- utilidades ---
+
+def _token_usuario(usuario):
+    """
+    Devuelve (access_token, client_id) de un atleta, o (None, None).
+    access_token es una función que devuelve un token válido en cada
+    llamada, para que ingest y sync lo refresquen si caduca a mitad.
+    """
+    config = obtener_config_usuario(usuario)
+    if not all(config.values()):
+        print(f"❌ Error: Faltan credenciales de Strava para {usuario} (registro o variables de entorno)")
+        return None, None
+    access_token = obtener_proveedor_token(
+        config['client_id'],
+        config['client_secret'],
+        config['refresh_token'],
+        usuario
+    )
+    return access_token, config['client_id']
+
+
+def _fecha_iso(texto):
+    """
+    'AAAA-MM-DD' -> literal RFC 3339 para InfluxQL (o None).
+    """
+    return f"{texto}T00:00:00Z" if texto else None
+
+
+def _filtro_deportes(actividades, deportes):
+    if not deportes:
+        return actividades
+    return [a for a in actividades if tipo_measurement(a) in deportes]
+
+
+def _cargar(actividades, usuario, access_token, config_influx, args, limitador):
+    """
+    Carga actividades con el pool de hilos o con el pipeline asíncrono.
+    """
+    if args.asincrono:
+        from pipeline_async import cargar_actividades_async
+        concurrencia = {'streams': args.hilos, 'escritura': args.hilos}
+        return cargar_actividades_async(actividades, usuario, access_token, config_influx, concurrencia,
+                                        limitador=limitador, forzar=args.forzar)
+    return cargar_actividades(actividades, usuario, access_token, config_influx, args.hilos, limitador,
+                              forzar=args.forzar)
+
+
+def _cliente_influx(config_influx):
+    from influxdb_client_3 import InfluxDBClient3
+
+    if _clientes_compartidos is not None:
+        clave = (config_influx['host'], config_influx['database'])
+        if clave not in _clientes_compartidos:
+            _clientes_compartidos[clave] = InfluxDBClient3(
+                host=config_influx['host'], token=config_influx['token'],
+                org=config_influx['org'], database=config_influx['database'])
+        return _clientes_compartidos[clave]
+    return InfluxDBClient3(host=config_influx['host'], token=config_influx['token'],
+                           org=config_influx['org'], database=config_influx['database'])
+
+
+def _cerrar_cliente(client):
+    if _clientes_compartidos is None:
+        client.close()
+
+
+def compartir_clientes():
+    """
+    A partir de ahora query y export reutilizan el cliente de InfluxDB (y su
+    conexión Flight) en lugar de abrir y cerrar uno por comando.
+    """
+    global _clientes_compartidos
+    if _clientes_compartidos is None:
+        _clientes_compartidos = {}
+
+
+def cerrar_clientes():
+    global _clientes_compartidos
+    for client in (_clientes_compartidos or {}).values():
+        client.close()
+    _clientes_compartidos = None
+
+
+def precargar():
+    """
+    Importa de antemano los módulos pesados de todos los subcomandos.
+    """
+    import almacen_local  # noqa: F401
+    import consultar_influxdb  # noqa: F401
+    import escritor_influx  # noqa: F401
+    import influxdb_client_3  # noqa: F401
+    import pandas  # noqa: F401
+    import pipeline_async  # noqa: F401
+    import pyarrow.csv  # noqa: F401
+    import pyarrow.parquet  # noqa: F401
+    import resumen_actividad  # noqa: F401
+    import sincronizacion  # noqa: F401
+
+
+def _filtros_consulta(args):
+    filtros = {}
+    if args.usuario:
+        filtros['usuario'] = args.usuario
+    if args.ids:
+        filtros['id_actividad'] = args.ids
+    return filtros
+
+
+# --- subcomandos ---
+
+def comando_usuarios(args):
+    if args.accion == 'listar':
+        usuarios = listar_usuarios()
+        if not usuarios:
+            print("ℹ️  No hay usuarios registrados.")
+        for usuario in usuarios:
+            config = obtener_config_usuario(usuario)
+            estado = "✅" if all(config.values()) else "⚠️  credenciales incompletas"
+            print(f"👤 {usuario} {estado}")
+        return True
+
+    if args.accion == 'alta':
+        try:
+            registrar_usuario(args.nombre, client_id=args.client_id, client_secret=args.client_secret,
+                              refresh_token=args.refresh_token)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return False
+        print(f"✅ Usuario {args.nombre} registrado")
+        return True
+
+    if eliminar_usuario(args.nombre):
+        print(f"✅ Usuario {args.nombre} eliminado del registro")
+        return True
+    print(f"❌ {args.nombre} no está en el registro")
+    return False
+
+
+def comando_ingest(args):
+    from escritor_influx import reenviar_spool
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return False
+    reenviar_spool(config_influx)
+
+    access_token, _ = _token_usuario(args.usuario)
+    if not access_token:
+        return False
+
+    limitador = LimitadorTasa()
+    if args.ids:
+        # El detalle trae el deporte y la fecha de inicio de cada actividad
+        headers = cabeceras_autorizacion(access_token)
+        actividades = []
+        for activity_id in args.ids:
+            response = peticion_get(f"{STRAVA_API_URL}/activities/{activity_id}", headers, limitador=limitador)
+            if response.status_code != 200:
+                print(f"❌ Actividad {activity_id} no encontrada: {response.text}")
+                continue
+            actividades.append(response.json())
+    else:
+        actividades = listar_actividades(access_token, despues=_leer_fecha(args.desde),
+                                         antes=_leer_fecha(args.hasta), limitador=limitador)
+
+    actividades = _filtro_deportes(actividades, args.deporte)
+    if not actividades:
+        print("ℹ️  No hay actividades que cargar.")
+        return True
+
+    resumen = _cargar(actividades, args.usuario, access_token, config_influx, args, limitador)
+    return not resumen['fallidas']
+
+
+def comando_sync(args):
+    from escritor_influx import reenviar_spool
+    from sincronizacion import sincronizar_usuario
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return False
+    reenviar_spool(config_influx)
+
+    usuarios = args.usuarios or listar_usuarios()
+    if not usuarios:
+        print("❌ No hay usuarios que sincronizar.")
+        return False
+
+    # El límite de tasa de Strava es por aplicación: un limitador por client_id
+    limitadores = {}
+
+    def sincronizar(usuario):
+        access_token, client_id = _token_usuario(usuario)
+        if not access_token:
+            raise RuntimeError("sin token de acceso")
+        limitador = limitadores.setdefault(client_id, LimitadorTasa())
+        resumen = sincronizar_usuario(usuario, access_token, config_influx, args.hilos, limitador,
+                                      asincrono=args.asincrono)
+        return resumen
+
+    errores = {}
+    with ThreadPoolExecutor(max_workers=args.paralelo) as pool:
+        futuros = {pool.submit(sincronizar, usuario): usuario for usuario in usuarios}
+        for futuro in as_completed(futuros):
+            usuario = futuros[futuro]
+            try:
+                resumen = futuro.result()
+                if resumen and resumen['fallidas']:
+                    errores[usuario] = f"{len(resumen['fallidas'])} actividades fallidas"
+            except Exception as e:
+                errores[usuario] = str(e)
+
+    print("\n" + "="*60)
+    print("   RESUMEN DE LA SINCRONIZACIÓN")
+    print("="*60)
+    for usuario in usuarios:
+        print(f"❌ {usuario}: {errores[usuario]}" if usuario in errores else f"✅ {usuario}")
+    print("="*60)
+    return not errores
+
+
+def comando_query(args):
+    from consultar_influxdb import consultar_en_streaming
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return False
+    client = _cliente_influx(config_influx)
+    try:
+        df, _ = consultar_en_streaming(
+            client, args.deporte, config_influx['database'],
+            columnas=args.columnas, filtros=_filtros_consulta(args),
+            desde=_fecha_iso(args.desde), hasta=_fecha_iso(args.hasta), max_filas=args.limite
+        )
+    finally:
+        _cerrar_cliente(client)
+    if df is None:
+        return False
+    print(df.to_string() if not df.empty else "ℹ️  Sin resultados")
+    return True
+
+
+def comando_export(args):
+    if args.origen == 'local':
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+
+        from almacen_local import leer_actividades
+
+        tabla = leer_actividades(columnas=args.columnas, usuarios=args.usuario, tipos=args.deporte,
+                                 ids=args.ids, desde=args.desde, hasta=args.hasta)
+        directorio = os.path.dirname(args.salida)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        if args.salida.endswith(".parquet"):
+            pq.write_table(tabla, args.salida, compression="zstd")
+        else:
+            pa_csv.write_csv(tabla, args.salida)
+        print(f"✅ {tabla.num_rows} registros exportados a: {args.salida}")
+        return True
+
+    from consultar_influxdb import consultar_en_streaming
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return False
+    client = _cliente_influx(config_influx)
+    try:
+        df, _ = consultar_en_streaming(
+            client, args.deporte, config_influx['database'],
+            columnas=args.columnas, filtros=_filtros_consulta(args),
+            desde=_fecha_iso(args.desde), hasta=_fecha_iso(args.hasta), archivo_salida=args.salida
+        )
+    finally:
+        _cerrar_cliente(client)
+    return df is not None
+
+
+def comando_import(args):
+    from importar_csv import importar_desde_argumentos
+
+    return importar_desde_argumentos(args)
+
+
+def comando_servicio(args):
+    import servicio
+
+    if args.parar:
+        return servicio.parar()
+    return servicio.servir()
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Strava → InfluxDB para varios atletas")
+    parser.add_argument("--perfil", metavar="RUTA", help="Guarda un perfil cProfile de la ejecución")
+    parser.add_argument("--servicio", action="store_true",
+                        help="Ejecuta el comando en el servicio residente, si está arrancado")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    # usuarios
+    p_usuarios = subparsers.add_parser("usuarios", help="Gestiona el registro de atletas")
+    acciones = p_usuarios.add_subparsers(dest="accion", required=True)
+    acciones.add_parser("listar", help="Lista los atletas disponibles")
+    p_alta = acciones.add_parser("alta", help="Registra o actualiza un atleta")
+    p_alta.add_argument("nombre")
+    p_alta.add_argument("--client-id")
+    p_alta.add_argument("--client-secret")
+    p_alta.add_argument("--refresh-token")
+    p_baja = acciones.add_parser("baja", help="Elimina un atleta del registro")
+    p_baja.add_argument("nombre")
+    p_usuarios.set_defaults(funcion=comando_usuarios)
+
+    # ingest
+    p_ingest = subparsers.add_parser("ingest", help="Descarga y sube actividades de un atleta")
+    p_ingest.add_argument("--usuario", required=True)
+    p_ingest.add_argument("--ids", nargs="+", help="IDs de actividad (si no, se usa el rango de fechas)")
+    p_ingest.add_argument("--desde", help="AAAA-MM-DD")
+    p_ingest.add_argument("--hasta", help="AAAA-MM-DD")
+    p_ingest.add_argument("--deporte", nargs="+", choices=DEPORTES)
+    p_ingest.add_argument("--hilos", type=int, default=4)
+    p_ingest.add_argument("--asincrono", action="store_true")
+    p_ingest.add_argument("--forzar", action="store_true", help="Reescribe también las actividades sin cambios")
+    p_ingest.set_defaults(funcion=comando_ingest)
+
+    # sync
+    p_sync = subparsers.add_parser("sync", help="Sincroniza en paralelo varios atletas")
+    p_sync.add_argument("--usuarios", nargs="+", help="Por defecto, todos los registrados")
+    p_sync.add_argument("--paralelo", type=int, default=2, help="Atletas sincronizados a la vez")
+    p_sync.add_argument("--hilos", type=int, default=4, help="Descargas simultáneas por atleta")
+    p_sync.add_argument("--asincrono", action="store_true")
+    p_sync.set_defaults(funcion=comando_sync)
+
+    # query / export
+    for nombre, ayuda in (("query", "Muestra registros de InfluxDB"), ("export", "Exporta registros a CSV o Parquet")):
+        p = subparsers.add_parser(nombre, help=ayuda)
+        p.add_argument("--deporte", default="Run", choices=DEPORTES + ["Resumen"])
+        p.add_argument("--usuario", nargs="+")
+        p.add_argument("--ids", nargs="+")
+        p.add_argument("--desde", help="AAAA-MM-DD")
+        p.add_argument("--hasta", help="AAAA-MM-DD")
+        p.add_argument("--columnas", nargs="+")
+        if nombre == "query":
+            p.add_argument("--limite", type=int, default=20)
+            p.set_defaults(funcion=comando_query)
+        else:
+            p.add_argument("--salida", required=True, help="Fichero .csv o .parquet")
+            p.add_argument("--origen", choices=["influx", "local"], default="influx",
+                           help="InfluxDB o el almacén Parquet local")
+            p.set_defaults(funcion=comando_export)
+
+    # import
+    p_import = subparsers.add_parser("import", help="Importa el archivo local de CSV en InfluxDB")
+    agregar_argumentos_importacion(p_import)
+    p_import.set_defaults(funcion=comando_import)
+
+    # servicio
+    p_servicio = subparsers.add_parser("servicio", help="Proceso caliente que atiende los comandos --servicio")
+    p_servicio.add_argument("--parar", action="store_true", help="Detiene el servicio en marcha")
+    p_servicio.set_defaults(funcion=comando_servicio)
+
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = crear_parser().parse_args(argv)
+    if args.servicio and args.comando != "servicio":
+        from servicio import ejecutar_remoto
+
+        codigo = ejecutar_remoto([a for a in argv if a != "--servicio"])
+        if codigo is not None:
+            return codigo
+        print("ℹ️  Servicio no disponible: el comando se ejecuta en este proceso")
+    with perfilar(args.perfil):
+        return 0 if args.funcion(args) else 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n\n⏹️  Proceso interrumpido por el usuario.")
+        sys.exit(130)
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
+        sys.exit(1)
@@ -0,0 +1,302 @@
+"""
+Utilidades de acceso HTTP a la API de Strava
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from metricas import medir, registrar_descarga
+
+# Se pueden sobrescribir (p. ej. para apuntar al servidor falso de benchmarks/)
+STRAVA_API_URL = os.getenv("STRAVA_API_URL", "https://www.strava.com/api/v3")
+STRAVA_AUTH_URL = os.getenv("STRAVA_AUTH_URL", "https://www.strava.com/oauth/token")
+
+# Segundos de margen antes de expires_at para considerar caducado un token
+MARGEN_EXPIRACION = 120
+
+_sesion = None
+_lock_sesion = threading.Lock()
+
+
+def obtener_sesion():
+    """
+    Devuelve una requests.Session compartida con pool de conexiones (keep-alive)
+    y reintentos acotados con backoff exponencial ante errores de red y 5xx.
+    Solo se reintentan los GET: el POST de refresco del token no es
+    idempotente. Los 429 no se reintentan aquí: los gestiona el LimitadorTasa.
+    requests se importa aquí, con la primera petición, para que los comandos
+    que no llaman a Strava arranquen sin cargarlo.
+    """
+    global _sesion
+    with _lock_sesion:
+        if _sesion is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            reintentos = Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=[500, 502, 503, 504],
+                allowed_methods=["GET"]
+            )
+            adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=reintentos)
+            sesion = requests.Session()
+            sesion.mount("https://", adaptador)
+            sesion.mount("http://", adaptador)
+            _sesion = sesion
+        return _sesion
+
+
+class LimitadorTasa:
+    """
+    Controla las cuotas de Strava (ventana de 15 minutos y cuota diaria)
+    leyendo las cabeceras X-RateLimit-* / X-ReadRateLimit-* de cada respuesta.
+    Es seguro entre hilos: cuando se alcanza el margen de una cuota, todas las
+    peticiones se pausan hasta que la ventana correspondiente se reinicia.
+    """
+
+    def __init__(self, margen=0.95):
+        self.margen = margen
+        self.limite_15min = None
+        self.limite_diario = None
+        self.uso_15min = 0
+        self.uso_diario = 0
+        self.pausado_hasta = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _leer_pareja(valor):
+        """
+        Convierte una cabecera del tipo '100,1000' en (100, 1000).
+        """
+        try:
+            corto, largo = (int(x) for x in valor.split(','))
+            return corto, largo
+        except (AttributeError, ValueError):
+            return None
+
+    @staticmethod
+    def _siguiente_ventana_15min(ahora):
+        """
+        Las ventanas de 15 minutos de Strava se reinician en :00, :15, :30 y :45.
+        """
+        inicio = ahora.replace(minute=(ahora.minute // 15) * 15, second=0, microsecond=0)
+        return inicio + timedelta(minutes=15)
+
+    @staticmethod
+    def _siguiente_dia(ahora):
+        """
+        La cuota diaria se reinicia a medianoche UTC.
+        """
+        return ahora.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+    def actualizar(self, cabeceras):
+        """
+        Actualiza el uso con las cabeceras de una respuesta y programa una pausa
+        si alguna de las cuotas está cerca de agotarse.
+        """
+        # Las cuotas de lectura (más estrictas) se aplican a las peticiones GET
+        limite = self._leer_pareja(cabeceras.get('X-ReadRateLimit-Limit')) \
+            or self._leer_pareja(cabeceras.get('X-RateLimit-Limit'))
+        uso = self._leer_pareja(cabeceras.get('X-ReadRateLimit-Usage')) \
+            or self._leer_pareja(cabeceras.get('X-RateLimit-Usage'))
+        if not limite or not uso:
+            return
+
+        with self._lock:
+            self.limite_15min, self.limite_diario = limite
+            self.uso_15min, self.uso_diario = uso
+            ahora = datetime.now(timezone.utc)
+            if self.uso_diario >= self.limite_diario * self.margen:
+                self._pausar_hasta(self._siguiente_dia(ahora), "cuota diaria")
+            elif self.uso_15min >= self.limite_15min * self.margen:
+                self._pausar_hasta(self._siguiente_ventana_15min(ahora), "cuota de 15 minutos")
+
+    def pausar_por_429(self):
+        """
+        Strava ha respondido 429: se pausa hasta la siguiente ventana de 15 minutos
+        (o hasta el día siguiente si la cuota diaria está agotada).
+        """
+        with self._lock:
+            ahora = datetime.now(timezone.utc)
+            if self.limite_diario and self.uso_diario >= self.limite_diario:
+                self._pausar_hasta(self._siguiente_dia(ahora), "cuota diaria (429)")
+            else:
+                self._pausar_hasta(self._siguiente_ventana_15min(ahora), "límite de peticiones (429)")
+
+    def _pausar_hasta(self, momento, motivo):
+        # Se añade un pequeño margen por desfases de reloj con Strava
+        objetivo = momento.timestamp() + 5
+        if objetivo > self.pausado_hasta:
+            self.pausado_hasta = objetivo
+            print(f"⏸️  {motivo} alcanzada: pausa hasta {momento.strftime('%H:%M:%S')} UTC")
+
+    def esperar(self):
+        """
+        Bloquea el hilo actual mientras haya una pausa activa.
+        """
+        while True:
+            restante = self.pausado_hasta - time.time()
+            if restante <= 0:
+                return
+            time.sleep(min(restante, 30))
+
+
+def cabeceras_autorizacion(access_token):
+    """
+    Cabeceras de autenticación para peticion_get. `access_token` es el token
+    o una función que lo devuelve (ClienteStrava.obtener_token); en ese caso
+    se devuelve también una función, para que el token se pida en cada
+    intento y un proceso largo lo refresque cuando caduque.
+    """
+    if callable(access_token):
+        return lambda: {'Authorization': f"Bearer {access_token()}"}
+    return {'Authorization': f"Bearer {access_token}"}
+
+
+def peticion_get(url, headers, params=None, limitador=None, intentos=3, timeout=30, stream=False):
+    """
+    Hace un GET a Strava respetando el limitador de tasa (si se indica).
+    Ante un 429 pausa y reintenta en lugar de fallar. Con `stream` el cuerpo
+    no se descarga hasta que se lee (iter_content). `headers` puede ser una
+    función (cabeceras_autorizacion): se evalúa después de cada pausa del
+    limitador, que puede durar hasta la medianoche UTC.
+    """
+    response = None
+    for _ in range(intentos):
+        if limitador:
+            limitador.esperar()
+        cabeceras = headers() if callable(headers) else headers
+        response = obtener_sesion().get(url, headers=cabeceras, params=params, timeout=timeout, stream=stream)
+        if limitador:
+            limitador.actualizar(response.headers)
+        if response.status_code != 429:
+            return response
+        response.close()
+        if limitador:
+            limitador.pausar_por_429()
+        else:
+            time.sleep(60)
+    return response
+
+
+class CacheTokens:
+    """
+    Caché de access tokens por usuario, en memoria y en disco, para reutilizar
+    el token hasta su expires_at en lugar de refrescarlo en cada ejecución.
+    """
+
+    def __init__(self, ruta="data/.tokens_strava.json"):
+        self.ruta = ruta
+        self._tokens = None
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        if self._tokens is None:
+            self._tokens = {}
+            if os.path.exists(self.ruta):
+                try:
+                    with open(self.ruta, encoding="utf-8") as f:
+                        self._tokens = json.load(f)
+                except (OSError, ValueError):
+                    self._tokens = {}
+        return self._tokens
+
+    def obtener(self, usuario):
+        """
+        Devuelve los datos del token del usuario si sigue siendo válido, o None.
+        """
+        with self._lock:
+            datos = self._cargar().get(usuario)
+        if datos and datos.get('expires_at', 0) - MARGEN_EXPIRACION > time.time():
+            return datos
+        return None
+
+    def refresh_token(self, usuario):
+        """
+        Devuelve el último refresh token recibido de Strava para el usuario (si lo hay).
+        """
+        with self._lock:
+            return self._cargar().get(usuario, {}).get('refresh_token')
+
+    def guardar(self, usuario, datos):
+        with self._lock:
+            tokens = self._cargar()
+            tokens[usuario] = {
+                'access_token': datos['access_token'],
+                'refresh_token': datos.get('refresh_token'),
+                'expires_at': datos.get('expires_at', 0)
+            }
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            temporal = self.ruta + ".tmp"
+            # El fichero contiene credenciales: solo legible por el propietario
+            fd = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(tokens, f)
+            os.replace(temporal, self.ruta)
+
+
+_cache_tokens = CacheTokens()
+
+
+class ClienteStrava:
+    """
+    Cliente reutilizable de la API de Strava para un usuario: sesión HTTP
+    compartida, token cacheado hasta su caducidad y limitador de tasa opcional.
+    """
+
+    def __init__(self, usuario, client_id, client_secret, refresh_token, limitador=None, cache=None):
+        self.usuario = usuario
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.limitador = limitador
+        self.cache = cache or _cache_tokens
+        self._lock = threading.Lock()
+
+    def obtener_token(self):
+        """
+        Devuelve un access token válido, refrescándolo solo si el cacheado ha caducado.
+        """
+        with self._lock:
+            datos = self.cache.obtener(self.usuario)
+            if datos:
+                return datos['access_token']
+            return self._refrescar_token()
+
+    def _refrescar_token(self):
+        """
+        Pide un access token nuevo a Strava y lo guarda en la caché.
+        """
+        print(f"🔄 Refrescando token de Strava para {self.usuario}...")
+        payload = {
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+            # Strava puede rotar el refresh token: se usa el último recibido
+            'refresh_token': self.cache.refresh_token(self.usuario) or self.refresh_token,
+            'grant_type': 'refresh_token',
+            'f': 'json'
+        }
+        with medir("token_refresco", usuario=self.usuario):
+            res = obtener_sesion().post(STRAVA_AUTH_URL, data=payload, timeout=30)
+        registrar_descarga("token", len(res.content))
+        res.raise_for_status()
+        datos = res.json()
+        self.cache.guardar(self.usuario, datos)
+        return datos['access_token']
+
+    def get(self, ruta, params=None):
+        """
+        GET autenticado sobre la API (ruta relativa a STRAVA_API_URL o URL completa).
+        """
+        url = ruta if ruta.startswith("http") else f"{STRAVA_API_URL}{ruta}"
+        return peticion_get(url, cabeceras_autorizacion(self.obtener_token), params=params,
+                            limitador=self.limitador)
@@ -0,0 +1,200 @@
+"""
+Constructor de consultas parametrizadas para InfluxDB (SQL e InfluxQL)
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Las consultas se componen encadenando métodos; cada uno devuelve una copia,
+así que una consulta base se puede reutilizar con filtros distintos:
+
+    base = Consulta("Run").columnas("heartrate", "watts", "id_actividad")
+    alba = base.donde(usuario="Alba").entre("2025-01-01", "2025-03-01")
+    varias = base.donde(id_actividad=ids)          # 50 actividades, una consulta
+
+    tabla = varias.ejecutar(client, database)                  # pyarrow.Table
+    df = varias.ejecutar(client, database, formato="pandas")
+
+Los valores de los filtros nunca se interpolan en el texto: viajan como
+parámetros de la consulta ($p0, $p1...) y los nombres de tablas y columnas se
+escapan como identificadores. Las fechas se normalizan a RFC 3339 antes de
+escribirlas, por lo que tampoco admiten texto arbitrario.
+"""
+
+from cache_consultas import consulta_cacheada
+
+LENGUAJES = ("sql", "influxql")
+FORMATOS = ("arrow", "pandas", "polars")
+
+
+def identificador(nombre, lenguaje="sql"):
+    """
+    Escapa un nombre de tabla o columna entre comillas dobles.
+    """
+    if lenguaje == "sql":
+        return '"' + str(nombre).replace('"', '""') + '"'
+    return '"' + str(nombre).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def fecha_rfc3339(valor):
+    """
+    Normaliza una fecha (texto, datetime o Timestamp; UTC si no tiene zona)
+    al literal 'AAAA-MM-DDTHH:MM:SS.fffffffffZ'.
+    """
+    import pandas as pd
+
+    marca = pd.Timestamp(valor)
+    marca = marca.tz_localize("UTC") if marca.tzinfo is None else marca.tz_convert("UTC")
+    return marca.strftime("%Y-%m-%dT%H:%M:%S.") + f"{marca.microsecond * 1000 + marca.nanosecond:09d}Z"
+
+
+class Consulta:
+    """
+    Consulta sobre un measurement: proyección, filtros por tag (valor o
+    lista), rango de tiempo, orden y límite.
+    """
+
+    def __init__(self, measurement):
+        self.measurement = measurement
+        self._columnas = None
+        self._filtros = {}
+        self._desde = None
+        self._hasta = None
+        self._descendente = False
+        self._limite = None
+
+    def _copia(self, **cambios):
+        nueva = Consulta(self.measurement)
+        nueva.__dict__.update(self.__dict__)
+        nueva._filtros = dict(self._filtros)
+        nueva.__dict__.update(cambios)
+        return nueva
+
+    # --- composición ---
+
+    def columnas(self, *nombres):
+        """
+        Limita las columnas devueltas (por defecto, todas). `time` se
+        incluye siempre.
+        """
+        if len(nombres) == 1 and isinstance(nombres[0], (list, tuple)):
+            nombres = nombres[0]
+        return self._copia(_columnas=[c for c in nombres if c != "time"] or None)
+
+    def donde(self, **filtros):
+        """
+        Añade filtros tag=valor. Con una lista de valores el filtro es un IN
+        (en InfluxQL, igualdades unidas con OR). None elimina el filtro.
+        """
+        nueva = self._copia()
+        for tag, valor in filtros.items():
+            if valor is None:
+                nueva._filtros.pop(tag, None)
+            elif isinstance(valor, (list, tuple, set)):
+                nueva._filtros[tag] = [str(v) for v in valor]
+            else:
+                nueva._filtros[tag] = str(valor)
+        return nueva
+
+    def entre(self, desde=None, hasta=None):
+        """
+        Rango de tiempo [desde, hasta]; cualquiera de los extremos puede ser None.
+        """
+        return self._copia(_desde=fecha_rfc3339(desde) if desde is not None else None,
+                           _hasta=fecha_rfc3339(hasta) if hasta is not None else None)
+
+    def ordenar(self, descendente=False):
+        return self._copia(_descendente=descendente)
+
+    def limite(self, filas):
+        return self._copia(_limite=int(filas) if filas else None)
+
+    # --- compilación ---
+
+    def compilar(self, lenguaje="sql"):
+        """
+        Devuelve (texto de la consulta, parámetros) en el lenguaje indicado.
+        """
+        if lenguaje not in LENGUAJES:
+            raise ValueError(f"Lenguaje no soportado: {lenguaje} (usa {', '.join(LENGUAJES)})")
+
+        if self._columnas:
+            seleccion = ", ".join(identificador(c, lenguaje) for c in ["time"] + self._columnas)
+        else:
+            seleccion = "*"
+
+        parametros = {}
+        condiciones = []
+
+        def parametro(valor):
+            nombre = f"p{len(parametros)}"
+            parametros[nombre] = valor
+            return f"${nombre}"
+
+        for tag, valor in self._filtros.items():
+            columna = identificador(tag, lenguaje)
+            if isinstance(valor, list):
+                if not valor:
+                    condiciones.append("false" if lenguaje == "sql" else "1 = 0")
+                elif lenguaje == "sql":
+                    condiciones.append(f"{columna} IN ({', '.join(parametro(v) for v in valor)})")
+                else:
+                    # InfluxQL no tiene IN: igualdades unidas con OR
+                    alternativas = " OR ".join(f"{columna} = {parametro(v)}" for v in valor)
+                    condiciones.append(f"({alternativas})")
+            else:
+                condiciones.append(f"{columna} = {parametro(valor)}")
+        if self._desde:
+            condiciones.append(f"time >= '{self._desde}'")
+        if self._hasta:
+            condiciones.append(f"time <= '{self._hasta}'")
+
+        texto = f"SELECT {seleccion} FROM {identificador(self.measurement, lenguaje)}"
+        if condiciones:
+            texto += " WHERE " + " AND ".join(condiciones)
+        texto += " ORDER BY time DESC" if self._descendente else " ORDER BY time ASC"
+        if self._limite:
+            texto += f" LIMIT {self._limite}"
+        return texto, parametros
+
+    # --- ejecución ---
+
+    def ejecutar(self, client, database, lenguaje="sql", formato="arrow", cache=True):
+        """
+        Ejecuta la consulta en un único viaje a InfluxDB. Devuelve la tabla
+        Arrow tal como llega por Flight (sin copias), o un DataFrame de
+        pandas o polars según `formato`. Con `cache` pasa por la caché de
+        consultas.
+        """
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato no soportado: {formato} (usa {', '.join(FORMATOS)})")
+        texto, parametros = self.compilar(lenguaje)
+        if cache:
+            tabla = consulta_cacheada(client, texto, database, lenguaje, parametros=parametros)
+        else:
+            tabla = client.query(query=texto, database=database, language=lenguaje,
+                                 query_parameters=parametros)
+        return convertir(tabla, formato)
+
+    def lector(self, client, database, lenguaje="sql"):
+        """
+        Devuelve un RecordBatchReader para recorrer el resultado por lotes
+        sin materializarlo.
+        """
+        texto, parametros = self.compilar(lenguaje)
+        return client.query(query=texto, database=database, language=lenguaje, mode="reader",
+                            query_parameters=parametros)
+
+    def __repr__(self):
+        return f"Consulta({self.compilar()[0]!r})"
+
+
+def convertir(tabla, formato="arrow"):
+    """
+    Convierte una tabla Arrow al formato pedido. polars reutiliza los
+    buffers de Arrow; pandas copia las columnas a NumPy.
+    """
+    if formato == "pandas":
+        return tabla.to_pandas()
+    if formato == "polars":
+        import polars
+        return polars.from_arrow(tabla)
+    return tabla
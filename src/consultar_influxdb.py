@@ -2,17 +2,27 @@
 Script para consultar y verificar datos en InfluxDB
 Autores: Alba y Alonso
 Fecha: 2025-12-24
+
+influxdb_client_3, pyarrow y pandas se importan al usarse, no al cargar el
+módulo: las estadísticas no necesitan pandas y cli.py importa estas
+funciones sin pagar el arranque de todo el cliente.
 """
 
 import os
 from dotenv import load_dotenv
-from influxdb_client_3 import InfluxDBClient3
-import pandas as pd
+
+from agregados import CAMPOS_AGREGADOS, PUNTOS_MAXIMOS, columnas_agregadas, elegir_resolucion, measurement_agregado
+from cache_consultas import consulta_cacheada, estadisticas_cache
+from constructor_consultas import Consulta, fecha_rfc3339
+from esquema_influx import esquema_actual
+from metricas import consulta
+from registro_usuarios import elegir_usuario
 
 # Cargar variables de entorno1
 load_dotenv()
 
 
+@consulta
 def listar_measurements(client, database):
     """
     Lista todos los measurements (tablas) disponibles en la base de datos.
@@ -21,7 +31,7 @@ def listar_measurements(client, database):
     SHOW MEASUREMENTS
     """
     try:
-        table = client.query(query=query, database=database, language='influxql')
+        table = consulta_cacheada(client, query, database)
         df = table.to_pandas()
         return df
     except Exception as e:
@@ -29,26 +39,13 @@ def listar_measurements(client, database):
         return None
 
 
-def consultar_datos(client, measurement, database, limit=None):
+def _consultar(client, consulta_influx, database, mensaje):
     """
-    Consulta todos los datos de un measurement específico.
+    Ejecuta una Consulta (InfluxQL, con caché) y devuelve un DataFrame, o None si falla.
     """
-    if limit:
-        query = f"""
-        SELECT * FROM "{measurement}"
-        ORDER BY time DESC
-        LIMIT {limit}
-        """
-    else:
-        query = f"""
-        SELECT * FROM "{measurement}"
-        ORDER BY time DESC
-        """
-    
     try:
-        print(f"\n⏳ Consultando datos de la tabla '{measurement}'...")
-        table = client.query(query=query, database=database, language='influxql')
-        df = table.to_pandas()
+        print(f"\n⏳ {mensaje}...")
+        df = consulta_influx.ejecutar(client, database, lenguaje="influxql", formato="pandas")
         print(f"✅ Se encontraron {len(df)} registros")
         return df
     except Exception as e:
@@ -56,56 +53,202 @@ def consultar_datos(client, measurement, database, limit=None):
         return None
 
 
-def consultar_por_usuario(client, measurement, usuario, database, limit=None):
+def acotar_a_actividades(client, database, filtros=None, desde=None, hasta=None):
     """
-    Consulta datos filtrados por usuario.
+    Con el esquema compacto id_actividad es un field: si `filtros` lo trae,
+    se leen en el Resumen el usuario y el rango de tiempo de esas
+    actividades y se añaden a la consulta, para que InfluxDB no recorra la
+    tabla entera comparando el field. Devuelve (filtros, desde, hasta); sin
+    cambios con el esquema clásico o si el Resumen no tiene todas las
+    actividades.
     """
-    if limit:
-        query = f"""
-        SELECT * FROM "{measurement}"
-        WHERE "usuario" = '{usuario}'
-        ORDER BY time DESC
-        LIMIT {limit}
-        """
-    else:
-        query = f"""
-        SELECT * FROM "{measurement}"
-        WHERE "usuario" = '{usuario}'
-        ORDER BY time DESC
-        """
-    
+    filtros = dict(filtros or {})
+    ids = filtros.get('id_actividad')
+    if ids is None or esquema_actual() != 'compacto':
+        return filtros, desde, hasta
+    ids = [str(i) for i in ids] if isinstance(ids, (list, tuple, set)) else [str(ids)]
+
+    import pandas as pd
+
+    from resumen_actividad import MEASUREMENT_RESUMEN
+
+    consulta_resumen = (Consulta(MEASUREMENT_RESUMEN).columnas("fecha_fin", "usuario", "id_actividad")
+                        .donde(id_actividad=ids, usuario=filtros.get('usuario')))
     try:
-        print(f"\n⏳ Consultando datos de {usuario} en '{measurement}'...")
-        table = client.query(query=query, database=database, language='influxql')
-        df = table.to_pandas()
-        print(f"✅ Se encontraron {len(df)} registros")
-        return df
+        resumen = consulta_resumen.ejecutar(client, database, lenguaje="influxql", formato="pandas")
     except Exception as e:
-        print(f"❌ Error al consultar datos: {e}")
-        return None
+        print(f"⚠️  No se pudo leer el rango de las actividades en el Resumen: {e}")
+        return filtros, desde, hasta
+    if not {'fecha_fin', 'id_actividad'} <= set(resumen.columns) or resumen['id_actividad'].nunique() < len(set(ids)):
+        return filtros, desde, hasta
+
+    # Las fechas RFC 3339 normalizadas se ordenan como texto
+    inicio = fecha_rfc3339(pd.to_datetime(resumen['time']).min())
+    fin = fecha_rfc3339(pd.to_datetime(resumen['fecha_fin']).max())
+    if desde is not None:
+        inicio = max(inicio, fecha_rfc3339(desde))
+    if hasta is not None:
+        fin = min(fin, fecha_rfc3339(hasta))
+    if filtros.get('usuario') is None:
+        filtros['usuario'] = sorted(resumen['usuario'].unique())
+    return filtros, inicio, fin
+
+
+@consulta
+def consultar_datos(client, measurement, database, limit=None):
+    """
+    Consulta todos los datos de un measurement específico.
+    """
+    consulta_influx = Consulta(measurement).ordenar(descendente=True).limite(limit)
+    return _consultar(client, consulta_influx, database, f"Consultando datos de la tabla '{measurement}'")
 
 
+@consulta
+def consultar_por_usuario(client, measurement, usuario, database, limit=None):
+    """
+    Consulta datos filtrados por usuario.
+    """
+    consulta_influx = Consulta(measurement).donde(usuario=usuario).ordenar(descendente=True).limite(limit)
+    return _consultar(client, consulta_influx, database, f"Consultando datos de {usuario} en '{measurement}'")
+
+
+@consulta
 def consultar_por_actividad(client, measurement, id_actividad, database):
     """
     Consulta datos de una actividad específica.
     """
-    query = f"""
-    SELECT * FROM "{measurement}"
-    WHERE "id_actividad" = '{id_actividad}'
-    ORDER BY time DESC
+    filtros, desde, hasta = acotar_a_actividades(client, database, {'id_actividad': id_actividad})
+    consulta_influx = Consulta(measurement).donde(**filtros).entre(desde, hasta).ordenar(descendente=True)
+    return _consultar(client, consulta_influx, database, f"Consultando actividad {id_actividad} en '{measurement}'")
+
+
+@consulta
+def consultar_actividades(client, measurement, database, ids=None, usuarios=None, desde=None, hasta=None,
+                          columnas=None, lenguaje="sql", formato="arrow"):
     """
-    
+    Trae varias actividades y/o usuarios en un único viaje a InfluxDB (IN de
+    ids y usuarios, rango de tiempo y proyección de columnas), p. ej. para
+    comparar 50 actividades sin lanzar 50 consultas. Devuelve una tabla Arrow
+    o, con `formato`, un DataFrame de pandas o polars.
+    """
+    filtros, desde, hasta = acotar_a_actividades(client, database, {'id_actividad': ids, 'usuario': usuarios},
+                                                 desde, hasta)
+    consulta_influx = Consulta(measurement).donde(**filtros).entre(desde, hasta)
+    if columnas:
+        consulta_influx = consulta_influx.columnas(columnas)
+    return consulta_influx.ejecutar(client, database, lenguaje=lenguaje, formato=formato)
+
+
+def construir_consulta_streaming(measurement, columnas=None, filtros=None, desde=None, hasta=None, limite=None):
+    """
+    Construye la Consulta con proyección de columnas, filtros por tag
+    (diccionario tag -> valor o lista de valores), rango de tiempo (ISO 8601)
+    y límite opcional, de la más reciente a la más antigua.
+    """
+    consulta_influx = Consulta(measurement).donde(**(filtros or {})).entre(desde, hasta)
+    if columnas:
+        consulta_influx = consulta_influx.columnas(columnas)
+    return consulta_influx.ordenar(descendente=True).limite(limite)
+
+
+def _abrir_exportacion(archivo_salida, schema):
+    """
+    Abre un escritor incremental (CSV o Parquet según la extensión).
+    """
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    directorio = os.path.dirname(archivo_salida)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    if archivo_salida.endswith(".parquet"):
+        return pq.ParquetWriter(archivo_salida, schema, compression="zstd")
+    return pa_csv.CSVWriter(archivo_salida, schema)
+
+
+@consulta
+def consultar_en_streaming(client, measurement, database, columnas=None, filtros=None,
+                           desde=None, hasta=None, max_filas=20, archivo_salida=None):
+    """
+    Consulta iterando los record batches de Arrow sin materializar el resultado.
+    Sin `archivo_salida` la consulta se limita a `max_filas` y se detiene en cuanto
+    las tiene. Con `archivo_salida` (.csv o .parquet) se recorre el resultado
+    completo escribiéndolo lote a lote, con memoria acotada a un lote.
+    Devuelve (DataFrame con las primeras `max_filas` filas, filas leídas).
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    limite = None if archivo_salida else max_filas
+    filtros, desde, hasta = acotar_a_actividades(client, database, filtros, desde, hasta)
+    consulta_influx = construir_consulta_streaming(measurement, columnas, filtros, desde, hasta, limite)
+
+    primeros = []
+    filas_vista = 0
+    total = 0
+    escritor = None
     try:
-        print(f"\n⏳ Consultando actividad {id_actividad} en '{measurement}'...")
-        table = client.query(query=query, database=database, language='influxql')
-        df = table.to_pandas()
+        print(f"\n⏳ Consultando '{measurement}' en streaming...")
+        reader = consulta_influx.lector(client, database, lenguaje="influxql")
+        for batch in reader:
+            if filas_vista < max_filas:
+                primeros.append(batch.slice(0, max_filas - filas_vista))
+                filas_vista += primeros[-1].num_rows
+            total += batch.num_rows
+            if archivo_salida:
+                if escritor is None:
+                    escritor = _abrir_exportacion(archivo_salida, batch.schema)
+                escritor.write_batch(batch)
+            elif filas_vista >= max_filas:
+                break
+        if archivo_salida:
+            print(f"✅ {total} registros exportados a: {archivo_salida}")
+        else:
+            print(f"✅ Se leyeron {total} registros")
+    except Exception as e:
+        print(f"❌ Error al consultar datos: {e}")
+        return None, total
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+    if not primeros:
+        return pd.DataFrame(), total
+    return pa.Table.from_batches(primeros).to_pandas(), total
+
+
+@consulta
+def consultar_por_resolucion(client, tipo_actividad, database, desde, hasta=None, campos=None,
+                             filtros=None, max_puntos=PUNTOS_MAXIMOS):
+    """
+    Consulta un rango de tiempo en la resolución adecuada: los datos a 1 Hz si
+    el rango cabe en `max_puntos` y, si no, la tabla de agregados más fina que
+    no supera ese número de puntos por serie (<Tipo>_10s, _1m o _1h).
+    `campos` son columnas de los streams (heartrate, watts...); en los
+    agregados se devuelven sus columnas _media, _min y _max y `muestras`.
+    Devuelve (DataFrame, resolución), con resolución None para los datos a 1 Hz.
+    """
+    campos = campos or CAMPOS_AGREGADOS
+    filtros, desde, hasta = acotar_a_actividades(client, database, filtros, desde, hasta)
+    resolucion = elegir_resolucion(desde, hasta, max_puntos)
+    if resolucion is None:
+        measurement, columnas = tipo_actividad, list(campos)
+    else:
+        measurement, columnas = measurement_agregado(tipo_actividad, resolucion), columnas_agregadas(campos)
+    consulta_influx = construir_consulta_streaming(measurement, columnas + ["usuario", "id_actividad"],
+                                                   filtros, desde, hasta)
+
+    try:
+        print(f"\n⏳ Consultando '{measurement}' ({resolucion or '1s'})...")
+        df = consulta_influx.ejecutar(client, database, lenguaje="influxql", formato="pandas")
         print(f"✅ Se encontraron {len(df)} registros")
-        return df
+        return df, resolucion
     except Exception as e:
         print(f"❌ Error al consultar datos: {e}")
-        return None
+        return None, resolucion
 
 
+@consulta
 def estadisticas_base_datos(client, database):
     """
     Muestra estadísticas generales de la base de datos.
@@ -121,14 +264,16 @@ def estadisticas_base_datos(client, database):
         SELECT COUNT(*) FROM "{measurement}"
         """
         try:
-            table = client.query(query=query, database=database, language='influxql')
-            df = table.to_pandas()
-            if not df.empty:
-                count = df.iloc[0]['count']
+            table = consulta_cacheada(client, query, database)
+            if table.num_rows:
+                count = table.column('count')[0].as_py()
                 print(f"📊 {measurement}: {count} registros")
         except:
             print(f"📊 {measurement}: 0 registros (tabla vacía o no existe)")
     
+    cache = estadisticas_cache()
+    print(f"\n🗄️  Caché de consultas: {cache['aciertos']} aciertos, {cache['fallos']} fallos, "
+          f"{cache['entradas']} entradas ({cache['bytes'] / 1024:.1f} KB)")
     print("\n" + "="*60)
 
 
@@ -153,6 +298,7 @@ def main():
     
     # Crear conexión a InfluxDB
     try:
+        from influxdb_client_3 import InfluxDBClient3
         client = InfluxDBClient3(host=influx_host, token=influx_token, org=influx_org, database=influx_database)
         print("✅ Conectado a InfluxDB exitosamente\n")
     except Exception as e:
@@ -170,15 +316,20 @@ def main():
         print("3. Consultar tabla Swimming")
         print("4. Consultar por usuario específico")
         print("5. Consultar por ID de actividad")
-        print("6. Ver estadísticas actualizadas")
-        print("7. Salir")
+        print("6. Consulta avanzada (columnas, fechas y exportación en streaming)")
+        print("7. Ver estadísticas actualizadas")
+        print("8. Salir")
         
-        opcion = input("\nSelecciona una opción (1-7): ").strip()
+        opcion = input("\nSelecciona una opción (1-8): ").strip()
         
         if opcion == '1':
-            limit_str = input("¿Cuántos registros quieres ver? (Enter para todos): ").strip()
+            limit_str = input("¿Cuántos registros quieres ver? (Enter para vista previa): ").strip()
             limit = int(limit_str) if limit_str.isdigit() else None
-            df = consultar_datos(client, 'Run', influx_database, limit)
+            if limit:
+                df = consultar_datos(client, 'Run', influx_database, limit)
+            else:
+                # Sin límite: vista previa en streaming, sin cargar toda la tabla
+                df, _ = consultar_en_streaming(client, 'Run', influx_database)
             if df is not None and not df.empty:
                 print("\n" + "="*60)
                 print(f"📊 Primeros registros de Run:")
@@ -188,9 +339,13 @@ def main():
                 print(df.info())
                 
         elif opcion == '2':
-            limit_str = input("¿Cuántos registros quieres ver? (Enter para todos): ").strip()
+            limit_str = input("¿Cuántos registros quieres ver? (Enter para vista previa): ").strip()
             limit = int(limit_str) if limit_str.isdigit() else None
-            df = consultar_datos(client, 'Cycling', influx_database, limit)
+            if limit:
+                df = consultar_datos(client, 'Cycling', influx_database, limit)
+            else:
+                # Sin límite: vista previa en streaming, sin cargar toda la tabla
+                df, _ = consultar_en_streaming(client, 'Cycling', influx_database)
             if df is not None and not df.empty:
                 print("\n" + "="*60)
                 print(f"📊 Primeros registros de Cycling:")
@@ -200,9 +355,13 @@ def main():
                 print(df.info())
                 
         elif opcion == '3':
-            limit_str = input("¿Cuántos registros quieres ver? (Enter para todos): ").strip()
+            limit_str = input("¿Cuántos registros quieres ver? (Enter para vista previa): ").strip()
             limit = int(limit_str) if limit_str.isdigit() else None
-            df = consultar_datos(client, 'Swimming', influx_database, limit)
+            if limit:
+                df = consultar_datos(client, 'Swimming', influx_database, limit)
+            else:
+                # Sin límite: vista previa en streaming, sin cargar toda la tabla
+                df, _ = consultar_en_streaming(client, 'Swimming', influx_database)
             if df is not None and not df.empty:
                 print("\n" + "="*60)
                 print(f"📊 Primeros registros de Swimming:")
@@ -212,11 +371,10 @@ def main():
                 print(df.info())
                 
         elif opcion == '4':
-            print("\n👤 Selecciona el usuario:")
-            print("1. Alba")
-            print("2. Alonso")
-            user_opcion = input("Selecciona 1 o 2: ").strip()
-            usuario = 'Alba' if user_opcion == '1' else 'Alonso'
+            print()
+            usuario = elegir_usuario()
+            if usuario is None:
+                continue
             
             print("\n🏃 Selecciona el tipo de actividad:")
             print("1. Run")
@@ -225,10 +383,13 @@ def main():
             tipo_opcion = input("Selecciona 1, 2 o 3: ").strip()
             measurement = {'1': 'Run', '2': 'Cycling', '3': 'Swimming'}.get(tipo_opcion, 'Run')
             
-            limit_str = input("¿Cuántos registros quieres ver? (Enter para todos): ").strip()
+            limit_str = input("¿Cuántos registros quieres ver? (Enter para vista previa): ").strip()
             limit = int(limit_str) if limit_str.isdigit() else None
             
-            df = consultar_por_usuario(client, measurement, usuario, influx_database, limit)
+            if limit:
+                df = consultar_por_usuario(client, measurement, usuario, influx_database, limit)
+            else:
+                df, _ = consultar_en_streaming(client, measurement, influx_database, filtros={'usuario': usuario})
             if df is not None and not df.empty:
                 print("\n" + "="*60)
                 print(f"📊 Datos de {usuario} en {measurement}:")
@@ -247,7 +408,7 @@ def main():
             tipo_opcion = input("Selecciona 1, 2 o 3: ").strip()
             measurement = {'1': 'Run', '2': 'Cycling', '3': 'Swimming'}.get(tipo_opcion, 'Run')
             
-            df = consultar_por_actividad(client, measurement, activity_id, influx_database)
+            df, _ = consultar_en_streaming(client, measurement, influx_database, filtros={'id_actividad': activity_id})
             if df is not None and not df.empty:
                 print("\n" + "="*60)
                 print(f"📊 Datos de la actividad {activity_id}:")
@@ -259,15 +420,39 @@ def main():
                 # Ofrecer exportar a CSV
                 exportar = input("\n¿Exportar estos datos a CSV? (S/N): ").strip().upper()
                 if exportar == 'S':
+                    # La exportación recorre la actividad completa lote a lote
                     filename = f"data/consulta_actividad_{activity_id}.csv"
-                    os.makedirs("data", exist_ok=True)
-                    df.to_csv(filename, index=False)
-                    print(f"✅ Datos exportados a: {filename}")
+                    consultar_en_streaming(client, measurement, influx_database,
+                                           filtros={'id_actividad': activity_id}, archivo_salida=filename)
                 
         elif opcion == '6':
-            estadisticas_base_datos(client, influx_database)
+            print("\n🏃 Selecciona el tipo de actividad:")
+            print("1. Run")
+            print("2. Cycling")
+            print("3. Swimming")
+            tipo_opcion = input("Selecciona 1, 2 o 3: ").strip()
+            measurement = {'1': 'Run', '2': 'Cycling', '3': 'Swimming'}.get(tipo_opcion, 'Run')
+            
+            columnas_str = input("Columnas separadas por comas (Enter para todas): ").strip()
+            columnas = [c.strip() for c in columnas_str.split(',') if c.strip()] or None
+            usuario = input("Usuario (Enter para todos): ").strip()
+            filtros = {'usuario': usuario} if usuario else None
+            desde = input("Desde (AAAA-MM-DDTHH:MM:SSZ, Enter sin límite): ").strip() or None
+            hasta = input("Hasta (AAAA-MM-DDTHH:MM:SSZ, Enter sin límite): ").strip() or None
+            archivo = input("Exportar a archivo .csv/.parquet (Enter para solo ver): ").strip() or None
+            
+            df, _ = consultar_en_streaming(client, measurement, influx_database, columnas, filtros,
+                                           desde, hasta, archivo_salida=archivo)
+            if df is not None and not df.empty:
+                print("\n" + "="*60)
+                print(f"📊 Primeros registros de {measurement}:")
+                print("="*60)
+                print(df.head(20))
             
         elif opcion == '7':
+            estadisticas_base_datos(client, influx_database)
+            
+        elif opcion == '8':
             print("\n👋 ¡Hasta pronto!")
             break
             
@@ -0,0 +1,402 @@
+"""
+Curvas de mejor esfuerzo (mean-maximal) de potencia, velocidad y FC
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Para cada actividad y cada duración de DURACIONES (de 1 s a 2 h) se calcula
+el mejor promedio de watts, velocity_smooth y heartrate en una ventana de esa
+duración. Las series se llevan a 1 muestra por segundo y cada duración se
+resuelve con sumas acumuladas: O(n) por ventana, sin recorrer cada ventana.
+
+- La curva de cada actividad se guarda en
+  data/curvas/<usuario>/actividades/<id>.parquet al guardarla en el almacén
+  local (almacen_local.guardar_actividad), igual que el índice espacial.
+- Las envolventes (mejor valor de cada duración entre todas las actividades,
+  con la actividad que lo consiguió) se guardan por usuario en
+  data/curvas/<usuario>/envolventes.parquet, por deporte y temporada (año de
+  inicio, y 'total' para todo el historial). Una actividad nueva solo se
+  fusiona con las dos envolventes que le afectan (máximo elemento a
+  elemento), así que actualizar los récords cuesta milisegundos.
+- Si una actividad se reescribe con datos peores y tenía algún récord, esa
+  envolvente se reconstruye desde las curvas guardadas, sin releer streams.
+
+    python src/curvas.py calcular                  # curvas y envolventes desde el almacén local
+    python src/curvas.py mostrar Alba --deporte Cycling --metrica watts --temporada 2025
+"""
+
+import argparse
+import glob
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+RUTA_CURVAS = os.getenv("CURVAS", "data/curvas/")
+
+METRICAS = ('watts', 'velocity_smooth', 'heartrate')
+
+# Cada segundo hasta 1 min, cada 5 s hasta 5 min, cada 30 s hasta 20 min,
+# cada minuto hasta 1 h y cada 5 min hasta 2 h
+DURACIONES = np.concatenate([
+    np.arange(1, 60),
+    np.arange(60, 300, 5),
+    np.arange(300, 1200, 30),
+    np.arange(1200, 3600, 60),
+    np.arange(3600, 7201, 300),
+]).astype(np.int32)
+
+# Huecos de hasta MAX_HUECO segundos (grabación inteligente) repiten la
+# última muestra; los más largos (pausas) cuentan como 0
+MAX_HUECO = 5
+
+TOTAL = "total"
+
+ESQUEMA_CURVA = pa.schema([
+    ('id_actividad', pa.string()),
+    ('usuario', pa.string()),
+    ('tipo_actividad', pa.string()),
+    ('fecha_inicio', pa.timestamp('ns')),
+    ('duraciones', pa.list_(pa.int32())),
+    *[(metrica, pa.list_(pa.float32())) for metrica in METRICAS],
+])
+
+ESQUEMA_ENVOLVENTE = pa.schema([
+    ('tipo_actividad', pa.string()),
+    ('temporada', pa.string()),
+    ('metrica', pa.string()),
+    ('duraciones', pa.list_(pa.int32())),
+    ('valores', pa.list_(pa.float32())),
+    ('ids', pa.list_(pa.string())),
+    ('fechas', pa.list_(pa.timestamp('ns'))),
+])
+
+# Las envolventes de un usuario se leen, fusionan y reescriben enteras: los
+# hilos de la carga masiva no deben pisarse
+_lock_envolventes = threading.Lock()
+
+
+# --- curvas de una actividad ---
+
+def serie_por_segundo(df, columna, max_hueco=MAX_HUECO):
+    """
+    Valores de `columna` en una rejilla de 1 s desde el inicio de la
+    actividad. Cada segundo toma la última muestra anterior si está a menos de
+    `max_hueco` segundos; si no (pausa) o es nula, vale 0.
+    """
+    if 'time' in df.columns:
+        segundos = df['time'].to_numpy(dtype=np.int64)
+    else:
+        segundos = df['timestamp_real'].to_numpy(dtype="datetime64[s]").astype(np.int64)
+    if len(segundos) == 0 or columna not in df.columns:
+        return np.zeros(0)
+    segundos = segundos - segundos[0]
+    valores = np.nan_to_num(df[columna].to_numpy(dtype=np.float64, na_value=np.nan))
+
+    rejilla = np.arange(segundos[-1] + 1)
+    anterior = np.searchsorted(segundos, rejilla, side="right") - 1
+    serie = valores[anterior]
+    serie[rejilla - segundos[anterior] > max_hueco] = 0.0
+    return serie
+
+
+def curva_media_maxima(serie, duraciones=DURACIONES):
+    """
+    Mejor promedio de `serie` (1 Hz) en ventanas de cada duración y el
+    segundo en que empieza. Las duraciones más largas que la serie quedan
+    en NaN (inicio -1).
+    """
+    valores = np.full(len(duraciones), np.nan)
+    inicios = np.full(len(duraciones), -1, dtype=np.int64)
+    suma = np.concatenate([[0.0], np.cumsum(serie)])
+    for i, duracion in enumerate(duraciones):
+        if duracion > len(serie):
+            break
+        medias = suma[duracion:] - suma[:-duracion]
+        inicios[i] = np.argmax(medias)
+        valores[i] = medias[inicios[i]] / duracion
+    return valores, inicios
+
+
+def curvas_actividad(df, metricas=METRICAS, duraciones=DURACIONES):
+    """
+    Curvas de una actividad: {métrica: array de len(duraciones)}. Las
+    métricas sin datos (p. ej. watts sin potenciómetro) quedan en NaN. Se
+    redondean a float32, la precisión con la que se guardan, para que al
+    comparar con las envolventes una misma curva no parezca distinta.
+    """
+    curvas = {}
+    for metrica in metricas:
+        serie = serie_por_segundo(df, metrica)
+        if not serie.any():
+            curvas[metrica] = np.full(len(duraciones), np.nan)
+            continue
+        valores, _ = curva_media_maxima(serie, duraciones)
+        curvas[metrica] = valores.astype(np.float32).astype(np.float64)
+    return curvas
+
+
+# --- almacenamiento ---
+
+def _ruta_usuario(usuario, ruta=RUTA_CURVAS):
+    return os.path.join(ruta, usuario)
+
+
+def _escribir(tabla, archivo):
+    os.makedirs(os.path.dirname(archivo), exist_ok=True)
+    temporal = archivo + ".tmp"
+    pq.write_table(tabla, temporal, compression="zstd")
+    os.replace(temporal, archivo)
+
+
+def guardar_curvas(curvas, usuario, id_actividad, tipo_actividad, fecha_inicio, ruta=RUTA_CURVAS):
+    """
+    Guarda (o sustituye) las curvas de una actividad.
+    """
+    fila = {
+        'id_actividad': [str(id_actividad)],
+        'usuario': [usuario],
+        'tipo_actividad': [tipo_actividad],
+        'fecha_inicio': [pd.Timestamp(fecha_inicio).as_unit('ns').value],
+        'duraciones': [DURACIONES],
+        **{metrica: [curvas[metrica].astype(np.float32)] for metrica in METRICAS},
+    }
+    archivo = os.path.join(_ruta_usuario(usuario, ruta), "actividades", f"{id_actividad}.parquet")
+    _escribir(pa.table(fila, schema=ESQUEMA_CURVA), archivo)
+
+
+def leer_curvas(usuario, filtro=None, ruta=RUTA_CURVAS):
+    """
+    Curvas guardadas de un usuario como tabla Arrow (una fila por actividad).
+    """
+    directorio = os.path.join(_ruta_usuario(usuario, ruta), "actividades")
+    if not os.path.isdir(directorio):
+        return ESQUEMA_CURVA.empty_table()
+    # Solo los *.parquet: los .tmp de una escritura en curso se ignoran
+    archivos = sorted(glob.glob(os.path.join(glob.escape(directorio), "*.parquet")))
+    dataset = ds.dataset(archivos, format="parquet", schema=ESQUEMA_CURVA)
+    return dataset.to_table(filter=filtro)
+
+
+def _curva_guardada(usuario, id_actividad, ruta=RUTA_CURVAS):
+    """
+    Curvas, deporte y fecha de inicio guardados de una actividad, o None.
+    """
+    archivo = os.path.join(_ruta_usuario(usuario, ruta), "actividades", f"{id_actividad}.parquet")
+    if not os.path.exists(archivo):
+        return None
+    tabla = pq.read_table(archivo, schema=ESQUEMA_CURVA)
+    guardada = {metrica: np.asarray(tabla[metrica][0].values, dtype=np.float64) for metrica in METRICAS}
+    guardada['tipo_actividad'] = tabla['tipo_actividad'][0].as_py()
+    guardada['fecha_inicio'] = tabla['fecha_inicio'][0].as_py()
+    return guardada
+
+
+def leer_envolventes(usuario, ruta=RUTA_CURVAS):
+    """
+    Envolventes de un usuario: {(tipo_actividad, temporada, métrica):
+    {'valores', 'ids', 'fechas'}} con arrays de len(DURACIONES). Si se
+    calcularon con otras duraciones se ignoran (curvas.py calcular).
+    """
+    archivo = os.path.join(_ruta_usuario(usuario, ruta), "envolventes.parquet")
+    if not os.path.exists(archivo):
+        return {}
+    tabla = pq.read_table(archivo, schema=ESQUEMA_ENVOLVENTE)
+    # Todas las filas se escriben a la vez con las mismas duraciones
+    if tabla.num_rows == 0 or not np.array_equal(tabla['duraciones'][0].values.to_numpy(), DURACIONES):
+        return {}
+
+    def filas(columna):
+        # Listas de longitud fija: se aplanan y se parten por filas
+        return tabla[columna].combine_chunks().flatten().to_numpy(zero_copy_only=False).reshape(tabla.num_rows, -1)
+
+    valores, ids, fechas = filas('valores'), filas('ids'), filas('fechas')
+    claves = zip(*(tabla[c].to_pylist() for c in ('tipo_actividad', 'temporada', 'metrica')))
+    return {
+        clave: {'valores': valores[i].astype(np.float64), 'ids': ids[i].copy(), 'fechas': fechas[i].copy()}
+        for i, clave in enumerate(claves)
+    }
+
+
+def guardar_envolventes(envolventes, usuario, ruta=RUTA_CURVAS):
+    claves = sorted(envolventes)
+    tabla = pa.table({
+        'tipo_actividad': [clave[0] for clave in claves],
+        'temporada': [clave[1] for clave in claves],
+        'metrica': [clave[2] for clave in claves],
+        'duraciones': [DURACIONES] * len(claves),
+        'valores': [envolventes[clave]['valores'].astype(np.float32) for clave in claves],
+        'ids': [envolventes[clave]['ids'].tolist() for clave in claves],
+        'fechas': [envolventes[clave]['fechas'] for clave in claves],
+    }, schema=ESQUEMA_ENVOLVENTE)
+    _escribir(tabla, os.path.join(_ruta_usuario(usuario, ruta), "envolventes.parquet"))
+
+
+# --- envolventes ---
+
+def temporadas(fecha_inicio):
+    """
+    Ámbitos de envolvente a los que contribuye una actividad.
+    """
+    return (TOTAL, str(pd.Timestamp(fecha_inicio).year))
+
+
+def fusionar(envolvente, valores, id_actividad, fecha_inicio):
+    """
+    Incorpora la curva de una actividad a una envolvente (o crea una nueva
+    si es None). Devuelve la envolvente y cuántas duraciones ha mejorado.
+    """
+    if envolvente is None:
+        envolvente = {
+            'valores': np.full(len(DURACIONES), np.nan),
+            'ids': np.full(len(DURACIONES), None, dtype=object),
+            'fechas': np.full(len(DURACIONES), np.datetime64("NaT"), dtype="datetime64[ns]"),
+        }
+    mejora = valores > np.nan_to_num(envolvente['valores'], nan=-np.inf)
+    envolvente['valores'][mejora] = valores[mejora]
+    envolvente['ids'][mejora] = str(id_actividad)
+    envolvente['fechas'][mejora] = np.datetime64(pd.Timestamp(fecha_inicio).as_unit('ns').value, "ns")
+    return envolvente, int(mejora.sum())
+
+
+def reconstruir_envolventes(usuario, ruta=RUTA_CURVAS):
+    """
+    Recalcula todas las envolventes de un usuario a partir de las curvas
+    guardadas de sus actividades (no relee los streams). Las curvas se leen
+    dentro del mismo lock que actualizar_curvas: una actualización
+    simultánea no puede quedar debajo de una reconstrucción con curvas más
+    antiguas.
+    """
+    with _lock_envolventes:
+        tabla = leer_curvas(usuario, ruta=ruta)
+        envolventes = {}
+        fechas = tabla['fecha_inicio'].to_numpy()
+        for i in np.argsort(fechas, kind="stable"):
+            # En orden cronológico: con empates se queda la primera actividad
+            fila = {c: tabla[c][i].as_py() for c in ('id_actividad', 'tipo_actividad', 'duraciones')}
+            if not np.array_equal(fila['duraciones'], DURACIONES):
+                continue
+            for temporada in temporadas(fechas[i]):
+                for metrica in METRICAS:
+                    valores = np.asarray(tabla[metrica][i].values, dtype=np.float64)
+                    clave = (fila['tipo_actividad'], temporada, metrica)
+                    envolventes[clave], _ = fusionar(envolventes.get(clave), valores, fila['id_actividad'],
+                                                     fechas[i])
+        guardar_envolventes(envolventes, usuario, ruta)
+    return envolventes
+
+
+def actualizar_curvas(df, usuario, id_actividad, tipo_actividad, ruta=RUTA_CURVAS):
+    """
+    Calcula y guarda las curvas de una actividad y las fusiona con las
+    envolventes del usuario. Devuelve las duraciones mejoradas por ámbito y
+    métrica, p. ej. {('total', 'watts'): 12}.
+    """
+    if len(df) == 0:
+        return {}
+    fecha_inicio = df['timestamp_real'].iloc[0]
+    curvas = curvas_actividad(df)
+    anterior = _curva_guardada(usuario, id_actividad, ruta)
+    guardar_curvas(curvas, usuario, id_actividad, tipo_actividad, fecha_inicio, ruta)
+
+    # Una versión anterior en otro deporte o temporada deja récords en
+    # envolventes que la nueva no toca: hay que reconstruir
+    reconstruir = anterior is not None and (
+        anterior['tipo_actividad'] != tipo_actividad
+        or temporadas(anterior['fecha_inicio']) != temporadas(fecha_inicio))
+    mejoras = {}
+    with _lock_envolventes:
+        envolventes = leer_envolventes(usuario, ruta)
+        for temporada in temporadas(fecha_inicio):
+            for metrica in METRICAS:
+                clave = (tipo_actividad, temporada, metrica)
+                envolvente = envolventes.get(clave)
+                if anterior is not None and envolvente is not None:
+                    # ¿Tenía récords que la nueva versión ya no alcanza?
+                    propios = envolvente['ids'] == str(id_actividad)
+                    reconstruir |= bool((propios & ~(curvas[metrica] >= envolvente['valores'])).any())
+                envolventes[clave], mejoras[(temporada, metrica)] = fusionar(
+                    envolvente, curvas[metrica], id_actividad, fecha_inicio)
+        if not reconstruir:
+            guardar_envolventes(envolventes, usuario, ruta)
+    if reconstruir:
+        reconstruir_envolventes(usuario, ruta)
+    return {clave: n for clave, n in mejoras.items() if n}
+
+
+def curva_usuario(usuario, tipo_actividad, metrica='watts', temporada=TOTAL, ruta=RUTA_CURVAS):
+    """
+    Envolvente de un usuario como DataFrame (duracion, valor, id_actividad,
+    fecha_inicio). Para velocity_smooth se añade el ritmo en min/km.
+    """
+    columnas = ['duracion', metrica, 'id_actividad', 'fecha_inicio']
+    envolvente = leer_envolventes(usuario, ruta).get((tipo_actividad, str(temporada), metrica))
+    if envolvente is None:
+        return pd.DataFrame(columns=columnas)
+    df = pd.DataFrame({
+        'duracion': DURACIONES,
+        metrica: envolvente['valores'],
+        'id_actividad': envolvente['ids'],
+        'fecha_inicio': envolvente['fechas'],
+    })
+    df = df[df[metrica].notna()].reset_index(drop=True)
+    if metrica == 'velocity_smooth':
+        with np.errstate(divide="ignore"):
+            df['ritmo_min_km'] = (1000.0 / df[metrica]) / 60.0
+    return df
+
+
+def calcular_historial(usuarios=None, ruta=RUTA_CURVAS):
+    """
+    Calcula las curvas de todas las actividades del almacén local y
+    reconstruye las envolventes. Solo hace falta para actividades guardadas
+    antes de que existieran las curvas o si cambian DURACIONES.
+    """
+    from almacen_local import iterar_actividades
+
+    columnas = ['timestamp_real', 'time', *METRICAS, 'id_actividad', 'usuario', 'tipo_actividad']
+    calculadas = 0
+    vistos = set()
+    for tipo in ('Run', 'Cycling', 'Swimming'):
+        # Una actividad cada vez para no cargar todo el almacén en memoria
+        for tabla in iterar_actividades(columnas=columnas, usuarios=usuarios, tipos=tipo):
+            actividad = tabla.to_pandas().sort_values('timestamp_real')
+            usuario = actividad['usuario'].iloc[0]
+            guardar_curvas(curvas_actividad(actividad), usuario, actividad['id_actividad'].iloc[0], tipo,
+                           actividad['timestamp_real'].iloc[0], ruta)
+            vistos.add(usuario)
+            calculadas += 1
+    for usuario in vistos:
+        reconstruir_envolventes(usuario, ruta)
+    return calculadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Curvas de mejor esfuerzo (potencia, velocidad, FC)")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    p_calcular = subparsers.add_parser("calcular", help="Curvas y envolventes desde el almacén local")
+    p_calcular.add_argument("usuarios", nargs="*")
+    p_mostrar = subparsers.add_parser("mostrar", help="Mejores marcas de un usuario por duración")
+    p_mostrar.add_argument("usuario")
+    p_mostrar.add_argument("--deporte", default="Cycling", choices=["Run", "Cycling", "Swimming"])
+    p_mostrar.add_argument("--metrica", default="watts", choices=METRICAS)
+    p_mostrar.add_argument("--temporada", default=TOTAL, help="año (p. ej. 2025) o 'total'")
+    args = parser.parse_args()
+
+    if args.comando == "calcular":
+        print(f"✅ Curvas de {calcular_historial(args.usuarios or None)} actividades en {RUTA_CURVAS}")
+        return
+    df = curva_usuario(args.usuario, args.deporte, args.metrica, args.temporada)
+    print(df.to_string() if not df.empty else "ℹ️  Sin resultados")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⏹️  Proceso interrumpido por el usuario.")
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
@@ -0,0 +1,317 @@
+"""
+Escritura en InfluxDB por lotes, con reintentos y spool en disco
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Los DataFrames se serializan a line protocol en lotes de `tamano_lote` puntos
+que se envían comprimidos con gzip a /api/v2/write. Los errores transitorios
+(red, 429, 5xx) se reintentan con backoff exponencial; si un lote no se puede
+enviar se guarda en el spool y se reenvía en la siguiente ejecución
+(reenviar_spool). Cada destino (host, organización y base de datos) tiene
+su propio directorio, data/spool/<database>_<hash>/, con un destino.json
+que lo describe: un lote solo se reenvía al destino para el que se
+escribió, aunque el mismo data/ lo usen procesos con bases de datos
+distintas (p. ej. migrar_esquema.py y main.py).
+
+Las escrituras son idempotentes: cada punto lleva un timestamp explícito
+(start_date + offset del stream) y tags deterministas, e InfluxDB sobrescribe
+los puntos con el mismo measurement, tags y timestamp. Reenviar un lote, o
+volver a subir una actividad, nunca crea duplicados. Lo que sí puede quedar
+son puntos de una versión anterior fuera del nuevo rango de tiempo (un stream
+que se acorta); esos se eliminan con `borrar` (/api/v2/delete).
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metricas import medir, registrar_escritura, registrar_evento
+
+RUTA_SPOOL = "data/spool/"
+TAMANO_LOTE = int(os.getenv("INFLUX_TAMANO_LOTE", "5000"))
+REINTENTOS = 4
+BACKOFF = 0.5
+
+# Códigos HTTP que merece la pena reintentar
+ESTADOS_TRANSITORIOS = {408, 429, 500, 502, 503, 504}
+# Errores de datos: el lote nunca se aceptará, no tiene sentido guardarlo
+ESTADOS_DEFINITIVOS = {400, 413, 422}
+
+
+class ErrorEscrituraDefinitivo(Exception):
+    """
+    InfluxDB ha rechazado el lote por su contenido.
+    """
+
+
+class EscritorInflux:
+    """
+    Escritor HTTP de line protocol con sesión compartida (keep-alive).
+    """
+
+    def __init__(self, host, token, org, database, tamano_lote=TAMANO_LOTE,
+                 reintentos=REINTENTOS, backoff=BACKOFF, ruta_spool=None):
+        self.url = f"{host.rstrip('/')}/api/v2/write"
+        self.url_borrado = f"{host.rstrip('/')}/api/v2/delete"
+        self.params = {'org': org, 'bucket': database, 'precision': "ns"}
+        self.headers = {
+            'Authorization': f"Token {token}",
+            'Content-Type': "text/plain; charset=utf-8",
+            'Content-Encoding': "gzip",
+        }
+        self.tamano_lote = tamano_lote
+        self.reintentos = reintentos
+        self.backoff = backoff
+        self.ruta_spool = ruta_spool or ruta_spool_destino(host, org, database)
+        self.destino = {'host': host, 'org': org, 'database': database}
+        self.sesion = requests.Session()
+        self.sesion.mount("http://", HTTPAdapter(pool_maxsize=16))
+        self.sesion.mount("https://", HTTPAdapter(pool_maxsize=16))
+
+    # --- serialización ---
+
+    def lotes(self, df, measurement, tag_columns, timestamp_column):
+        """
+        Genera los lotes de line protocol (bytes) de un DataFrame.
+        """
+        # influxdb_client_3 arrastra pyarrow: solo se carga al serializar
+        from influxdb_client_3.write_client.client.write.dataframe_serializer import DataframeSerializer
+        from influxdb_client_3.write_client.client.write_api import PointSettings
+
+        serializador = DataframeSerializer(
+            df, PointSettings(), "ns", self.tamano_lote,
+            data_frame_measurement_name=measurement,
+            data_frame_tag_columns=tag_columns,
+            data_frame_timestamp_column=timestamp_column
+        )
+        for indice in range(serializador.number_of_chunks):
+            with medir("serializacion", measurement=measurement):
+                lineas = serializador.serialize(indice)
+                lote = "\n".join(lineas).encode("utf-8")
+            if lineas:
+                yield lote, len(lineas)
+
+    # --- envío ---
+
+    def _enviar(self, cuerpo_gzip):
+        """
+        Envía un lote ya comprimido, reintentando los errores transitorios.
+        Lanza ErrorEscrituraDefinitivo si InfluxDB rechaza el contenido y
+        requests.RequestException si se agotan los reintentos.
+        """
+        for intento in range(self.reintentos + 1):
+            try:
+                response = self.sesion.post(self.url, params=self.params, headers=self.headers,
+                                            data=cuerpo_gzip, timeout=60)
+            except (requests.ConnectionError, requests.Timeout):
+                if intento == self.reintentos:
+                    raise
+                time.sleep(self.backoff * 2 ** intento)
+                continue
+
+            if response.status_code < 300:
+                return
+            if response.status_code in ESTADOS_DEFINITIVOS:
+                raise ErrorEscrituraDefinitivo(f"HTTP {response.status_code}: {response.text[:200]}")
+            if response.status_code not in ESTADOS_TRANSITORIOS or intento == self.reintentos:
+                raise requests.HTTPError(f"HTTP {response.status_code}: {response.text[:200]}", response=response)
+
+            espera = response.headers.get("Retry-After")
+            time.sleep(float(espera) if espera and espera.isdigit() else self.backoff * 2 ** intento)
+
+    def _lotes_combinados(self, tablas):
+        """
+        Junta los lotes de varios DataFrames en lotes de hasta `tamano_lote`
+        puntos. Genera (bytes, {measurement: puntos}).
+        """
+        partes, contenido, total = [], {}, 0
+        for df, measurement, tag_columns, timestamp_column in tablas:
+            for lote, puntos in self.lotes(df, measurement, tag_columns, timestamp_column):
+                if partes and total + puntos > self.tamano_lote:
+                    yield b"\n".join(partes), contenido
+                    partes, contenido, total = [], {}, 0
+                partes.append(lote)
+                contenido[measurement] = contenido.get(measurement, 0) + puntos
+                total += puntos
+        if partes:
+            yield b"\n".join(partes), contenido
+
+    def escribir(self, df, measurement, tag_columns, timestamp_column):
+        """
+        Escribe un DataFrame por lotes. Devuelve (lotes_enviados, lotes_en_spool).
+        """
+        return self.escribir_varios([(df, measurement, tag_columns, timestamp_column)])
+
+    def escribir_varios(self, tablas):
+        """
+        Escribe varios DataFrames, dados como tuplas (df, measurement,
+        tag_columns, timestamp_column), compartiendo lotes: las tablas
+        pequeñas (p. ej. los agregados de una actividad) viajan en una sola
+        petición. Devuelve (lotes_enviados, lotes_en_spool).
+        """
+        enviados = en_spool = 0
+        error = None
+        for lote, contenido in self._lotes_combinados(tablas):
+            cuerpo = gzip.compress(lote, compresslevel=5)
+            nombre = "+".join(contenido)
+            if error is None:
+                try:
+                    puntos = sum(contenido.values())
+                    with medir("influx_escritura", measurement=nombre, puntos=puntos, bytes=len(cuerpo)):
+                        self._enviar(cuerpo)
+                    for measurement, puntos_measurement in contenido.items():
+                        registrar_escritura(measurement, puntos_measurement, len(cuerpo) * puntos_measurement / puntos)
+                    enviados += 1
+                    continue
+                except ErrorEscrituraDefinitivo:
+                    raise
+                except requests.RequestException as e:
+                    # InfluxDB no responde: el resto de lotes va directo al spool
+                    error = e
+            guardar_en_spool(cuerpo, nombre, self.ruta_spool, self.destino)
+            en_spool += 1
+        if error is not None:
+            nombres = ", ".join(tabla[1] for tabla in tablas)
+            print(f"⏳ {en_spool} lotes de '{nombres}' guardados en el spool ({error})")
+            registrar_evento("spool", measurement=nombres, lotes=en_spool, error=str(error))
+        return enviados, en_spool
+
+    # --- borrado ---
+
+    def borrar(self, measurement, tags, desde, hasta):
+        """
+        Borra los puntos de `measurement` con los valores de `tags` indicados
+        entre `desde` y `hasta` (ns desde la época, ambos incluidos). Lanza
+        requests.RequestException si InfluxDB no lo acepta.
+        """
+        condiciones = [f'_measurement="{_escapar_predicado(measurement)}"']
+        condiciones += [f'{tag}="{_escapar_predicado(valor)}"' for tag, valor in tags.items()]
+        cuerpo = {'start': _rfc3339(desde), 'stop': _rfc3339(hasta), 'predicate': " AND ".join(condiciones)}
+        params = {'org': self.params['org'], 'bucket': self.params['bucket']}
+        with medir("influx_borrado", measurement=measurement):
+            response = self.sesion.post(self.url_borrado, params=params, json=cuerpo, timeout=60,
+                                        headers={'Authorization': self.headers['Authorization']})
+        if response.status_code >= 300:
+            raise requests.HTTPError(f"HTTP {response.status_code}: {response.text[:200]}", response=response)
+
+    def reenviar_spool(self):
+        """
+        Reenvía los lotes pendientes del spool, del más antiguo al más reciente.
+        Devuelve (reenviados, pendientes).
+        """
+        reenviados = pendientes = 0
+        for ruta in archivos_spool(self.ruta_spool):
+            with open(ruta, "rb") as f:
+                cuerpo = f.read()
+            try:
+                self._enviar(cuerpo)
+            except ErrorEscrituraDefinitivo as e:
+                print(f"❌ Lote del spool rechazado por InfluxDB, se descarta: {ruta} ({e})")
+                os.remove(ruta)
+                continue
+            except requests.RequestException:
+                # InfluxDB sigue sin responder: se reintentará en otra ejecución
+                pendientes = len(archivos_spool(self.ruta_spool))
+                break
+            os.remove(ruta)
+            reenviados += 1
+        return reenviados, pendientes
+
+
+def _rfc3339(nanosegundos):
+    segundos, resto = divmod(int(nanosegundos), 1_000_000_000)
+    return datetime.fromtimestamp(segundos, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S") + f".{resto:09d}Z"
+
+
+def _escapar_predicado(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def ruta_spool_destino(host, org, database, ruta_base=RUTA_SPOOL):
+    """
+    Directorio del spool de un destino: el nombre de la base de datos (para
+    reconocerlo a simple vista) y un hash de host, organización y base de
+    datos.
+    """
+    clave = hashlib.sha1(f"{host.rstrip('/')}\0{org}\0{database}".encode("utf-8")).hexdigest()[:12]
+    nombre = re.sub(r"[^\w.-]", "_", database)
+    return os.path.join(ruta_base, f"{nombre}_{clave}")
+
+
+def guardar_en_spool(cuerpo_gzip, measurement, ruta_spool, destino=None):
+    """
+    Guarda un lote comprimido en el spool de forma atómica y duradera. El
+    nombre depende del contenido, así que guardar dos veces el mismo lote no
+    lo duplica. Con `destino` (host, org y database) se anota en
+    destino.json del directorio.
+    """
+    os.makedirs(ruta_spool, exist_ok=True)
+    if destino is not None and not os.path.exists(os.path.join(ruta_spool, "destino.json")):
+        with open(os.path.join(ruta_spool, "destino.json"), "w", encoding="utf-8") as f:
+            json.dump(destino, f)
+    resumen = hashlib.sha1(cuerpo_gzip).hexdigest()[:16]
+    ruta = os.path.join(ruta_spool, f"{time.time_ns()}_{measurement}_{resumen}.lp.gz")
+    existentes = [r for r in archivos_spool(ruta_spool) if r.endswith(f"_{resumen}.lp.gz")]
+    if existentes:
+        return existentes[0]
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(cuerpo_gzip)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, ruta)
+    return ruta
+
+
+def archivos_spool(ruta_spool):
+    """
+    Lotes pendientes de un directorio del spool, ordenados por antigüedad.
+    """
+    if not os.path.isdir(ruta_spool):
+        return []
+    return [os.path.join(ruta_spool, nombre) for nombre in sorted(os.listdir(ruta_spool))
+            if nombre.endswith(".lp.gz")]
+
+
+_escritores = {}
+_lock_escritores = threading.Lock()
+
+
+def obtener_escritor(host, token, org, database):
+    """
+    Devuelve un EscritorInflux compartido por configuración, para reutilizar
+    las conexiones entre subidas.
+    """
+    clave = (host, token, org, database)
+    with _lock_escritores:
+        if clave not in _escritores:
+            _escritores[clave] = EscritorInflux(host, token, org, database)
+        return _escritores[clave]
+
+
+def reenviar_spool(config_influx):
+    """
+    Reenvía los lotes pendientes que se escribieron para el destino de
+    `config_influx`. Los de otros destinos se quedan en su directorio.
+    """
+    ruta = ruta_spool_destino(config_influx['host'], config_influx['org'], config_influx['database'])
+    antiguos = archivos_spool(RUTA_SPOOL)
+    if antiguos:
+        # Lotes de antes de separar el spool por destino: no se sabe a dónde van
+        print(f"⚠️  {len(antiguos)} lotes en {RUTA_SPOOL} sin destino conocido. Si son de "
+              f"'{config_influx['database']}', muévelos a {ruta} para reenviarlos")
+    if not archivos_spool(ruta):
+        return 0, 0
+    escritor = obtener_escritor(config_influx['host'], config_influx['token'],
+                                config_influx['org'], config_influx['database'])
+    reenviados, pendientes = escritor.reenviar_spool()
+    print(f"📤 Spool de InfluxDB: {reenviados} lotes reenviados, {pendientes} pendientes")
+    return reenviados, pendientes
@@ -0,0 +1,95 @@
+"""
+Esquemas de tags de las tablas de streams en InfluxDB
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Las tablas Run, Cycling y Swimming y sus agregados (<Tipo>_10s, _1m, _1h)
+admiten dos esquemas, elegidos con la variable INFLUX_ESQUEMA:
+
+- clasico (por defecto): tags usuario, id_actividad y tipo_actividad. Cada
+  actividad es una serie nueva, así que el número de series crece sin
+  límite con el historial, y tipo_actividad repite el nombre del
+  measurement en cada punto.
+- compacto: solo usuario es tag. id_actividad se guarda como field y
+  tipo_actividad no se escribe. Cada tabla tiene tantas series como
+  usuarios. Para buscar una actividad se lee antes su rango de tiempo en el
+  measurement Resumen (una fila por actividad). La consulta a la tabla
+  grande queda acotada por usuario y tiempo, y id_actividad solo se
+  compara dentro de ese rango (consultar_influxdb.acotar_a_actividades).
+
+Con el esquema compacto un punto se identifica por usuario e instante. Para
+que dos actividades del mismo usuario no se pisen, todo lo que se escribe
+de una actividad queda dentro de su propio rango de tiempo: el primer
+intervalo de los agregados lleva el timestamp de la primera muestra
+(agregados.calcular_agregados) y los borrados de puntos obsoletos usan el
+rango exacto, sin alinearlo a los intervalos. Dos actividades del mismo
+usuario y deporte que se solapan en el tiempo (p. ej. la misma salida
+grabada con dos dispositivos) sí comparten puntos: la última en subirse
+sobrescribe los instantes comunes. migrar_esquema.py avisa de los
+solapamientos que encuentra; si son habituales, conviene seguir con el
+esquema clásico.
+
+El Resumen ya seguía este criterio (tags usuario y tipo_actividad, el id
+como field) y es igual en los dos esquemas. En una misma base de datos una
+clave no puede ser tag en unos puntos y field en otros: para cambiar de
+esquema se copian los datos a otra base de datos con migrar_esquema.py.
+"""
+
+import os
+
+ESQUEMAS = ("clasico", "compacto")
+
+TAGS_ESQUEMA = {
+    'clasico': ["usuario", "id_actividad", "tipo_actividad"],
+    'compacto': ["usuario"],
+}
+
+# Columnas que el esquema compacto no escribe: el measurement ya es el deporte
+COLUMNAS_REDUNDANTES = ["tipo_actividad", "measurement"]
+
+
+def esquema_actual(esquema=None):
+    """
+    Devuelve `esquema` o, si es None, el de INFLUX_ESQUEMA. Lanza
+    ValueError si no es uno de ESQUEMAS.
+    """
+    esquema = esquema or os.getenv("INFLUX_ESQUEMA", "clasico")
+    if esquema not in ESQUEMAS:
+        raise ValueError(f"Esquema de InfluxDB no soportado: {esquema} (usa {', '.join(ESQUEMAS)})")
+    return esquema
+
+
+def tags_streams(esquema=None):
+    """
+    Columnas que se escriben como tags en las tablas de streams y agregados.
+    """
+    return TAGS_ESQUEMA[esquema_actual(esquema)]
+
+
+def series_por_actividad(esquema=None):
+    """
+    True si cada actividad tiene sus propias series (id_actividad es tag).
+    """
+    return 'id_actividad' in tags_streams(esquema)
+
+
+def adaptar_dataframe(df, esquema=None):
+    """
+    Quita del DataFrame las columnas que el esquema no escribe. Con el
+    esquema clásico solo se quita la columna `measurement` del CSV modificado.
+    """
+    if esquema_actual(esquema) == 'compacto':
+        return df.drop(columns=COLUMNAS_REDUNDANTES, errors='ignore')
+    return df.drop(columns=['measurement'], errors='ignore')
+
+
+def tags_borrado(usuario, id_actividad, esquema=None):
+    """
+    Tags del predicado de /api/v2/delete para los puntos de una actividad.
+    El borrado solo admite tags: con el esquema compacto se borra por
+    usuario dentro del rango exacto de la actividad, que no comparte
+    instantes con las demás (ver series_por_actividad).
+    """
+    if esquema_actual(esquema) == 'compacto':
+        return {'usuario': usuario}
+    return {'usuario': usuario, 'id_actividad': str(id_actividad)}
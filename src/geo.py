@@ -0,0 +1,365 @@
+"""
+Rutas GPS: simplificación para mapas e índice espacial de actividades
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Tres partes:
+
+- Simplificación Ramer–Douglas–Peucker vectorizada con NumPy. Los puntos en
+  los que cambia el tramo de color (velocidad) se conservan siempre, así que
+  el mapa se dibuja con unas decenas de PolyLine de color uniforme en lugar
+  de una por cada par de puntos.
+- Índice espacial en rejilla: por cada actividad con GPS se guardan en
+  data/indice_geo/<id>.parquet las celdas de TAMANO_CELDA grados que
+  recorre y su caja envolvente. Permite preguntar qué actividades pasan
+  por una zona o cuáles repiten el recorrido de otra.
+- La caja envolvente se calcula en la ingesta (al guardar la actividad en
+  el almacén local) y también se escribe en el resumen de InfluxDB.
+
+    python src/geo.py indexar                      # reconstruye el índice desde el almacén local
+    python src/geo.py zona 40.41 -3.71 40.42 -3.70
+    python src/geo.py repetidas 1234567890 --similitud 0.7
+"""
+
+import argparse
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+RUTA_INDICE_GEO = os.getenv("INDICE_GEO", "data/indice_geo/")
+
+# ~220 m de latitud: suficiente para distinguir calles sin que dos pasadas
+# por el mismo camino caigan en celdas distintas
+TAMANO_CELDA = 0.002
+# Las columnas de la rejilla caben en 6 cifras (360 / 0.002 = 180000)
+_FACTOR_CELDA = 1_000_000
+
+RADIO_TIERRA_M = 6_371_000.0
+
+ESQUEMA_INDICE = pa.schema([
+    ('id_actividad', pa.string()),
+    ('usuario', pa.string()),
+    ('tipo_actividad', pa.string()),
+    ('fecha_inicio', pa.timestamp('ns')),
+    ('lat_min', pa.float64()),
+    ('lat_max', pa.float64()),
+    ('lon_min', pa.float64()),
+    ('lon_max', pa.float64()),
+    ('celdas', pa.list_(pa.int64())),
+])
+
+
+# --- coordenadas ---
+
+def coordenadas(df):
+    """
+    Devuelve (lat, lon, validos): arrays float64 de la ruta y la máscara de
+    puntos con GPS (sin NaN ni el (0, 0) que algunos dispositivos envían).
+    """
+    if 'latitude' not in df.columns or 'longitude' not in df.columns:
+        vacio = np.empty(0)
+        return vacio, vacio, np.zeros(0, dtype=bool)
+    lat = df['latitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+    lon = df['longitude'].to_numpy(dtype=np.float64, na_value=np.nan)
+    validos = ~(np.isnan(lat) | np.isnan(lon)) & ((lat != 0) | (lon != 0))
+    return lat, lon, validos
+
+
+def caja_envolvente(lat, lon):
+    """
+    Caja envolvente de la ruta (lat_min, lat_max, lon_min, lon_max), o None sin GPS.
+    """
+    if not len(lat):
+        return None
+    return {
+        'lat_min': float(lat.min()),
+        'lat_max': float(lat.max()),
+        'lon_min': float(lon.min()),
+        'lon_max': float(lon.max()),
+    }
+
+
+def proyectar(lat, lon):
+    """
+    Proyección equirectangular a metros alrededor de la latitud media:
+    precisa para la extensión de una actividad y mucho más barata que haversine.
+    """
+    escala = np.cos(np.radians(np.mean(lat)))
+    x = np.radians(lon) * RADIO_TIERRA_M * escala
+    y = np.radians(lat) * RADIO_TIERRA_M
+    return x, y
+
+
+# --- simplificación ---
+
+def simplificar_rdp(lat, lon, tolerancia_m=2.0, cortes=None):
+    """
+    Ramer–Douglas–Peucker: índices de los puntos que se conservan para que
+    la ruta no se desvíe más de `tolerancia_m` metros de la original. Cada
+    paso calcula de una vez (NumPy) la distancia de todos los puntos del
+    tramo a la recta entre sus extremos. Los índices de `cortes` se
+    conservan siempre y dividen la ruta en tramos independientes.
+    """
+    n = len(lat)
+    if n < 3:
+        return np.arange(n)
+    x, y = proyectar(lat, lon)
+    conservar = np.zeros(n, dtype=bool)
+    extremos = np.unique(np.concatenate(([0, n - 1], [] if cortes is None else cortes))).astype(np.int64)
+    conservar[extremos] = True
+    pila = list(zip(extremos[:-1], extremos[1:]))
+
+    while pila:
+        inicio, fin = pila.pop()
+        if fin - inicio < 2:
+            continue
+        dx, dy = x[fin] - x[inicio], y[fin] - y[inicio]
+        px, py = x[inicio + 1:fin] - x[inicio], y[inicio + 1:fin] - y[inicio]
+        longitud = np.hypot(dx, dy)
+        if longitud == 0:
+            distancias = np.hypot(px, py)
+        else:
+            distancias = np.abs(px * dy - py * dx) / longitud
+        k = int(np.argmax(distancias))
+        if distancias[k] > tolerancia_m:
+            medio = inicio + 1 + k
+            conservar[medio] = True
+            pila.append((inicio, medio))
+            pila.append((medio, fin))
+    return np.flatnonzero(conservar)
+
+
+def tramos_coloreados(df, columna='velocity_smooth', tolerancia_m=2.0, niveles=10):
+    """
+    Simplifica la ruta y la divide en tramos de color uniforme para el mapa.
+    `columna` se discretiza en `niveles` intervalos entre su mínimo y su
+    máximo; los puntos donde cambia el intervalo se conservan siempre, de
+    modo que la simplificación no mezcla colores.
+    Devuelve una lista de (coordenadas [(lat, lon), ...], valor medio del tramo).
+    """
+    lat, lon, validos = coordenadas(df)
+    lat, lon = lat[validos], lon[validos]
+    if len(lat) < 2:
+        return []
+    if columna in df.columns:
+        valores = df[columna].to_numpy(dtype=np.float64, na_value=np.nan)[validos]
+    else:
+        valores = np.zeros(len(lat))
+    valores = pd.Series(valores).ffill().bfill().fillna(0.0).to_numpy()
+
+    minimo, maximo = valores.min(), valores.max()
+    anchura = (maximo - minimo) / niveles or 1.0
+    nivel = np.minimum(((valores - minimo) / anchura).astype(np.int64), niveles - 1)
+    cortes = np.flatnonzero(np.diff(nivel)) + 1
+
+    indices = simplificar_rdp(lat, lon, tolerancia_m, cortes)
+    # Valor medio de cada tramo [cortes[i], cortes[i+1]) con sumas acumuladas
+    limites = np.concatenate(([0], cortes, [len(lat) - 1]))
+    acumulado = np.concatenate(([0.0], np.cumsum(valores)))
+    tramos = []
+    for inicio, fin in zip(limites[:-1], limites[1:]):
+        seleccion = indices[(indices >= inicio) & (indices <= fin)]
+        media = (acumulado[max(fin, inicio + 1)] - acumulado[inicio]) / max(fin - inicio, 1)
+        tramos.append((list(zip(lat[seleccion], lon[seleccion])), float(media)))
+    return tramos
+
+
+def mapa_actividad(df, columna='velocity_smooth', tolerancia_m=2.0, niveles=10):
+    """
+    Mapa folium de la actividad coloreado por `columna`, con una PolyLine
+    por tramo de color y marcadores de inicio y fin.
+    """
+    import branca.colormap as cm
+    import folium
+
+    lat, lon, validos = coordenadas(df)
+    tramos = tramos_coloreados(df, columna, tolerancia_m, niveles)
+    if not tramos:
+        raise ValueError("La actividad no tiene datos GPS")
+
+    m = folium.Map(location=[lat[validos].mean(), lon[validos].mean()], zoom_start=14, tiles='cartodbpositron')
+    valores = [valor for _, valor in tramos]
+    colormap = cm.LinearColormap(colors=['red', 'yellow', 'green'], vmin=min(valores), vmax=max(valores),
+                                 caption=f'Intensidad: {columna}')
+    for puntos, valor in tramos:
+        folium.PolyLine(locations=puntos, color=colormap(valor), weight=5, opacity=0.8).add_to(m)
+    m.add_child(colormap)
+
+    folium.Marker(location=tramos[0][0][0], popup="Inicio",
+                  icon=folium.Icon(color='green', icon='play', prefix='fa')).add_to(m)
+    folium.Marker(location=tramos[-1][0][-1], popup="Fin",
+                  icon=folium.Icon(color='red', icon='flag', prefix='fa')).add_to(m)
+    folium.TileLayer('esri.worldimagery', name='Satélite').add_to(m)
+    folium.LayerControl().add_to(m)
+    return m
+
+
+# --- índice espacial ---
+
+def celdas(lat, lon, tamano=TAMANO_CELDA):
+    """
+    Identificadores (int64) de las celdas de la rejilla que recorre la ruta.
+    """
+    fila = np.floor((lat + 90.0) / tamano).astype(np.int64)
+    columna = np.floor((lon + 180.0) / tamano).astype(np.int64)
+    return np.unique(fila * _FACTOR_CELDA + columna)
+
+
+def indexar_actividad(df, usuario, id_actividad, tipo_actividad, ruta=RUTA_INDICE_GEO):
+    """
+    Guarda (o sustituye) la entrada de la actividad en el índice espacial.
+    Devuelve la caja envolvente, o None si la actividad no tiene GPS.
+    """
+    lat, lon, validos = coordenadas(df)
+    lat, lon = lat[validos], lon[validos]
+    caja = caja_envolvente(lat, lon)
+    if caja is None:
+        return None
+
+    fila = {
+        'id_actividad': [str(id_actividad)],
+        'usuario': [usuario],
+        'tipo_actividad': [tipo_actividad],
+        'fecha_inicio': [pd.Timestamp(df['timestamp_real'].iloc[0]).as_unit('ns').value],
+        **{clave: [valor] for clave, valor in caja.items()},
+        'celdas': [celdas(lat, lon)],
+    }
+    os.makedirs(ruta, exist_ok=True)
+    archivo = os.path.join(ruta, f"{id_actividad}.parquet")
+    temporal = archivo + ".tmp"
+    pq.write_table(pa.table(fila, schema=ESQUEMA_INDICE), temporal, compression="zstd")
+    os.replace(temporal, archivo)
+    return caja
+
+
+def leer_indice(filtro=None, columnas=None, ruta=RUTA_INDICE_GEO):
+    """
+    Lee el índice como tabla Arrow. Cada fichero tiene una sola fila, así que
+    los filtros sobre la caja descartan ficheros con sus estadísticas. Solo
+    se leen los *.parquet: los .tmp de una escritura en curso se ignoran.
+    """
+    if not os.path.isdir(ruta):
+        return ESQUEMA_INDICE.empty_table()
+    archivos = sorted(glob.glob(os.path.join(glob.escape(ruta), "*.parquet")))
+    dataset = ds.dataset(archivos, format="parquet", schema=ESQUEMA_INDICE)
+    return dataset.to_table(columns=columnas, filter=filtro)
+
+
+def _solapa(lat_min, lon_min, lat_max, lon_max):
+    """
+    Filtro de actividades cuya caja envolvente se cruza con la indicada.
+    """
+    return ((ds.field('lat_max') >= lat_min) & (ds.field('lat_min') <= lat_max)
+            & (ds.field('lon_max') >= lon_min) & (ds.field('lon_min') <= lon_max))
+
+
+def actividades_en_zona(lat_min, lon_min, lat_max, lon_max, ruta=RUTA_INDICE_GEO):
+    """
+    Actividades que pasan por el rectángulo indicado, con el número de celdas
+    recorridas dentro de él (una aproximación de cuánto tiempo pasan por la zona).
+    """
+    tabla = leer_indice(_solapa(lat_min, lon_min, lat_max, lon_max), ruta=ruta)
+    columnas = ['id_actividad', 'usuario', 'tipo_actividad', 'fecha_inicio', 'celdas_en_zona']
+    if tabla.num_rows == 0:
+        return pd.DataFrame(columns=columnas)
+
+    # Comprobación exacta celda a celda sobre la lista aplanada
+    todas = pc.list_flatten(tabla['celdas']).to_numpy()
+    actividad = pc.list_parent_indices(tabla['celdas']).to_numpy()
+    fila, columna = np.divmod(todas, _FACTOR_CELDA)
+    inferior = celdas(np.array([lat_min]), np.array([lon_min]))[0]
+    superior = celdas(np.array([lat_max]), np.array([lon_max]))[0]
+    fila_min, columna_min = divmod(inferior, _FACTOR_CELDA)
+    fila_max, columna_max = divmod(superior, _FACTOR_CELDA)
+    dentro = (fila >= fila_min) & (fila <= fila_max) & (columna >= columna_min) & (columna <= columna_max)
+    cuenta = np.bincount(actividad[dentro], minlength=tabla.num_rows)
+
+    df = tabla.drop_columns(['celdas']).to_pandas()
+    df['celdas_en_zona'] = cuenta
+    df = df[df['celdas_en_zona'] > 0]
+    return df[columnas].sort_values('fecha_inicio', ignore_index=True)
+
+
+def rutas_repetidas(id_actividad, similitud_minima=0.7, ruta=RUTA_INDICE_GEO):
+    """
+    Actividades con un recorrido parecido al de `id_actividad`: similitud de
+    Jaccard entre sus conjuntos de celdas mayor o igual que `similitud_minima`.
+    Solo se comparan las actividades cuya caja envolvente se cruza con la suya.
+    """
+    referencia = leer_indice(ds.field('id_actividad') == str(id_actividad), ruta=ruta)
+    columnas = ['id_actividad', 'usuario', 'tipo_actividad', 'fecha_inicio', 'similitud']
+    if referencia.num_rows == 0:
+        return pd.DataFrame(columns=columnas)
+    caja = {c: referencia[c][0].as_py() for c in ('lat_min', 'lon_min', 'lat_max', 'lon_max')}
+    propias = np.asarray(referencia['celdas'][0].values)
+
+    filtro = _solapa(caja['lat_min'], caja['lon_min'], caja['lat_max'], caja['lon_max'])
+    candidatas = leer_indice(filtro & (ds.field('id_actividad') != str(id_actividad)), ruta=ruta)
+    if candidatas.num_rows == 0:
+        return pd.DataFrame(columns=columnas)
+
+    todas = pc.list_flatten(candidatas['celdas']).to_numpy()
+    actividad = pc.list_parent_indices(candidatas['celdas']).to_numpy()
+    comunes = np.bincount(actividad[np.isin(todas, propias)], minlength=candidatas.num_rows)
+    tamanos = pc.list_value_length(candidatas['celdas']).to_numpy()
+    similitud = comunes / (tamanos + len(propias) - comunes)
+
+    df = candidatas.drop_columns(['celdas']).to_pandas()
+    df['similitud'] = similitud
+    df = df[df['similitud'] >= similitud_minima]
+    return df[columnas].sort_values('similitud', ascending=False, ignore_index=True)
+
+
+def reindexar(ruta=RUTA_INDICE_GEO):
+    """
+    Reconstruye el índice con todas las actividades del almacén local.
+    """
+    from almacen_local import iterar_actividades
+
+    columnas = ['timestamp_real', 'latitude', 'longitude', 'id_actividad', 'usuario', 'tipo_actividad']
+    indexadas = 0
+    for tipo in ('Run', 'Cycling', 'Swimming'):
+        # Una actividad cada vez para no cargar todo el almacén en memoria
+        for tabla in iterar_actividades(columnas=columnas, tipos=tipo):
+            actividad = tabla.to_pandas().sort_values('timestamp_real')
+            if indexar_actividad(actividad, actividad['usuario'].iloc[0], actividad['id_actividad'].iloc[0], tipo,
+                                 ruta) is not None:
+                indexadas += 1
+    return indexadas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice espacial de las actividades")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    subparsers.add_parser("indexar", help="Reconstruye el índice desde el almacén local")
+    p_zona = subparsers.add_parser("zona", help="Actividades que pasan por un rectángulo")
+    for nombre in ("lat_min", "lon_min", "lat_max", "lon_max"):
+        p_zona.add_argument(nombre, type=float)
+    p_repetidas = subparsers.add_parser("repetidas", help="Actividades con un recorrido parecido")
+    p_repetidas.add_argument("id_actividad")
+    p_repetidas.add_argument("--similitud", type=float, default=0.7)
+    args = parser.parse_args()
+
+    if args.comando == "indexar":
+        print(f"✅ {reindexar()} actividades indexadas en {RUTA_INDICE_GEO}")
+        return
+    if args.comando == "zona":
+        df = actividades_en_zona(args.lat_min, args.lon_min, args.lat_max, args.lon_max)
+    else:
+        df = rutas_repetidas(args.id_actividad, args.similitud)
+    print(df.to_string() if not df.empty else "ℹ️  Sin resultados")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⏹️  Proceso interrumpido por el usuario.")
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
@@ -0,0 +1,140 @@
+"""
+Huellas de contenido para no reescribir actividades que no han cambiado
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Por cada actividad ingerida se guarda en data/huellas/<usuario>/<id>.json:
+
+- metadatos: hash de los campos del listado de Strava que cambian al editar
+  o recortar la actividad (updated_at si viene, fecha de inicio, duraciones,
+  distancia, desnivel y deporte). Si coincide con el del listado actual, la
+  actividad se salta sin descargar sus streams.
+- huella: hash del contenido de los streams (nombre, tipo y bytes de cada
+  columna del DataFrame) más updated_at. Si coincide tras descargarlos, no
+  se escribe nada en InfluxDB. También se guarda como field `huella` en el
+  measurement Resumen.
+- inicio y fin: timestamps (ns) de la primera y la última muestra escritas.
+  Cuando una actividad cambia y su stream se acorta o se recorta, los puntos
+  de la versión anterior que quedan fuera del nuevo rango se borran
+  (main.borrar_puntos_obsoletos).
+
+Un fichero por actividad: guardar una huella no reescribe las demás, y los
+hilos de la carga masiva no compiten por un mismo fichero.
+"""
+
+import hashlib
+import json
+import os
+
+RUTA_HUELLAS = "data/huellas/"
+
+# Campos del listado (SummaryActivity) que cambian cuando se edita la actividad
+CAMPOS_METADATOS = ('updated_at', 'start_date', 'elapsed_time', 'moving_time', 'distance',
+                    'total_elevation_gain', 'sport_type', 'type')
+
+
+def huella_metadatos(actividad):
+    """
+    Hash de los campos del listado que delatan una edición, o None si la
+    actividad no trae ninguno (p. ej. solo se conoce su id).
+    """
+    campos = {campo: actividad.get(campo) for campo in CAMPOS_METADATOS if actividad.get(campo) is not None}
+    if not campos:
+        return None
+    texto = json.dumps(campos, sort_keys=True, default=str)
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def huella_streams(df, updated_at=None):
+    """
+    Hash del contenido de una actividad: nombre, tipo y bytes de cada
+    columna de streams_a_dataframe (en orden alfabético) y updated_at.
+    Los arrays se recorren sin copiarlos.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(updated_at or "").encode("utf-8"))
+    for columna in sorted(df.columns):
+        valores = df[columna].to_numpy()
+        if valores.dtype == object:
+            valores = valores.astype(str)
+        h.update(f"\0{columna}\0{valores.dtype.str}\0".encode("utf-8"))
+        # Vista como bytes (datetime64 no expone el buffer directamente)
+        h.update(valores.reshape(-1).view("u1") if valores.flags.c_contiguous else valores.tobytes())
+    return h.hexdigest()
+
+
+def rango_tiempo(df):
+    """
+    (primera, última) marca de tiempo de la actividad, en ns desde la época.
+    """
+    tiempos = df['timestamp_real'].to_numpy(dtype="datetime64[ns]").view("i8")
+    return int(tiempos.min()), int(tiempos.max())
+
+
+def rangos_obsoletos(anterior, inicio, fin, paso=None):
+    """
+    Intervalos [desde, hasta] (ns, ambos incluidos) del rango escrito por la
+    versión `anterior` que la nueva versión, entre `inicio` y `fin`, ya no
+    cubre. Con `paso` (ns) los extremos se alinean a los intervalos de los
+    agregados, cuyo timestamp es el inicio del intervalo.
+    """
+    def alinear(t):
+        return t - t % paso if paso else t
+
+    viejo_inicio, viejo_fin = alinear(anterior['inicio']), alinear(anterior['fin'])
+    nuevo_inicio, nuevo_fin = alinear(inicio), alinear(fin)
+    rangos = []
+    if viejo_inicio < nuevo_inicio:
+        rangos.append((viejo_inicio, min(viejo_fin, nuevo_inicio - 1)))
+    if viejo_fin > nuevo_fin:
+        rangos.append((max(viejo_inicio, nuevo_fin + 1), viejo_fin))
+    return rangos
+
+
+def _ruta(usuario, id_actividad, ruta_base=RUTA_HUELLAS):
+    return os.path.join(ruta_base, usuario, f"{id_actividad}.json")
+
+
+def leer_huella(usuario, id_actividad, ruta_base=RUTA_HUELLAS):
+    """
+    Devuelve el registro guardado de la actividad, o None si no se ha ingerido.
+    """
+    ruta = _ruta(usuario, id_actividad, ruta_base)
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def guardar_huella(usuario, id_actividad, datos, ruta_base=RUTA_HUELLAS):
+    """
+    Guarda el registro de la actividad de forma atómica.
+    """
+    ruta = _ruta(usuario, id_actividad, ruta_base)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(datos, f)
+    os.replace(temporal, ruta)
+
+
+def sin_cambios(anterior, huella, tipo_actividad):
+    """
+    True si la actividad descargada es idéntica a la última ingerida (misma
+    huella de contenido y mismo deporte).
+    """
+    return (anterior is not None and anterior.get('huella') == huella
+            and anterior.get('tipo_actividad') == tipo_actividad)
+
+
+def metadatos_sin_cambios(actividad, usuario):
+    """
+    True si la actividad ya está ingerida y su listado no ha cambiado desde
+    entonces (no hace falta ni descargar sus streams).
+    """
+    metadatos = huella_metadatos(actividad)
+    anterior = leer_huella(usuario, actividad['id'])
+    return metadatos is not None and anterior is not None and anterior.get('metadatos') == metadatos
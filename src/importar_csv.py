@@ -0,0 +1,444 @@
+"""
+Importación masiva del archivo local de CSV en InfluxDB
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Recorre --ruta (data/ por defecto) buscando los strava_activity_<id>.csv
+de guardar_csv y los strava_activity_<id>_modificado.csv de
+preparar_csv_para_influx, y los sube a InfluxDB con subir_a_influxdb: los
+streams, el Resumen y los agregados. Sirve, p. ej., para recargar InfluxDB
+tras rehacer su volumen en docker/docker-compose.yml.
+
+- Una actividad por id: si están los dos CSV se lee el original, más
+  pequeño, y del _modificado solo la cabecera.
+- El usuario y el deporte de cada id salen del manifiesto, por orden de
+  prioridad: el fichero de --manifiesto (CSV id_actividad, usuario,
+  tipo_actividad), la primera fila del _modificado.csv, las huellas
+  (data/huellas/<usuario>/<id>.json) y el almacén local
+  (data/almacen/usuario=.../tipo_actividad=...). Por último se usan
+  --usuario y --deporte. Los ids sin usuario o sin deporte se listan en
+  data/manifiesto_pendiente.csv para completarlos y pasarlo con --manifiesto.
+- Los CSV se leen con pyarrow.csv en un pool de --procesos procesos (por
+  defecto, uno por CPU). Cada proceso escribe con su propio EscritorInflux,
+  en lotes de --lote puntos. El coste está en serializar el line protocol,
+  así que el ritmo crece con los procesos hasta agotar las CPU.
+- El progreso se anota en data/importacion_csv.jsonl, una línea por
+  fichero subido (ruta, tamaño y fecha de modificación). Al repetir la
+  importación se saltan los ficheros ya subidos que no han cambiado. Con
+  --reiniciar se ignora el progreso.
+
+    python src/importar_csv.py
+    python src/importar_csv.py --ruta data/ --procesos 8 --manifiesto manifiesto.csv
+    python src/importar_csv.py --usuario Alba --deporte Run
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from carga_masiva import TIPOS_STRAVA
+from metricas import medir
+
+load_dotenv()
+
+RUTA_ARCHIVO = "data/"
+RUTA_PROGRESO = "data/importacion_csv.jsonl"
+RUTA_PENDIENTES = "data/manifiesto_pendiente.csv"
+RUTA_HUELLAS = "data/huellas/"
+RUTA_ALMACEN = "data/almacen/"
+PROCESOS = os.cpu_count() or 1
+TAMANO_LOTE = 50_000
+
+DEPORTES = sorted(set(TIPOS_STRAVA.values()))
+_PATRON_CSV = re.compile(r"^strava_activity_(\d+)(_modificado)?\.csv$")
+
+
+# --- descubrimiento y manifiesto ---
+
+def descubrir_archivo(ruta=RUTA_ARCHIVO):
+    """
+    Devuelve {id_actividad: {'csv': ruta o None, 'modificado': ruta o None}}
+    con los CSV de actividades bajo `ruta` (recursivo).
+    """
+    archivos = {}
+    for directorio, _, nombres in os.walk(ruta):
+        for nombre in nombres:
+            coincidencia = _PATRON_CSV.match(nombre)
+            if not coincidencia:
+                continue
+            id_actividad, modificado = coincidencia.groups()
+            entrada = archivos.setdefault(id_actividad, {'csv': None, 'modificado': None})
+            entrada['modificado' if modificado else 'csv'] = os.path.join(directorio, nombre)
+    return archivos
+
+
+def tipo_desde_texto(texto):
+    """
+    Nombre de la tabla para un deporte dado como tabla (Run) o como
+    sport_type de Strava (TrailRun, Ride...), o None si no se reconoce.
+    """
+    if not texto:
+        return None
+    return texto if texto in DEPORTES else TIPOS_STRAVA.get(texto)
+
+
+def leer_manifiesto(ruta):
+    """
+    Lee un manifiesto CSV con columnas id_actividad, usuario y tipo_actividad.
+    """
+    manifiesto = {}
+    with open(ruta, encoding="utf-8", newline="") as f:
+        for fila in csv.DictReader(f):
+            id_actividad = (fila.get('id_actividad') or "").strip()
+            if id_actividad:
+                manifiesto[id_actividad] = {
+                    'usuario': (fila.get('usuario') or "").strip() or None,
+                    'tipo_actividad': tipo_desde_texto((fila.get('tipo_actividad') or "").strip()),
+                }
+    return manifiesto
+
+
+def _cabecera_modificado(ruta):
+    """
+    Usuario y tipo de la primera fila de un _modificado.csv, sin leer el resto.
+    """
+    with open(ruta, encoding="utf-8", newline="") as f:
+        fila = next(csv.DictReader(f), None) or {}
+    return {'usuario': fila.get('usuario') or None,
+            'tipo_actividad': tipo_desde_texto(fila.get('tipo_actividad'))}
+
+
+def _desde_huellas(ruta_huellas):
+    """
+    {id: {'usuario', 'tipo_actividad'}} de las huellas de las actividades ingeridas.
+    """
+    resultado = {}
+    if not os.path.isdir(ruta_huellas):
+        return resultado
+    for usuario in os.listdir(ruta_huellas):
+        directorio = os.path.join(ruta_huellas, usuario)
+        if not os.path.isdir(directorio):
+            continue
+        for nombre in os.listdir(directorio):
+            if not nombre.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directorio, nombre), encoding="utf-8") as f:
+                    tipo = json.load(f).get('tipo_actividad')
+            except (OSError, ValueError):
+                tipo = None
+            resultado[nombre[:-len(".json")]] = {'usuario': usuario, 'tipo_actividad': tipo_desde_texto(tipo)}
+    return resultado
+
+
+def _desde_almacen(ruta_almacen):
+    """
+    {id: {'usuario', 'tipo_actividad'}} de las particiones del almacén local.
+    """
+    resultado = {}
+    for directorio, _, nombres in os.walk(ruta_almacen):
+        partes = dict(p.split("=", 1) for p in directorio.split(os.sep) if "=" in p)
+        for nombre in nombres:
+            if nombre.endswith(".parquet") and 'usuario' in partes:
+                resultado[nombre[:-len(".parquet")]] = {
+                    'usuario': partes['usuario'],
+                    'tipo_actividad': tipo_desde_texto(partes.get('tipo_actividad')),
+                }
+    return resultado
+
+
+def construir_manifiesto(archivos, ruta_manifiesto=None, usuario=None, deporte=None,
+                         ruta_huellas=RUTA_HUELLAS, ruta_almacen=RUTA_ALMACEN):
+    """
+    Resuelve el usuario y el deporte de cada id de `archivos`. Cada campo se
+    toma de la primera fuente que lo tenga: manifiesto, cabecera del
+    _modificado.csv, huellas, almacén local y, por último, `usuario` y
+    `deporte`. Devuelve (manifiesto, ids sin resolver).
+    """
+    fuentes = [leer_manifiesto(ruta_manifiesto) if ruta_manifiesto else {}]
+    fuentes.append({id_actividad: _cabecera_modificado(entrada['modificado'])
+                    for id_actividad, entrada in archivos.items() if entrada['modificado']})
+    fuentes += [_desde_huellas(ruta_huellas), _desde_almacen(ruta_almacen)]
+    fuentes.append({id_actividad: {'usuario': usuario, 'tipo_actividad': tipo_desde_texto(deporte)}
+                    for id_actividad in archivos})
+
+    manifiesto, pendientes = {}, []
+    for id_actividad in archivos:
+        entrada = {'usuario': None, 'tipo_actividad': None}
+        for fuente in fuentes:
+            for campo, valor in fuente.get(id_actividad, {}).items():
+                entrada[campo] = entrada[campo] or valor
+        if entrada['usuario'] and entrada['tipo_actividad']:
+            manifiesto[id_actividad] = entrada
+        else:
+            pendientes.append(id_actividad)
+    return manifiesto, pendientes
+
+
+def guardar_pendientes(pendientes, archivos, ruta=RUTA_PENDIENTES):
+    """
+    Escribe un manifiesto con los ids sin resolver, para completarlo a mano.
+    """
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(['id_actividad', 'usuario', 'tipo_actividad', 'archivo'])
+        for id_actividad in sorted(pendientes, key=int):
+            entrada = archivos[id_actividad]
+            escritor.writerow([id_actividad, "", "", entrada['csv'] or entrada['modificado']])
+
+
+# --- progreso ---
+
+def _firma(ruta):
+    estado = os.stat(ruta)
+    return {'ruta': os.path.abspath(ruta), 'tamano': estado.st_size, 'mtime': estado.st_mtime_ns}
+
+
+def leer_progreso(ruta=RUTA_PROGRESO):
+    """
+    Firmas (ruta, tamaño, mtime) de los ficheros ya importados. Una última
+    línea incompleta (importación interrumpida) se ignora.
+    """
+    hechos = set()
+    if not os.path.exists(ruta):
+        return hechos
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            try:
+                entrada = json.loads(linea)
+            except ValueError:
+                continue
+            hechos.add((entrada['ruta'], entrada['tamano'], entrada['mtime']))
+    return hechos
+
+
+def anotar_progreso(f, firma, id_actividad, puntos):
+    f.write(json.dumps(dict(firma, id_actividad=id_actividad, puntos=puntos)) + "\n")
+    f.flush()
+
+
+# --- trabajo de cada proceso ---
+
+_config_trabajador = {}
+
+
+def _iniciar_trabajador(config_influx, tamano_lote):
+    """
+    Prepara el escritor del proceso: uno por proceso, con lotes grandes.
+    """
+    from escritor_influx import obtener_escritor
+
+    _config_trabajador.update(config_influx)
+    escritor = obtener_escritor(config_influx['host'], config_influx['token'],
+                                config_influx['org'], config_influx['database'])
+    escritor.tamano_lote = tamano_lote
+
+
+def leer_csv(ruta):
+    """
+    Lee el CSV de una actividad con pyarrow y lo devuelve como DataFrame.
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    tipos = {'timestamp_real': pa.timestamp('ns'), 'id_actividad': pa.string(), 'usuario': pa.string(),
+             'tipo_actividad': pa.string(), 'measurement': pa.string()}
+    with medir("csv_lectura"):
+        tabla = pa_csv.read_csv(ruta, read_options=pa_csv.ReadOptions(use_threads=False),
+                                convert_options=pa_csv.ConvertOptions(column_types=tipos))
+        return tabla.to_pandas()
+
+
+def importar_actividad(ruta, id_actividad, usuario, tipo_actividad):
+    """
+    Sube el CSV de una actividad. Devuelve (puntos, True si todo llegó a
+    InfluxDB, mensajes de subir_a_influxdb). Se ejecuta en los procesos del
+    pool o, con un solo proceso, en el hilo principal: nunca a la vez que
+    el padre escribe en pantalla.
+    """
+    from main import preparar_dataframe_para_influx, subir_a_influxdb
+
+    df = leer_csv(ruta)
+    if df.empty or 'timestamp_real' not in df.columns:
+        raise ValueError("CSV sin filas o sin columna timestamp_real")
+    datos = preparar_dataframe_para_influx(df.drop(columns=['measurement'], errors='ignore'),
+                                           usuario, id_actividad, tipo_actividad)
+    config = _config_trabajador
+    # Los mensajes por actividad de subir_a_influxdb se devuelven al padre,
+    # que solo los muestra si algo ha fallado
+    salida = io.StringIO()
+    with contextlib.redirect_stdout(salida):
+        correcto = subir_a_influxdb(datos, tipo_actividad, config['host'], config['token'],
+                                    config['org'], config['database'])
+    return len(df), correcto, salida.getvalue()
+
+
+def _en_secuencia(tareas, config_influx, tamano_lote):
+    """
+    Importa las tareas una detrás de otra en el hilo principal. Genera
+    (tarea, futuro ya resuelto), como as_completed con el pool.
+    """
+    _iniciar_trabajador(config_influx, tamano_lote)
+    for tarea in tareas:
+        futuro = Future()
+        try:
+            futuro.set_result(importar_actividad(tarea[0], *tarea[2:]))
+        except Exception as e:
+            futuro.set_exception(e)
+        yield tarea, futuro
+
+
+def _en_paralelo(tareas, config_influx, tamano_lote, procesos):
+    """
+    Importa las tareas en un pool de procesos. Genera (tarea, futuro) en el
+    orden en que terminan.
+    """
+    # spawn: los procesos no heredan las conexiones abiertas del escritor del padre
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_iniciar_trabajador, initargs=(config_influx, tamano_lote)) as pool:
+        futuros = {pool.submit(importar_actividad, tarea[0], *tarea[2:]): tarea for tarea in tareas}
+        for futuro in as_completed(futuros):
+            yield futuros[futuro], futuro
+
+
+# --- importación ---
+
+def importar(config_influx, ruta=RUTA_ARCHIVO, procesos=PROCESOS, ruta_manifiesto=None, usuario=None,
+             deporte=None, tamano_lote=TAMANO_LOTE, reiniciar=False, ruta_progreso=RUTA_PROGRESO,
+             ruta_pendientes=RUTA_PENDIENTES):
+    """
+    Importa el archivo de CSV bajo `ruta`. Devuelve un resumen con los
+    ficheros importados, ya importados, sin manifiesto y fallidos, los
+    puntos y los segundos.
+    """
+    archivos = descubrir_archivo(ruta)
+    manifiesto, pendientes = construir_manifiesto(archivos, ruta_manifiesto, usuario, deporte)
+    hechos = set() if reiniciar else leer_progreso(ruta_progreso)
+
+    resumen = {'importados': 0, 'ya_importados': 0, 'sin_manifiesto': len(pendientes), 'fallidos': {},
+               'puntos': 0, 'segundos': 0.0}
+    tareas = []
+    for id_actividad, entrada in manifiesto.items():
+        ruta_csv = archivos[id_actividad]['csv'] or archivos[id_actividad]['modificado']
+        firma = _firma(ruta_csv)
+        if (firma['ruta'], firma['tamano'], firma['mtime']) in hechos:
+            resumen['ya_importados'] += 1
+            continue
+        tareas.append((ruta_csv, firma, id_actividad, entrada['usuario'], entrada['tipo_actividad']))
+
+    print(f"📂 {len(archivos)} actividades en {ruta}: {len(tareas)} por importar, "
+          f"{resumen['ya_importados']} ya importadas, {len(pendientes)} sin usuario o deporte")
+    if pendientes:
+        guardar_pendientes(pendientes, archivos, ruta_pendientes)
+        print(f"⚠️  Completa {ruta_pendientes} y pásalo con --manifiesto para importarlas")
+    if not tareas:
+        return resumen
+
+    # Las más grandes primero, para que no quede una sola al final del pool
+    tareas.sort(key=lambda tarea: tarea[1]['tamano'], reverse=True)
+    os.makedirs(os.path.dirname(ruta_progreso) or ".", exist_ok=True)
+    inicio = time.perf_counter()
+    siguiente_aviso = 0.1
+    if procesos > 1:
+        resultados = _en_paralelo(tareas, config_influx, tamano_lote, procesos)
+    else:
+        # Con un solo proceso no compensa arrancar otro intérprete
+        resultados = _en_secuencia(tareas, config_influx, tamano_lote)
+    with open(ruta_progreso, "a", encoding="utf-8") as progreso:
+        for completados, (tarea, futuro) in enumerate(resultados, 1):
+            ruta_csv, firma, id_actividad = tarea[:3]
+            try:
+                puntos, correcto, mensajes = futuro.result()
+                if not correcto:
+                    print(mensajes, end="")
+                    raise RuntimeError("no todo llegó a InfluxDB (lotes en el spool o error de escritura)")
+                anotar_progreso(progreso, firma, id_actividad, puntos)
+                resumen['importados'] += 1
+                resumen['puntos'] += puntos
+            except Exception as e:
+                print(f"❌ {ruta_csv}: {e}")
+                resumen['fallidos'][id_actividad] = str(e)
+
+            if completados / len(tareas) >= siguiente_aviso:
+                segundos = time.perf_counter() - inicio
+                print(f"⏳ {completados}/{len(tareas)} ficheros, {resumen['puntos']:,} puntos "
+                      f"({resumen['puntos'] / segundos * 60:,.0f} puntos/min)")
+                siguiente_aviso += 0.1
+    resumen['segundos'] = time.perf_counter() - inicio
+    return resumen
+
+
+def agregar_argumentos(parser):
+    """
+    Opciones de la importación, compartidas con `cli.py import`.
+    """
+    parser.add_argument("--ruta", default=RUTA_ARCHIVO, help="Directorio con los CSV (se recorre entero)")
+    parser.add_argument("--procesos", type=int, default=PROCESOS)
+    parser.add_argument("--manifiesto", help="CSV con id_actividad, usuario y tipo_actividad")
+    parser.add_argument("--usuario", help="Usuario de los CSV que no aparezcan en el manifiesto")
+    parser.add_argument("--deporte", choices=DEPORTES, help="Deporte de los CSV que no aparezcan en el manifiesto")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="Puntos por petición a InfluxDB")
+    parser.add_argument("--reiniciar", action="store_true", help="Ignora el progreso y lo importa todo")
+
+
+def main():
+    """
+    Importa el archivo de CSV y muestra el resumen.
+    """
+    parser = argparse.ArgumentParser(description="Importa en InfluxDB el archivo local de CSV de actividades")
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+    return importar_desde_argumentos(args)
+
+
+def importar_desde_argumentos(args):
+    """
+    Ejecuta la importación con los argumentos de la línea de comandos
+    (también desde `cli.py import`). Devuelve True si no ha fallado ningún
+    fichero.
+    """
+    from escritor_influx import reenviar_spool
+    from main import obtener_config_influx
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return False
+    reenviar_spool(config_influx)
+
+    print("\n" + "="*60)
+    print("   IMPORTACIÓN DEL ARCHIVO DE CSV")
+    print("="*60 + "\n")
+    resumen = importar(config_influx, args.ruta, args.procesos, args.manifiesto, args.usuario, args.deporte,
+                       args.lote, args.reiniciar)
+
+    print("\n" + "="*60)
+    print(f"✅ Importados: {resumen['importados']}")
+    print(f"⏸️  Ya importados: {resumen['ya_importados']}")
+    if resumen['sin_manifiesto']:
+        print(f"⚠️  Sin usuario o deporte: {resumen['sin_manifiesto']}")
+    if resumen['fallidos']:
+        print(f"❌ Fallidos: {len(resumen['fallidos'])} (se reintentarán en la próxima importación)")
+    if resumen['segundos']:
+        print(f"⏱️  {resumen['puntos']:,} puntos en {resumen['segundos']:.1f} s "
+              f"({resumen['puntos'] / resumen['segundos'] * 60:,.0f} puntos/min)")
+    print("="*60)
+    return not resumen['fallidos']
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⏹️  Proceso interrumpido por el usuario.")
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
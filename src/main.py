@@ -2,98 +2,230 @@
 Script principal para extraer datos de Strava y cargarlos en InfluxDB
 Autores: Alba y Alonso
 Fecha: 2025-12-24
+
+Las dependencias pesadas (NumPy, pandas, pyarrow, influxdb_client_3) se
+importan dentro de las funciones que las usan: cli.py, carga_masiva.py y
+sincronizacion.py importan este módulo y así sus comandos rápidos arrancan
+sin cargarlas.
 """
 
 import os
-import requests
-import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime
 from dotenv import load_dotenv
-from influxdb_client_3 import InfluxDBClient3
+
+from cliente_strava import STRAVA_API_URL, ClienteStrava, cabeceras_autorizacion, peticion_get
+from metricas import medir, perfilar, registrar_descarga
+from registro_usuarios import config_usuario, elegir_usuario
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Tipo compacto de cada stream de Strava (el resto se deja en float64)
+DTYPES_STREAMS = {
+    'time': "int32",
+    'velocity_smooth': "float32",
+    'grade_smooth': "float32",
+    'heartrate': "int16",
+    'cadence': "int16",
+    'watts': "int16",
+    'temp': "int8",
+}
+
+# Resoluciones de los streams de Strava (parámetro `resolution`) y número
+# aproximado de puntos de cada una. Sin resolución se descargan todas las
+# muestras (1 por segundo en la mayoría de actividades).
+RESOLUCIONES_STREAMS = {'low': 100, 'medium': 1000, 'high': 10000}
+SERIES_STREAMS = ('time', 'distance')
+
+# La vista previa de main() solo necesita unas filas y unas estadísticas
+RESOLUCION_VISTA_PREVIA = "low"
+
 
 def obtener_token_acceso(client_id, client_secret, refresh_token, usuario):
     """
     Obtiene un access token válido usando el refresh token.
     Basado en crear_token_refresco.py
+    El token se cachea (memoria y disco) y se reutiliza hasta su caducidad.
+    """
+    proveedor = obtener_proveedor_token(client_id, client_secret, refresh_token, usuario)
+    return proveedor() if proveedor else None
+
+
+def obtener_proveedor_token(client_id, client_secret, refresh_token, usuario):
+    """
+    Como obtener_token_acceso, pero devuelve una función que da un access
+    token válido en cada llamada (ClienteStrava.obtener_token), o None si no
+    se pudo obtener el primero. Es lo que deben recibir las cargas largas:
+    un backfill o una pausa hasta la medianoche UTC pueden durar más que
+    las ~6 h de vida de un token, y así se refresca al caducar.
     """
-    print(f"🔄 Refrescando token de Strava para {usuario}...")
-    auth_url = "https://www.strava.com/oauth/token"
-    payload = {
-        'client_id': client_id,
-        'client_secret': client_secret,
-        'refresh_token': refresh_token,
-        'grant_type': 'refresh_token',
-        'f': 'json'
-    }
-    
     try:
-        res = requests.post(auth_url, data=payload, verify=False)
-        res.raise_for_status()
-        access_token = res.json()['access_token']
-        print(f"✅ Token renovado exitosamente para {usuario}")
-        return access_token
+        cliente = ClienteStrava(usuario, client_id, client_secret, refresh_token)
+        cliente.obtener_token()
+        print(f"✅ Token de Strava listo para {usuario}")
+        return cliente.obtener_token
     except Exception as e:
         print(f"❌ Error al refrescar token: {e}")
         return None
 
 
-def descargar_datos_actividad(activity_id, access_token):
+def resolucion_para_puntos(max_puntos=None):
     """
-    Descarga todos los datos (streams) de una actividad de Strava.
-    Basado en pruebas.py
+    Resolución de Strava más detallada que no supera `max_puntos` puntos
+    ('low' si ni siquiera esa cabe), o None (completa) si el presupuesto
+    supera a todas o no hay límite.
     """
-    # 1. Solicitamos TODOS los streams posibles
-    keys = "time,distance,latlng,altitude,velocity_smooth,heartrate,cadence,watts,temp,grade_smooth"
-    url = f"https://www.strava.com/api/v3/activities/{activity_id}/streams?keys={keys}&key_by_type=true"
-    
-    headers = {'Authorization': f"Bearer {access_token}"}
-    print(f"⏳ Conectando con Strava para actividad {activity_id}...")
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code != 200:
-        print(f"❌ Error al descargar actividad: {response.text}")
+    if max_puntos is None or max_puntos > max(RESOLUCIONES_STREAMS.values()):
         return None
+    elegida = 'low'
+    for resolucion, puntos in RESOLUCIONES_STREAMS.items():
+        if puntos <= max_puntos:
+            elegida = resolucion
+    return elegida
 
-    streams = response.json()
-    
-    # 2. Verificar que hay datos de tiempo
+
+def descargar_streams(activity_id, access_token, limitador=None, resolucion=None, series_type=None):
+    """
+    Descarga los streams de una actividad (key_by_type=true). Devuelve el
+    diccionario de streams, o None si falla o la actividad no tiene tiempo.
+    La respuesta se lee por fragmentos directamente en arrays NumPy
+    (streams_json), sin cargar el JSON completo en memoria.
+    Con `resolucion` ('low', 'medium', 'high') Strava devuelve los streams
+    remuestreados a unos 100, 1000 o 10000 puntos a lo largo de `series_type`
+    ('time' o 'distance', por defecto 'distance'). Los bytes y la latencia
+    se registran por resolución (streams_<resolucion>). `access_token` puede
+    ser el token o una función que lo devuelve (obtener_proveedor_token).
+    """
+    from streams_json import leer_respuesta
+
+    if resolucion is not None and resolucion not in RESOLUCIONES_STREAMS:
+        raise ValueError(f"Resolución no válida: {resolucion} (opciones: {', '.join(RESOLUCIONES_STREAMS)})")
+    if series_type is not None and series_type not in SERIES_STREAMS:
+        raise ValueError(f"series_type no válido: {series_type} (opciones: {', '.join(SERIES_STREAMS)})")
+
+    # Solicitamos TODOS los streams posibles
+    keys = "time,distance,latlng,altitude,velocity_smooth,heartrate,cadence,watts,temp,grade_smooth"
+    url = f"{STRAVA_API_URL}/activities/{activity_id}/streams?keys={keys}&key_by_type=true"
+    params = {}
+    if resolucion:
+        params['resolution'] = resolucion
+        # series_type solo tiene efecto al remuestrear
+        if series_type:
+            params['series_type'] = series_type
+    recurso = f"streams_{resolucion}" if resolucion else "streams"
+    
+    headers = cabeceras_autorizacion(access_token)
+    print(f"⏳ Conectando con Strava para actividad {activity_id}...")
+    with medir(f"{recurso}_get", id_actividad=str(activity_id)):
+        response = peticion_get(url, headers, params=params or None, limitador=limitador, stream=True)
+        if response.status_code != 200:
+            print(f"❌ Error al descargar actividad: {response.text}")
+            return None
+        streams, num_bytes = leer_respuesta(response, DTYPES_STREAMS)
+    registrar_descarga(recurso, num_bytes)
+    
+    # Verificar que hay datos de tiempo
     if 'time' not in streams:
         print("❌ Esta actividad no tiene datos de tiempo (quizás es manual).")
         return None
+    return streams
 
-    data_dict = {}
-    
-    # 3. Convertir los streams en un diccionario
-    for key, value in streams.items():
-        if key == 'latlng':
-            # Separar latitud y longitud
-            lats = [x[0] for x in value['data']]
-            lngs = [x[1] for x in value['data']]
-            data_dict['latitude'] = lats
-            data_dict['longitude'] = lngs
-        else:
-            data_dict[key] = value['data']
 
-    # 4. Crear DataFrame
-    df = pd.DataFrame(data_dict)
-    
-    # 5. Obtener información adicional de la actividad (fecha de inicio)
-    url_act = f"https://www.strava.com/api/v3/activities/{activity_id}"
-    resp_act = requests.get(url_act, headers=headers).json()
-    start_date = datetime.strptime(resp_act['start_date'], "%Y-%m-%dT%H:%M:%SZ")
-    
-    # 6. Calcular timestamps reales
-    df['timestamp_real'] = df['time'].apply(lambda x: start_date + timedelta(seconds=x))
-    
-    # 7. Reordenar columnas
-    cols = ['timestamp_real', 'time'] + [c for c in df.columns if c not in ['timestamp_real', 'time']]
-    df = df[cols]
+def obtener_detalle_actividad(activity_id, access_token, limitador=None):
+    """
+    Devuelve el detalle de una actividad (DetailedActivity de Strava).
+    """
+    url_act = f"{STRAVA_API_URL}/activities/{activity_id}"
+    headers = cabeceras_autorizacion(access_token)
+    with medir("actividad_get", id_actividad=str(activity_id)):
+        response = peticion_get(url_act, headers, limitador=limitador)
+    registrar_descarga("actividad", len(response.content))
+    return response.json()
 
-    return df
+
+def obtener_start_date(activity_id, access_token, limitador=None):
+    """
+    Devuelve la fecha de inicio (start_date, UTC) del detalle de una actividad.
+    """
+    return obtener_detalle_actividad(activity_id, access_token, limitador)['start_date']
+
+
+def descargar_datos_actividad(activity_id, access_token, start_date=None, limitador=None, resolucion=None,
+                              series_type=None, max_puntos=None):
+    """
+    Descarga todos los datos (streams) de una actividad de Strava.
+    Basado en pruebas.py
+    Si ya se conoce `start_date` (por ejemplo, del listado de actividades) se
+    evita la segunda petición al detalle de la actividad. `limitador` es un
+    LimitadorTasa opcional compartido entre descargas concurrentes.
+    Por defecto se descarga la resolución completa; para análisis o vistas
+    previas basta con `resolucion` o con un presupuesto de `max_puntos`
+    (resolucion_para_puntos). Lo que se sube a InfluxDB o al almacén local
+    debe ser siempre la resolución completa.
+    """
+    if resolucion is None:
+        resolucion = resolucion_para_puntos(max_puntos)
+
+    # 1. Streams de la actividad
+    streams = descargar_streams(activity_id, access_token, limitador, resolucion, series_type)
+    if streams is None:
+        return None
+
+    # 2. Obtener información adicional de la actividad (fecha de inicio)
+    if start_date is None:
+        start_date = obtener_start_date(activity_id, access_token, limitador)
+    start_date = datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%SZ")
+
+    # 3. Crear DataFrame
+    return streams_a_dataframe(streams, start_date)
+
+
+def _array_stream(key, datos):
+    """
+    Convierte un stream en un array NumPy con el tipo compacto que le corresponde.
+    Si el stream trae huecos (None) se usa float32 con NaN.
+    """
+    import numpy as np
+
+    dtype = DTYPES_STREAMS.get(key, np.float64)
+    if isinstance(datos, np.ndarray) and datos.dtype.kind == "f" and np.dtype(dtype).kind in "iu":
+        # streams_json ya pasa a float32 los streams enteros con huecos
+        return datos.astype(np.float32, copy=False)
+    try:
+        return np.asarray(datos, dtype=dtype)
+    except (TypeError, ValueError):
+        return np.asarray(datos, dtype=np.float32)
+
+
+def streams_a_dataframe(streams, start_date):
+    """
+    Convierte los streams de Strava (key_by_type=true) en un DataFrame con
+    operaciones vectorizadas de NumPy y tipos compactos por columna.
+    """
+    import numpy as np
+    import pandas as pd
+
+    with medir("dataframe"):
+        columnas = {}
+
+        # Timestamps reales: suma vectorizada datetime64 + segundos
+        with medir("timestamps"):
+            time = _array_stream('time', streams['time']['data'])
+            columnas['timestamp_real'] = np.datetime64(start_date, 'ns') + time.astype('timedelta64[s]')
+            columnas['time'] = time
+
+        for key, value in streams.items():
+            if key == 'time':
+                continue
+            if key == 'latlng':
+                # Separar latitud y longitud como columnas de un único array (n, 2)
+                latlng = np.asarray(value['data'], dtype=np.float64).reshape(-1, 2)
+                columnas['latitude'] = latlng[:, 0]
+                columnas['longitude'] = latlng[:, 1]
+            else:
+                columnas[key] = _array_stream(key, value['data'])
+
+        return pd.DataFrame(columnas, copy=False)
 
 
 def guardar_csv(df, activity_id, data_path="data/"):
@@ -102,7 +234,8 @@ def guardar_csv(df, activity_id, data_path="data/"):
     """
     os.makedirs(data_path, exist_ok=True)
     nombre_archivo = f"{data_path}strava_activity_{activity_id}.csv"
-    df.to_csv(nombre_archivo, index=False)
+    with medir("csv_escritura", id_actividad=str(activity_id)):
+        df.to_csv(nombre_archivo, index=False)
     print(f"✅ Archivo guardado exitosamente: {nombre_archivo}")
     return nombre_archivo
 
@@ -111,7 +244,10 @@ def preparar_csv_para_influx(archivo_csv, usuario, id_actividad, tipo_actividad)
     """
     Modifica el CSV añadiendo columnas de usuario, id_actividad, tipo_actividad y measurement.
     """
-    df = pd.read_csv(archivo_csv)
+    import pandas as pd
+
+    with medir("csv_lectura"):
+        df = pd.read_csv(archivo_csv)
     
     # Añadir columnas necesarias
     df['measurement'] = tipo_actividad  # Nombre de la tabla/measurement en InfluxDB
@@ -121,34 +257,105 @@ def preparar_csv_para_influx(archivo_csv, usuario, id_actividad, tipo_actividad)
     
     # Guardar el CSV modificado
     archivo_modificado = archivo_csv.replace('.csv', '_modificado.csv')
-    df.to_csv(archivo_modificado, index=False)
+    with medir("csv_escritura", id_actividad=str(id_actividad)):
+        df.to_csv(archivo_modificado, index=False)
     print(f"✅ CSV modificado guardado: {archivo_modificado}")
     return archivo_modificado
 
 
-def subir_a_influxdb(archivo_csv, tipo_actividad, host, token, org, database):
+def preparar_dataframe_para_influx(df, usuario, id_actividad, tipo_actividad):
+    """
+    Añade en memoria las columnas de tags (usuario, id_actividad, tipo_actividad)
+    que necesita InfluxDB, sin pasar por disco.
+    Las columnas float32 se escriben como float64 redondeado para no enviar
+    ruido de precisión (2.9 -> 2.9000000953674316).
     """
-    Sube el CSV a InfluxDB en la tabla correspondiente según el tipo de actividad.
-    Usa influxdb_client_3.
+    import numpy as np
+
+    df = df.copy()
+    for columna in df.columns[df.dtypes == np.float32]:
+        df[columna] = df[columna].astype(np.float64).round(6)
+    df['usuario'] = usuario
+    df['id_actividad'] = str(id_actividad)
+    df['tipo_actividad'] = tipo_actividad
+    return df
+
+
+def subir_a_influxdb(datos, tipo_actividad, host, token, org, database, huella=None, anterior=None):
     """
+    Sube los datos a InfluxDB en la tabla correspondiente según el tipo de actividad.
+    `datos` puede ser un DataFrame ya preparado (ruta directa, sin CSV intermedio)
+    o la ruta a un CSV modificado. Se escribe además la fila de resumen de la
+    actividad en el measurement "Resumen" y sus agregados a 10 s, 1 min y 1 h.
+    Los puntos se envían por lotes comprimidos con reintentos; los lotes que no
+    se pueden enviar quedan en el spool (data/spool/) y se reenvían en la
+    siguiente ejecución. Con `huella` (huellas.huella_streams) el resumen
+    lleva también el field `huella`. Con `anterior` (la huella de la versión
+    ya ingerida) se borra antes la fila de resumen en el mismo instante si
+    la nueva no puede sobrescribirla entera: le falta algún field o ha
+    cambiado el deporte. Los tags dependen de INFLUX_ESQUEMA
+    (esquema_influx). Devuelve True solo si todo llegó a InfluxDB.
+    """
+    import pandas as pd
+
+    from agregados import tablas_agregados
+    from cache_consultas import invalidar_measurement
+    from escritor_influx import obtener_escritor
+    from esquema_influx import adaptar_dataframe, tags_streams
+    from resumen_actividad import MEASUREMENT_RESUMEN, TAGS_RESUMEN, campos_sin_datos, dataframe_resumen
+
     try:
-        # Crear la conexión a InfluxDB
-        client = InfluxDBClient3(host=host, token=token, org=org, database=database)
+        escritor = obtener_escritor(host, token, org, database)
         
         # Determinar las columnas que son tags
-        tag_columns = ["measurement", "usuario", "id_actividad", "tipo_actividad"]
+        tag_columns = tags_streams()
+        
+        if not isinstance(datos, pd.DataFrame):
+            # CSV modificado: se lee y se escribe por la misma ruta que un DataFrame
+            with medir("csv_lectura"):
+                datos = pd.read_csv(datos, parse_dates=['timestamp_real'], dtype={'id_actividad': str})
+        datos = adaptar_dataframe(datos)
         
-        # Subir el archivo
         print(f"⏳ Subiendo datos a InfluxDB en la tabla '{tipo_actividad}'...")
-        client.write_file(
-            file=archivo_csv,
-            tag_columns=tag_columns,
-            timestamp_column="timestamp_real",
-            data_format="csv"
-        )
+        _, en_spool = escritor.escribir(datos, tipo_actividad, tag_columns, "timestamp_real")
+        
+        # Fila de resumen de la actividad en el measurement "Resumen"
+        with medir("resumen"):
+            resumen = dataframe_resumen(
+                datos,
+                datos['usuario'].iloc[0],
+                datos['id_actividad'].iloc[0],
+                tipo_actividad
+            )
+            if huella:
+                resumen['huella'] = huella
+        
+        if anterior is not None and (campos_sin_datos(resumen)
+                                     or anterior.get('tipo_actividad', tipo_actividad) != tipo_actividad):
+            # Sin borrarla, los fields que ya no tienen datos (p. ej. sin
+            # potencia) conservarían el valor de la versión anterior
+            instante = resumen['fecha_inicio'].iloc[0].value
+            try:
+                escritor.borrar(MEASUREMENT_RESUMEN, {'usuario': resumen['usuario'].iloc[0]}, instante, instante)
+            except Exception as e:
+                print(f"⚠️  No se pudo borrar el resumen anterior; puede mezclar las dos versiones: {e}")
         
+        # Agregados a 10 s, 1 min y 1 h para los paneles de rango largo, en
+        # el mismo lote que el resumen
+        tablas = [(resumen, MEASUREMENT_RESUMEN, TAGS_RESUMEN, "fecha_inicio")]
+        tablas += tablas_agregados(datos, tipo_actividad)
+        _, en_spool_derivados = escritor.escribir_varios(tablas)
+        
+        # Las consultas cacheadas sobre las tablas escritas dejan de ser válidas
+        invalidar_measurement(tipo_actividad, host, database)
+        for _, measurement, _, _ in tablas:
+            invalidar_measurement(measurement, host, database)
+        
+        en_spool += en_spool_derivados
+        if en_spool:
+            print(f"⚠️  {en_spool} lotes pendientes en el spool; se reenviarán en la próxima ejecución")
+            return False
         print(f"✅ Datos subidos exitosamente a InfluxDB (tabla: {tipo_actividad})")
-        client.close()
         return True
         
     except Exception as e:
@@ -156,48 +363,129 @@ def subir_a_influxdb(archivo_csv, tipo_actividad, host, token, org, database):
         return False
 
 
+def borrar_puntos_obsoletos(anterior, inicio, fin, usuario, id_actividad, tipo_actividad, config_influx):
+    """
+    Borra de InfluxDB los puntos que la versión anterior de una actividad
+    escribió fuera del nuevo rango [inicio, fin] (ns): la cola de un stream
+    que se ha acortado o el principio de una actividad recortada, en la
+    tabla del deporte, sus agregados y el resumen. Si ha cambiado el deporte
+    se borra la versión anterior completa. Devuelve True si todo se borró.
+    """
+    from agregados import RESOLUCIONES, measurement_agregado
+    from cache_consultas import invalidar_measurement
+    from escritor_influx import obtener_escritor
+    from esquema_influx import series_por_actividad, tags_borrado
+    from huellas import rangos_obsoletos
+    from resumen_actividad import MEASUREMENT_RESUMEN
+
+    tipo_anterior = anterior.get('tipo_actividad', tipo_actividad)
+    # Con el esquema compacto la serie es la del usuario: los intervalos
+    # alineados de los agregados pueden contener puntos de otras
+    # actividades, así que se borra solo el rango exacto de esta
+    alinear = series_por_actividad()
+    borrados = []
+    for resolucion, segundos in [(None, None)] + list(RESOLUCIONES.items()):
+        measurement = measurement_agregado(tipo_anterior, resolucion) if resolucion else tipo_anterior
+        paso = segundos * 1_000_000_000 if segundos and alinear else None
+        if tipo_anterior != tipo_actividad:
+            # Ningún punto nuevo está en las tablas del deporte anterior: se borra todo
+            rangos = [(anterior['inicio'] - anterior['inicio'] % (paso or 1), anterior['fin'])]
+        else:
+            rangos = rangos_obsoletos(anterior, inicio, fin, paso)
+        borrados.append((measurement, rangos))
+    if anterior['inicio'] != inicio:
+        # El resumen es un único punto en el inicio de la actividad (si el
+        # inicio no cambia, subir_a_influxdb ya lo borra cuando hace falta)
+        borrados.append((MEASUREMENT_RESUMEN, [(anterior['inicio'], anterior['inicio'])]))
+
+    escritor = obtener_escritor(config_influx['host'], config_influx['token'],
+                                config_influx['org'], config_influx['database'])
+    tags = tags_borrado(usuario, id_actividad)
+    try:
+        for measurement, rangos in borrados:
+            # En el Resumen id_actividad es un field: basta el usuario y el instante
+            tags_measurement = {'usuario': usuario} if measurement == MEASUREMENT_RESUMEN else tags
+            for desde, hasta in rangos:
+                escritor.borrar(measurement, tags_measurement, desde, hasta)
+                invalidar_measurement(measurement, config_influx['host'], config_influx['database'])
+    except Exception as e:
+        print(f"⚠️  No se pudieron borrar los puntos obsoletos de la actividad {id_actividad}: {e}")
+        return False
+    return True
+
+
+def actualizar_huella(df, usuario, id_actividad, tipo_actividad, huella, anterior=None, metadatos=None,
+                      config_influx=None):
+    """
+    Registra la huella de una actividad recién subida. Si había una versión
+    anterior, primero borra sus puntos obsoletos; si el borrado falla se
+    conserva el rango antiguo, de modo que se reintenta en el próximo cambio.
+    """
+    from huellas import guardar_huella, rango_tiempo
+
+    inicio, fin = rango_tiempo(df)
+    registro_inicio, registro_fin = inicio, fin
+    if anterior is not None and config_influx is not None:
+        if not borrar_puntos_obsoletos(anterior, inicio, fin, usuario, id_actividad, tipo_actividad, config_influx):
+            registro_inicio, registro_fin = min(inicio, anterior['inicio']), max(fin, anterior['fin'])
+    guardar_huella(usuario, id_actividad, {
+        'huella': huella,
+        'metadatos': metadatos,
+        'tipo_actividad': tipo_actividad,
+        'inicio': registro_inicio,
+        'fin': registro_fin,
+        'muestras': len(df),
+    })
+
+
+def obtener_config_usuario(usuario):
+    """
+    Devuelve las credenciales de Strava de un usuario: las del registro de
+    usuarios (data/usuarios.json) y, si faltan, las de las variables de entorno.
+    """
+    return config_usuario(usuario)
+
+
+def obtener_config_influx():
+    """
+    Devuelve la configuración de InfluxDB desde las variables de entorno,
+    o None si falta alguna.
+    """
+    config = {
+        'host': os.getenv('INFLUX_HOST'),
+        'token': os.getenv('INFLUX_TOKEN'),
+        'org': os.getenv('INFLUX_ORG'),
+        'database': os.getenv('INFLUX_DATABASE')
+    }
+    if not all(config.values()):
+        print("❌ Error: Faltan credenciales de InfluxDB en las variables de entorno")
+        print("   Variables necesarias: INFLUX_HOST, INFLUX_TOKEN, INFLUX_ORG, INFLUX_DATABASE")
+        return None
+    return config
+
+
 def main():
     """
     Función principal del script
     """
+    from almacen_local import guardar_actividad
+    from escritor_influx import reenviar_spool
+    from huellas import guardar_huella, huella_metadatos, huella_streams, leer_huella, sin_cambios
+
     print("\n" + "="*60)
     print("   SISTEMA DE CARGA DE DATOS STRAVA → InfluxDB")
     print("="*60 + "\n")
     
-    # Paso 1: Preguntar quién es
-    print("👤 ¿Quién eres?")
-    print("1. Alba")
-    print("2. Alonso")
-    
-    while True:
-        opcion = input("\nSelecciona 1 o 2: ").strip()
-        if opcion == '1':
-            usuario = 'Alba'
-            break
-        elif opcion == '2':
-            usuario = 'Alonso'
-            break
-        else:
-            print("❌ Opción inválida. Intenta de nuevo.")
+    # Paso 1: Preguntar quién es (usuarios del registro o del .env)
+    usuario = elegir_usuario()
+    if usuario is None:
+        return
     
     print(f"\n✅ Usuario seleccionado: {usuario}")
     
     
     # Configuración de credenciales desde variables de entorno
-    usuarios_config = {
-        'Alba': {
-            'client_id': os.getenv('STRAVA_CLIENT_ID_ALBA'),
-            'client_secret': os.getenv('STRAVA_CLIENT_SECRET_ALBA'),
-            'refresh_token': os.getenv('STRAVA_REFRESH_TOKEN_ALBA')
-        },
-        'Alonso': {
-            'client_id': os.getenv('STRAVA_CLIENT_ID_ALONSO'),
-            'client_secret': os.getenv('STRAVA_CLIENT_SECRET_ALONSO'),
-            'refresh_token': os.getenv('STRAVA_REFRESH_TOKEN_ALONSO')
-        }
-    }
-    
-    config = usuarios_config[usuario]
+    config = obtener_config_usuario(usuario)
     
     # Verificar que existen las credenciales
     if not all([config['client_id'], config['client_secret'], config['refresh_token']]):
@@ -245,29 +533,46 @@ def main():
     
     print(f"✅ Tipo de actividad: {tipo_actividad}")
     
-    # Paso 4: Descargar datos de la actividad
-    print(f"\n⏳ Descargando datos de la actividad {activity_id}...")
-    df = descargar_datos_actividad(activity_id, access_token)
+    # Paso 4: Vista previa a baja resolución (unos 100 puntos): si la
+    # respuesta es "no", no se habrá descargado la actividad completa
+    print(f"\n⏳ Descargando vista previa de la actividad {activity_id}...")
+    detalle = obtener_detalle_actividad(activity_id, access_token)
+    start_date = detalle['start_date']
+    vista_previa = descargar_datos_actividad(activity_id, access_token, start_date,
+                                             resolucion=RESOLUCION_VISTA_PREVIA, series_type="time")
     
-    if df is None:
+    if vista_previa is None:
         print("❌ No se pudieron descargar los datos de la actividad.")
         return
     
-    # Guardar CSV original
-    archivo_csv = guardar_csv(df, activity_id)
-    
     # Mostrar preview
-    print("\n📊 Vista previa de los datos (primeras 5 filas):")
-    print(df.head())
-    print(f"\n📈 Total de registros: {len(df)}")
-    print(f"📋 Columnas disponibles: {', '.join(df.columns.tolist())}")
-    
-    # Paso 4b: Preguntar si revisar y subir
-    print(f"\n⚠️  Por favor, revisa el archivo: {archivo_csv}")
-    print("    Asegúrate de que los datos son correctos antes de subirlos.")
+    print("\n📊 Vista previa de los datos (primeras 5 filas, resolución reducida):")
+    print(vista_previa.head())
+    duracion = int(vista_previa['time'].iloc[-1]) if len(vista_previa) else 0
+    print(f"\n📈 Registros en la vista previa: {len(vista_previa)} (duración: {duracion} s)")
+    print(f"📋 Columnas disponibles: {', '.join(vista_previa.columns.tolist())}")
+    
+    df = None
+    
+    def resolucion_completa():
+        # Se descarga una sola vez, cuando hace falta de verdad
+        print(f"\n⏳ Descargando la actividad {activity_id} a resolución completa...")
+        return descargar_datos_actividad(activity_id, access_token, start_date)
+    
+    # Paso 4b: Copia local opcional en CSV (ya no es necesaria para subir)
+    archivo_csv = None
+    guardar = input("\n💾 ¿Guardar también una copia en CSV? (S/N): ").strip().upper()
+    if guardar == 'S':
+        df = resolucion_completa()
+        if df is None:
+            print("❌ No se pudieron descargar los datos de la actividad.")
+            return
+        archivo_csv = guardar_csv(df, activity_id)
+        print(f"\n⚠️  Por favor, revisa el archivo: {archivo_csv}")
+        print("    Asegúrate de que los datos son correctos antes de subirlos.")
     
     while True:
-        respuesta = input("\n¿Subes el archivo a InfluxDB? (S/N): ").strip().upper()
+        respuesta = input("\n¿Subes los datos a InfluxDB? (S/N): ").strip().upper()
         if respuesta in ['S', 'N']:
             break
         else:
@@ -275,36 +580,53 @@ def main():
     
     # Paso 5: Subir a InfluxDB si el usuario acepta
     if respuesta == 'S':
-        # Preparar CSV con columnas adicionales
-        archivo_modificado = preparar_csv_para_influx(
-            archivo_csv,
+        if df is None:
+            df = resolucion_completa()
+        anterior = leer_huella(usuario, activity_id)
+        # Con updated_at, como en carga_masiva y pipeline_async: la huella de
+        # una actividad no depende del camino por el que se cargó
+        huella = huella_streams(df, detalle.get('updated_at')) if df is not None else None
+        metadatos = huella_metadatos(detalle)
+    
+    if respuesta == 'S' and df is None:
+        print("❌ No se pudieron descargar los datos de la actividad.")
+    elif respuesta == 'S' and sin_cambios(anterior, huella, tipo_actividad):
+        # Misma huella que la última subida: no hay nada que reescribir
+        print(f"\nℹ️  La actividad {activity_id} no ha cambiado desde la última subida; no se reescribe.")
+        guardar_huella(usuario, activity_id, dict(anterior, metadatos=metadatos))
+    elif respuesta == 'S':
+        # Guardar en el almacén local columnar (Parquet)
+        guardar_actividad(df, usuario, activity_id, tipo_actividad)
+        
+        # Añadir en memoria las columnas de tags
+        df_influx = preparar_dataframe_para_influx(
+            df,
             usuario,
             activity_id,
             tipo_actividad
         )
         
         # Obtener configuración de InfluxDB desde variables de entorno
-        influx_host = os.getenv('INFLUX_HOST')
-        influx_token = os.getenv('INFLUX_TOKEN')
-        influx_org = os.getenv('INFLUX_ORG')
-        influx_database = os.getenv('INFLUX_DATABASE')
-        
-        if not all([influx_host, influx_token, influx_org, influx_database]):
-            print("❌ Error: Faltan credenciales de InfluxDB en las variables de entorno")
-            print("   Variables necesarias: INFLUX_HOST, INFLUX_TOKEN, INFLUX_ORG, INFLUX_DATABASE")
+        config_influx = obtener_config_influx()
+        if config_influx is None:
             return
+        reenviar_spool(config_influx)
         
         # Subir a InfluxDB
         exito = subir_a_influxdb(
-            archivo_modificado,
+            df_influx,
             tipo_actividad,
-            influx_host,
-            influx_token,
-            influx_org,
-            influx_database
+            config_influx['host'],
+            config_influx['token'],
+            config_influx['org'],
+            config_influx['database'],
+            huella=huella,
+            anterior=anterior
         )
         
         if exito:
+            actualizar_huella(df, usuario, activity_id, tipo_actividad, huella, anterior, metadatos,
+                              config_influx=config_influx)
             print(f"\n🎉 ¡Proceso completado exitosamente!")
             print(f"   - Usuario: {usuario}")
             print(f"   - Actividad: {activity_id}")
@@ -312,9 +634,11 @@ def main():
             print(f"   - Registros: {len(df)}")
         else:
             print("\n❌ Hubo un error al subir los datos a InfluxDB.")
-    else:
+    elif archivo_csv:
         print("\n⏹️  Subida cancelada. Los datos están guardados localmente en:")
         print(f"   {archivo_csv}")
+    else:
+        print("\n⏹️  Subida cancelada. No se ha guardado ningún archivo local.")
     
     print("\n" + "="*60)
     print("   Gracias por usar el sistema")
@@ -323,7 +647,9 @@ def main():
 
 if __name__ == "__main__":
     try:
-        main()
+        # Con METRICAS_PERFIL=ruta.prof se guarda un perfil cProfile de la ejecución
+        with perfilar():
+            main()
     except KeyboardInterrupt:
         print("\n\n⏹️  Proceso interrumpido por el usuario.")
     except Exception as e:
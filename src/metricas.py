@@ -0,0 +1,277 @@
+"""
+Instrumentación del pipeline: tiempos por etapa, bytes, puntos y consultas
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Las mediciones se publican de tres formas:
+
+- Métricas Prometheus (prometheus_client). Se pueden servir en
+  http://localhost:<METRICAS_PUERTO>/metrics para que Prometheus las recoja,
+  enviar a un Pushgateway al terminar (METRICAS_PUSHGATEWAY, pensado para
+  ejecuciones cortas como cron) o volcar a un fichero de texto
+  (METRICAS_TEXTFILE, formato del textfile collector de node_exporter).
+- Logs estructurados: una línea JSON por evento en METRICAS_LOG
+  (data/logs/metricas.jsonl por defecto; vacío para desactivarlos). El
+  fichero rota al llegar a METRICAS_LOG_MAX_MB (20 por defecto) y se
+  conservan las LOG_COPIAS rotaciones anteriores.
+- Perfil opcional con cProfile de una ejecución completa (perfilar).
+
+prometheus_client se importa con la primera medición: los comandos que no
+miden nada (ayuda, gestión de usuarios) no pagan su arranque.
+"""
+
+import atexit
+import cProfile
+import json
+import logging
+import os
+from logging.handlers import RotatingFileHandler
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+
+# Cubos pensados para etapas de milisegundos (DataFrame) hasta minutos (backfill)
+CUBOS_SEGUNDOS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Rotaciones del log estructurado que se conservan (metricas.jsonl.1, .2...)
+LOG_COPIAS = 3
+
+# Registro y métricas Prometheus, creados por _crear_metricas()
+REGISTRO = None
+DURACION_ETAPA = None
+BYTES_DESCARGADOS = None
+PUNTOS_ESCRITOS = None
+BYTES_ENVIADOS = None
+DURACION_CONSULTA = None
+FILAS_CONSULTA = None
+CACHE_CONSULTAS = None
+
+_logger = logging.getLogger("strava.metricas")
+_configurado = False
+_lock = threading.Lock()
+_lock_metricas = threading.Lock()
+
+
+def _crear_metricas():
+    """
+    Importa prometheus_client y crea el registro y las métricas (una sola
+    vez por proceso).
+    """
+    global REGISTRO, DURACION_ETAPA, BYTES_DESCARGADOS, PUNTOS_ESCRITOS, BYTES_ENVIADOS
+    global DURACION_CONSULTA, FILAS_CONSULTA, CACHE_CONSULTAS
+    if REGISTRO is not None:
+        return
+    with _lock_metricas:
+        if REGISTRO is not None:
+            return
+        from prometheus_client import CollectorRegistry, Counter, Histogram
+
+        registro = CollectorRegistry()
+        DURACION_ETAPA = Histogram(
+            "strava_etapa_segundos", "Duración de cada etapa del pipeline de ingesta",
+            ["etapa"], buckets=CUBOS_SEGUNDOS, registry=registro
+        )
+        BYTES_DESCARGADOS = Counter(
+            "strava_bytes_descargados", "Bytes descargados de la API de Strava",
+            ["recurso"], registry=registro
+        )
+        PUNTOS_ESCRITOS = Counter(
+            "influx_puntos_escritos", "Puntos enviados a InfluxDB",
+            ["measurement"], registry=registro
+        )
+        BYTES_ENVIADOS = Counter(
+            "influx_bytes_enviados", "Bytes de line protocol enviados a InfluxDB (comprimidos)",
+            ["measurement"], registry=registro
+        )
+        DURACION_CONSULTA = Histogram(
+            "influx_consulta_segundos", "Latencia de las funciones de consulta",
+            ["funcion"], buckets=CUBOS_SEGUNDOS, registry=registro
+        )
+        FILAS_CONSULTA = Counter(
+            "influx_consulta_filas", "Filas devueltas por las funciones de consulta",
+            ["funcion"], registry=registro
+        )
+        CACHE_CONSULTAS = Counter(
+            "influx_cache_consultas", "Consultas resueltas por la caché (acierto) o por InfluxDB (fallo)",
+            ["resultado"], registry=registro
+        )
+        # El registro se publica el último: marca que todo lo demás ya existe
+        REGISTRO = registro
+
+
+class _FormatoJSON(logging.Formatter):
+    """
+    Una línea JSON por evento con la marca de tiempo en UTC.
+    """
+
+    def format(self, record):
+        evento = {'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds")}
+        evento.update(record.msg if isinstance(record.msg, dict) else {'mensaje': record.getMessage()})
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+def configurar():
+    """
+    Aplica la configuración de las variables de entorno (una sola vez por
+    proceso): fichero de logs, servidor /metrics y volcados al terminar.
+    """
+    global _configurado
+    with _lock:
+        if _configurado:
+            return
+        _configurado = True
+        _crear_metricas()
+
+        ruta_log = os.getenv("METRICAS_LOG", "data/logs/metricas.jsonl")
+        if ruta_log:
+            os.makedirs(os.path.dirname(ruta_log) or ".", exist_ok=True)
+            max_bytes = int(float(os.getenv("METRICAS_LOG_MAX_MB", "20")) * 1024 * 1024)
+            handler = RotatingFileHandler(ruta_log, maxBytes=max_bytes, backupCount=LOG_COPIAS, encoding="utf-8")
+            handler.setFormatter(_FormatoJSON())
+            _logger.addHandler(handler)
+            _logger.setLevel(logging.INFO)
+            _logger.propagate = False
+
+        puerto = os.getenv("METRICAS_PUERTO")
+        if puerto:
+            from prometheus_client import start_http_server
+            start_http_server(int(puerto), registry=REGISTRO)
+
+        atexit.register(volcar)
+
+
+def volcar():
+    """
+    Escribe las métricas en el textfile y/o las envía al Pushgateway, si
+    están configurados.
+    """
+    from prometheus_client import push_to_gateway, write_to_textfile
+
+    textfile = os.getenv("METRICAS_TEXTFILE")
+    if textfile:
+        os.makedirs(os.path.dirname(textfile) or ".", exist_ok=True)
+        write_to_textfile(textfile, REGISTRO)
+    pushgateway = os.getenv("METRICAS_PUSHGATEWAY")
+    if pushgateway:
+        try:
+            push_to_gateway(pushgateway, job="strava_influxdb", registry=REGISTRO)
+        except OSError as e:
+            print(f"⚠️  No se pudieron enviar las métricas al Pushgateway: {e}")
+
+
+def registrar_evento(evento, **campos):
+    """
+    Escribe un evento en el log estructurado.
+    """
+    configurar()
+    _logger.info({'evento': evento, **campos})
+
+
+@contextmanager
+def medir(etapa, **contexto):
+    """
+    Mide la duración de un bloque: la añade al histograma de la etapa y la
+    registra en el log junto con `contexto` (id de actividad, usuario...).
+    """
+    configurar()
+    inicio = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        segundos = time.perf_counter() - inicio
+        DURACION_ETAPA.labels(etapa).observe(segundos)
+        campos = {'etapa': etapa, 'segundos': round(segundos, 6), **contexto}
+        if error is not None:
+            campos['error'] = error
+        _logger.info({'evento': "etapa", **campos})
+
+
+def cronometrado(etapa):
+    """
+    Decorador equivalente a `with medir(etapa)` sobre toda la función.
+    """
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir(etapa):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def registrar_descarga(recurso, num_bytes):
+    _crear_metricas()
+    BYTES_DESCARGADOS.labels(recurso).inc(num_bytes)
+
+
+def registrar_escritura(measurement, puntos, num_bytes):
+    _crear_metricas()
+    PUNTOS_ESCRITOS.labels(measurement).inc(puntos)
+    BYTES_ENVIADOS.labels(measurement).inc(num_bytes)
+
+
+def registrar_cache(acierto):
+    _crear_metricas()
+    CACHE_CONSULTAS.labels("acierto" if acierto else "fallo").inc()
+
+
+def _filas(resultado):
+    """
+    Filas de lo que devuelve una función de consulta: DataFrame, tabla Arrow
+    o las tuplas (DataFrame, total) de consultar_en_streaming y
+    (DataFrame, resolución) de consultar_por_resolucion.
+    """
+    if isinstance(resultado, tuple):
+        return (resultado[1] or 0) if isinstance(resultado[1], int) else _filas(resultado[0])
+    if resultado is None:
+        return 0
+    return getattr(resultado, "num_rows", None) or len(resultado)
+
+
+def consulta(funcion):
+    """
+    Decorador para las funciones de consulta: latencia y filas devueltas.
+    """
+    @wraps(funcion)
+    def envoltura(*args, **kwargs):
+        configurar()
+        inicio = time.perf_counter()
+        resultado = funcion(*args, **kwargs)
+        segundos = time.perf_counter() - inicio
+        filas = _filas(resultado)
+        DURACION_CONSULTA.labels(funcion.__name__).observe(segundos)
+        FILAS_CONSULTA.labels(funcion.__name__).inc(filas)
+        _logger.info({'evento': "consulta", 'funcion': funcion.__name__,
+                      'segundos': round(segundos, 6), 'filas': filas})
+        return resultado
+    return envoltura
+
+
+@contextmanager
+def perfilar(ruta=None, lineas=25):
+    """
+    Perfila el bloque con cProfile si se indica `ruta` (o METRICAS_PERFIL):
+    guarda el volcado binario (visible con snakeviz o pstats) y muestra las
+    funciones con más tiempo acumulado.
+    """
+    ruta = ruta or os.getenv("METRICAS_PERFIL")
+    if not ruta:
+        yield
+        return
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        perfil.dump_stats(ruta)
+        print(f"\n🔬 Perfil guardado en {ruta}")
+        pstats.Stats(perfil).sort_stats("cumulative").print_stats(lineas)
@@ -0,0 +1,303 @@
+"""
+Migración de las tablas de streams al esquema compacto de InfluxDB
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Copia Run, Cycling y Swimming, sus agregados (<Tipo>_10s, _1m y _1h) y el
+Resumen de la base de datos de INFLUX_DATABASE a otra base de datos,
+escribiendo los streams y agregados con el esquema compacto (esquema_influx:
+solo usuario como tag e id_actividad como field). En una misma base de datos
+id_actividad no puede pasar de tag a field, por eso la copia va a otra.
+
+Cada measurement se recorre en ventanas de --dias días que se copian en
+paralelo (--hilos). Cada ventana se lee por lotes Arrow y se escribe con
+EscritorInflux, así que la memoria queda acotada a un lote por hilo. La
+copia es idempotente: si se interrumpe, se puede repetir.
+
+Antes de copiar se lee el Resumen del origen: el primer intervalo de los
+agregados de cada actividad pasa a llevar el timestamp de su inicio, como
+al subirla con el esquema compacto, y se avisa de las actividades del mismo
+usuario y deporte que se solapan en el tiempo, cuyos instantes comunes se
+mezclarán en el destino (ver esquema_influx).
+
+    python src/migrar_esquema.py --destino strava_compacto
+    python src/migrar_esquema.py --destino strava_compacto --tipos Run --hilos 8 --dias 30
+
+Al terminar, para usar la copia: INFLUX_DATABASE=<destino> e
+INFLUX_ESQUEMA=compacto en el .env.
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import pyarrow as pa
+from dotenv import load_dotenv
+
+from agregados import RESOLUCIONES, measurement_agregado
+from constructor_consultas import Consulta
+from esquema_influx import adaptar_dataframe, tags_streams
+from resumen_actividad import MEASUREMENT_RESUMEN, TAGS_RESUMEN
+
+load_dotenv()
+
+TIPOS = ['Run', 'Cycling', 'Swimming']
+DIAS_VENTANA = 7
+HILOS = 4
+NANOSEGUNDOS_DIA = 86_400 * 1_000_000_000
+
+
+def measurements_a_migrar(tipos):
+    """
+    Devuelve (measurement, es_resumen) de cada tabla a copiar.
+    """
+    measurements = []
+    for tipo in tipos:
+        measurements.append((tipo, False))
+        measurements += [(measurement_agregado(tipo, resolucion), False) for resolucion in RESOLUCIONES]
+    return measurements + [(MEASUREMENT_RESUMEN, True)]
+
+
+def extremos(client, database, measurement):
+    """
+    (primer, último) timestamp en ns del measurement, o None si está vacío.
+    """
+    marcas = []
+    for descendente in (False, True):
+        consulta_influx = Consulta(measurement).ordenar(descendente=descendente).limite(1)
+        try:
+            tabla = consulta_influx.ejecutar(client, database, lenguaje="influxql", cache=False)
+        except Exception:
+            # InfluxDB responde con error si el measurement no existe
+            return None
+        if tabla.num_rows == 0:
+            return None
+        marcas.append(tabla.column('time').cast("int64")[0].as_py())
+    return marcas[0], marcas[1]
+
+
+def ventanas(primero, ultimo, dias):
+    """
+    Intervalos [desde, hasta] (ns, ambos incluidos) de `dias` días alineados
+    a medianoche UTC que cubren [primero, ultimo], sin solaparse.
+    """
+    paso = dias * NANOSEGUNDOS_DIA
+    desde = primero - primero % NANOSEGUNDOS_DIA
+    while desde <= ultimo:
+        yield desde, desde + paso - 1
+        desde += paso
+
+
+def actividades_origen(client, database, tipos):
+    """
+    Lee del Resumen las actividades de los tipos indicados. Devuelve
+    id_actividad -> (usuario, tipo_actividad, inicio, fin), en ns.
+    """
+    consulta_influx = (Consulta(MEASUREMENT_RESUMEN).columnas("usuario", "tipo_actividad", "id_actividad", "fecha_fin")
+                       .donde(tipo_actividad=tipos))
+    try:
+        resumen = consulta_influx.ejecutar(client, database, lenguaje="influxql", formato="pandas", cache=False)
+    except Exception:
+        # Sin Resumen (measurement inexistente) no hay actividades que ajustar
+        return {}
+    if resumen.empty:
+        return {}
+    inicios = pd.to_datetime(resumen['time'], utc=True).astype("int64")
+    fines = pd.to_datetime(resumen['fecha_fin'], utc=True).astype("int64")
+    return {str(id_actividad): (usuario, tipo, int(inicio), int(fin))
+            for id_actividad, usuario, tipo, inicio, fin
+            in zip(resumen['id_actividad'], resumen['usuario'], resumen['tipo_actividad'], inicios, fines)}
+
+
+def solapamientos(actividades):
+    """
+    Pares de ids del mismo usuario y deporte cuyos rangos de tiempo se
+    solapan: con el esquema compacto comparten serie e instantes.
+    """
+    por_serie = {}
+    for id_actividad, (usuario, tipo, inicio, fin) in actividades.items():
+        por_serie.setdefault((usuario, tipo), []).append((inicio, fin, id_actividad))
+    pares = []
+    for rangos in por_serie.values():
+        rangos.sort()
+        fin_anterior, id_anterior = None, None
+        for inicio, fin, id_actividad in rangos:
+            if fin_anterior is not None and inicio <= fin_anterior:
+                pares.append((id_anterior, id_actividad))
+            if fin_anterior is None or fin > fin_anterior:
+                fin_anterior, id_anterior = fin, id_actividad
+    return pares
+
+
+def tablas_destino(tabla, measurement, es_resumen, inicios=None):
+    """
+    Convierte un lote Arrow leído del origen en tuplas (df, measurement,
+    tags, timestamp) para EscritorInflux.escribir_varios, una por actividad.
+    Dentro de una actividad cada stream está en todas las filas o en
+    ninguna: las columnas vacías se quitan y los enteros que pandas ha
+    pasado a float por los nulos de otras actividades vuelven a ser enteros,
+    para no cambiar el tipo de los fields en el destino. Con `inicios`
+    (id_actividad -> ns) ningún punto queda antes del inicio de su
+    actividad: el primer intervalo de los agregados, alineado a la época en
+    el origen, pasa al inicio de la actividad.
+    """
+    enteros = [campo.name for campo in tabla.schema if pa.types.is_integer(campo.type)]
+    df = tabla.to_pandas().drop(columns=['iox::measurement'], errors='ignore')
+    if es_resumen:
+        df = df.rename(columns={'time': 'fecha_inicio'})
+        tags, columna_tiempo = TAGS_RESUMEN, "fecha_inicio"
+    else:
+        df = adaptar_dataframe(df.rename(columns={'time': 'timestamp_real'}), "compacto")
+        tags, columna_tiempo = tags_streams("compacto"), "timestamp_real"
+    df['id_actividad'] = df['id_actividad'].astype(str)
+
+    resultado = []
+    for id_actividad, actividad in df.groupby('id_actividad', sort=False):
+        actividad = actividad.dropna(axis=1, how='all')
+        inicio = inicios.get(id_actividad) if inicios and not es_resumen else None
+        if inicio is not None:
+            marcas = actividad[columna_tiempo]
+            antes = marcas.astype("int64") < inicio
+            if antes.any():
+                actividad[columna_tiempo] = marcas.mask(antes, pd.Timestamp(inicio, unit="ns", tz=marcas.dt.tz))
+        for columna in enteros:
+            if columna in actividad.columns and columna not in tags:
+                actividad[columna] = actividad[columna].astype("int64")
+        resultado.append((actividad, measurement, tags, columna_tiempo))
+    return resultado
+
+
+def main():
+    """
+    Copia las tablas al esquema compacto en paralelo y muestra el resumen.
+    """
+    from influxdb_client_3 import InfluxDBClient3
+
+    from cache_consultas import invalidar_measurement
+    from escritor_influx import obtener_escritor, reenviar_spool
+    from main import obtener_config_influx
+
+    parser = argparse.ArgumentParser(description="Copia los datos de InfluxDB al esquema compacto")
+    parser.add_argument("--destino", required=True, help="Base de datos de destino (debe existir)")
+    parser.add_argument("--tipos", nargs="+", default=TIPOS)
+    parser.add_argument("--hilos", type=int, default=HILOS)
+    parser.add_argument("--dias", type=int, default=DIAS_VENTANA, help="Días por ventana de copia")
+    args = parser.parse_args()
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return
+    origen = config_influx['database']
+    if args.destino == origen:
+        print("❌ El destino debe ser otra base de datos: un tag no puede pasar a field en la misma")
+        return
+
+    print("\n" + "="*60)
+    print("   MIGRACIÓN AL ESQUEMA COMPACTO")
+    print("="*60)
+    print(f"   {origen} → {args.destino} ({', '.join(args.tipos)}, {args.hilos} hilos)\n")
+
+    config_destino = dict(config_influx, database=args.destino)
+    reenviar_spool(config_destino)
+    escritor = obtener_escritor(config_influx['host'], config_influx['token'], config_influx['org'], args.destino)
+
+    # Un cliente de consultas por hilo
+    locales = threading.local()
+    clientes = []
+    lock = threading.Lock()
+
+    def cliente():
+        if not hasattr(locales, "client"):
+            locales.client = InfluxDBClient3(host=config_influx['host'], token=config_influx['token'],
+                                             org=config_influx['org'], database=origen)
+            with lock:
+                clientes.append(locales.client)
+        return locales.client
+
+    def migrar_ventana(measurement, es_resumen, desde, hasta):
+        filas = escritas = en_spool = 0
+        consulta_influx = Consulta(measurement).entre(desde, hasta)
+        if es_resumen:
+            consulta_influx = consulta_influx.donde(tipo_actividad=args.tipos)
+        for lote in consulta_influx.lector(cliente(), origen, lenguaje="influxql"):
+            if lote.num_rows == 0:
+                continue
+            tablas = tablas_destino(pa.Table.from_batches([lote]), measurement, es_resumen, inicios)
+            filas += lote.num_rows
+            escritas += sum(len(df) for df, _, _, _ in tablas)
+            _, pendientes = escritor.escribir_varios(tablas)
+            en_spool += pendientes
+        return filas, escritas, en_spool
+
+    actividades = actividades_origen(cliente(), origen, args.tipos)
+    inicios = {id_actividad: inicio for id_actividad, (_, _, inicio, _) in actividades.items()}
+    pares = solapamientos(actividades)
+    if pares:
+        print(f"⚠️  {len(pares)} pares de actividades del mismo usuario y deporte se solapan en el tiempo;")
+        print("   con el esquema compacto sus instantes comunes se mezclarán. Por ejemplo:")
+        for id_a, id_b in pares[:5]:
+            print(f"   - {id_a} y {id_b}")
+
+    inicio = time.perf_counter()
+    totales = {}
+    with ThreadPoolExecutor(max_workers=args.hilos) as pool:
+        futuros = {}
+        for measurement, es_resumen in measurements_a_migrar(args.tipos):
+            rango = extremos(cliente(), origen, measurement)
+            totales[measurement] = {'filas': 0, 'escritas': 0, 'en_spool': 0, 'errores': 0}
+            if rango is None:
+                continue
+            for desde, hasta in ventanas(*rango, args.dias):
+                futuro = pool.submit(migrar_ventana, measurement, es_resumen, _fecha(desde), _fecha(hasta))
+                futuros[futuro] = measurement
+        print(f"⏳ {len(futuros)} ventanas de {args.dias} días en cola...")
+
+        for futuro in as_completed(futuros):
+            measurement = futuros[futuro]
+            try:
+                filas, escritas, en_spool = futuro.result()
+                totales[measurement]['filas'] += filas
+                totales[measurement]['escritas'] += escritas
+                totales[measurement]['en_spool'] += en_spool
+            except Exception as e:
+                print(f"❌ Ventana de {measurement} fallida: {e}")
+                totales[measurement]['errores'] += 1
+
+    for client in clientes:
+        client.close()
+    segundos = time.perf_counter() - inicio
+    for measurement in totales:
+        invalidar_measurement(measurement, config_influx['host'], args.destino)
+
+    print("\n" + "="*60)
+    print("   RESUMEN DE LA MIGRACIÓN")
+    print("="*60)
+    fallos = 0
+    for measurement, total in totales.items():
+        estado = "❌" if total['errores'] else ("⏳" if total['en_spool'] else "✅")
+        print(f"{estado} {measurement:<16} {total['filas']:>10} leídos  {total['escritas']:>10} escritos"
+              + (f"  {total['errores']} ventanas fallidas" if total['errores'] else "")
+              + (f"  {total['en_spool']} lotes en el spool" if total['en_spool'] else ""))
+        fallos += total['errores'] + total['en_spool']
+    escritas = sum(total['escritas'] for total in totales.values())
+    print(f"\n⏱️  {escritas} puntos en {segundos:.1f} s ({escritas / max(segundos, 1e-9):,.0f} puntos/s)")
+    if fallos:
+        print("⚠️  La migración está incompleta: repítela (es idempotente) antes de cambiar de base de datos")
+    else:
+        print(f"✅ Para usar la copia: INFLUX_DATABASE={args.destino} e INFLUX_ESQUEMA=compacto")
+    print("="*60)
+
+
+def _fecha(nanosegundos):
+    return pd.Timestamp(nanosegundos, unit="ns", tz="UTC")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⏹️  Proceso interrumpido por el usuario.")
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
@@ -0,0 +1,379 @@
+"""
+Pipeline asíncrono de ingesta Strava → InfluxDB
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Cada etapa es un grupo de trabajadores asyncio que lee de una cola acotada y
+escribe en la siguiente:
+
+    listado → streams → transformación → escritura
+
+Los metadatos (deporte, start_date, campos de la huella) vienen del listado,
+así que no hay etapa propia para el detalle de cada actividad: solo se pide,
+dentro de la etapa de streams, si falta start_date.
+
+Las colas acotadas mantienen la memoria constante y propagan la presión hacia
+atrás: si InfluxDB va lento, la cola de escritura se llena, la transformación
+se bloquea y se dejan de descargar streams. Cada etapa tiene su propio límite
+de concurrencia. Las llamadas bloqueantes (requests, pandas, escritura) se
+ejecutan en hilos con asyncio.to_thread, de modo que las esperas de red de
+Strava y de InfluxDB se solapan.
+
+Uso:
+    python src/pipeline_async.py Alba --desde 2025-01-01 --streams 4 --escritura 2
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from almacen_local import guardar_actividad
+from carga_masiva import _leer_fecha, paginas_actividades, tipo_measurement
+from cliente_strava import LimitadorTasa
+from escritor_influx import reenviar_spool
+from huellas import guardar_huella, huella_metadatos, huella_streams, leer_huella, metadatos_sin_cambios, sin_cambios
+from main import (
+    actualizar_huella,
+    descargar_streams,
+    obtener_config_influx,
+    obtener_config_usuario,
+    obtener_proveedor_token,
+    obtener_start_date,
+    preparar_dataframe_para_influx,
+    streams_a_dataframe,
+    subir_a_influxdb,
+)
+
+# Trabajadores por etapa (el listado es siempre secuencial)
+CONCURRENCIA_POR_DEFECTO = {
+    'streams': 4,
+    'transformacion': 2,
+    'escritura': 4,
+}
+TAMANO_COLA = 8
+
+# Marca de fin de datos que se propaga de una etapa a la siguiente
+_FIN = object()
+
+
+class EstadisticasEtapa:
+    """
+    Contadores de una etapa: elementos procesados, errores, latencias,
+    profundidad de su cola de entrada y tiempo bloqueado esperando hueco en
+    la cola de salida (presión de la etapa siguiente).
+    """
+
+    def __init__(self, nombre, cola):
+        self.nombre = nombre
+        self.cola = cola
+        self.procesados = 0
+        self.errores = 0
+        self.latencias = []
+        self.cola_max = 0
+        self.bloqueado = 0.0
+
+    def muestrear_cola(self):
+        if self.cola is not None:
+            self.cola_max = max(self.cola_max, self.cola.qsize())
+
+    def resumen(self):
+        latencias = np.array(self.latencias) if self.latencias else np.zeros(1)
+        return {
+            'etapa': self.nombre,
+            'procesados': self.procesados,
+            'errores': self.errores,
+            'latencia_media_ms': round(float(latencias.mean()) * 1000, 1),
+            'latencia_p95_ms': round(float(np.percentile(latencias, 95)) * 1000, 1),
+            'cola_max': self.cola_max,
+            'bloqueado_s': round(self.bloqueado, 2),
+        }
+
+
+async def _poner(cola, elemento, estadisticas):
+    """
+    Encola midiendo cuánto tiempo se espera por falta de hueco.
+    """
+    inicio = time.perf_counter()
+    await cola.put(elemento)
+    estadisticas.bloqueado += time.perf_counter() - inicio
+
+
+async def _etapa(funcion, entrada, salida, concurrencia, estadisticas, resumen):
+    """
+    Lanza `concurrencia` trabajadores que aplican `funcion` (bloqueante, en un
+    hilo) a cada trabajo de `entrada` y pasan el resultado a `salida`. Un
+    trabajo que falla se anota en resumen['fallidas'] y no continúa; si
+    `funcion` devuelve None, el trabajo termina ahí sin error.
+    Al terminar todos los trabajadores se envía _FIN a la etapa siguiente.
+    """
+
+    async def trabajador():
+        while True:
+            trabajo = await entrada.get()
+            estadisticas.cola_max = max(estadisticas.cola_max, entrada.qsize() + 1)
+            if trabajo is _FIN:
+                # Se devuelve la marca para que la vean el resto de trabajadores
+                await entrada.put(_FIN)
+                return
+            inicio = time.perf_counter()
+            try:
+                trabajo = await asyncio.to_thread(funcion, trabajo)
+            except Exception as e:
+                estadisticas.errores += 1
+                id_actividad = trabajo['actividad']['id']
+                print(f"❌ Actividad {id_actividad} fallida en {estadisticas.nombre}: {e}")
+                resumen['fallidas'][id_actividad] = f"{estadisticas.nombre}: {e}"
+                continue
+            estadisticas.latencias.append(time.perf_counter() - inicio)
+            estadisticas.procesados += 1
+            if salida is not None and trabajo is not None:
+                await _poner(salida, trabajo, estadisticas)
+
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    if salida is not None:
+        await salida.put(_FIN)
+
+
+async def _monitor(estadisticas, intervalo):
+    """
+    Muestra periódicamente la profundidad de cada cola.
+    """
+    while True:
+        await asyncio.sleep(intervalo)
+        for etapa in estadisticas:
+            etapa.muestrear_cola()
+        colas = " | ".join(
+            f"{e.nombre}: {e.cola.qsize()}/{e.cola.maxsize} ({e.procesados} ok)"
+            for e in estadisticas if e.cola is not None
+        )
+        print(f"📊 Colas → {colas}")
+
+
+async def ejecutar_pipeline(usuario, access_token, config_influx, actividades=None, despues=None, antes=None,
+                            concurrencia=None, tamano_cola=TAMANO_COLA, limitador=None, intervalo_monitor=5.0,
+                            forzar=False):
+    """
+    Ejecuta el pipeline completo. Si no se pasan `actividades`, se listan
+    desde Strava (entre `despues` y `antes`, epoch). Devuelve un resumen con
+    el mismo formato que carga_masiva.cargar_actividades más las
+    estadísticas de cada etapa en resumen['etapas']. Las actividades sin
+    cambios desde la última ingesta no se reescriben salvo con `forzar`.
+    `access_token` es el token o la función de obtener_proveedor_token.
+    """
+    concurrencia = {**CONCURRENCIA_POR_DEFECTO, **(concurrencia or {})}
+    limitador = limitador or LimitadorTasa()
+    resumen = {'correctas': [], 'fallidas': {}, 'omitidas': [], 'sin_cambios': [], 'muestras': 0, 'segundos': 0.0}
+
+    nombres = ['streams', 'transformacion', 'escritura']
+    colas = {nombre: asyncio.Queue(maxsize=tamano_cola) for nombre in nombres}
+    estadisticas = {'listado': EstadisticasEtapa('listado', None)}
+    estadisticas.update({nombre: EstadisticasEtapa(nombre, colas[nombre]) for nombre in nombres})
+    # Las etapas corren en varios hilos a la vez: el resumen se actualiza con el lock
+    lock_resumen = threading.Lock()
+
+    # --- funciones de cada etapa (bloqueantes, se ejecutan en hilos) ---
+
+    def etapa_streams(trabajo):
+        actividad = trabajo['actividad']
+        trabajo['streams'] = descargar_streams(actividad['id'], access_token, limitador)
+        if trabajo['streams'] is None:
+            raise RuntimeError("no se pudieron descargar los streams")
+        # El listado ya trae start_date; el detalle solo se pide si falta
+        if not actividad.get('start_date'):
+            actividad['start_date'] = obtener_start_date(actividad['id'], access_token, limitador)
+        return trabajo
+
+    def etapa_transformacion(trabajo):
+        actividad = trabajo['actividad']
+        id_actividad = str(actividad['id'])
+        tipo_actividad = tipo_measurement(actividad)
+        start_date = datetime.strptime(actividad['start_date'], "%Y-%m-%dT%H:%M:%SZ")
+        df = streams_a_dataframe(trabajo.pop('streams'), start_date)
+
+        anterior = leer_huella(usuario, id_actividad)
+        metadatos = huella_metadatos(actividad)
+        huella = huella_streams(df, actividad.get('updated_at'))
+        if not forzar and sin_cambios(anterior, huella, tipo_actividad):
+            guardar_huella(usuario, id_actividad, dict(anterior, metadatos=metadatos))
+            with lock_resumen:
+                resumen['correctas'].append(actividad)
+                resumen['sin_cambios'].append(actividad)
+            return None
+
+        guardar_actividad(df, usuario, id_actividad, tipo_actividad)
+        trabajo['df'] = preparar_dataframe_para_influx(df, usuario, id_actividad, tipo_actividad)
+        trabajo['original'] = df
+        trabajo.update(huella=huella, anterior=anterior, metadatos=metadatos)
+        return trabajo
+
+    def etapa_escritura(trabajo):
+        df = trabajo.pop('df')
+        id_actividad = str(trabajo['actividad']['id'])
+        tipo_actividad = tipo_measurement(trabajo['actividad'])
+        exito = subir_a_influxdb(
+            df,
+            tipo_actividad,
+            config_influx['host'],
+            config_influx['token'],
+            config_influx['org'],
+            config_influx['database'],
+            huella=trabajo['huella'],
+            anterior=trabajo['anterior']
+        )
+        if not exito:
+            raise RuntimeError("error al subir a InfluxDB")
+        actualizar_huella(trabajo.pop('original'), usuario, id_actividad, tipo_actividad, trabajo['huella'],
+                          trabajo['anterior'], trabajo['metadatos'], config_influx)
+        with lock_resumen:
+            resumen['correctas'].append(trabajo['actividad'])
+            resumen['muestras'] += len(df)
+        return trabajo
+
+    # --- productor: listado de actividades ---
+
+    def paginas():
+        if actividades is not None:
+            return iter([actividades])
+        return paginas_actividades(access_token, despues, antes, limitador)
+
+    async def listado():
+        iterador = paginas()
+        while True:
+            inicio = time.perf_counter()
+            lote = await asyncio.to_thread(next, iterador, None)
+            if lote is None:
+                break
+            estadisticas['listado'].latencias.append(time.perf_counter() - inicio)
+            for actividad in lote:
+                if tipo_measurement(actividad) is None:
+                    resumen['omitidas'].append(actividad['id'])
+                    continue
+                if not forzar and metadatos_sin_cambios(actividad, usuario):
+                    # Ya ingerida y sin editar: no se descargan sus streams
+                    resumen['correctas'].append(actividad)
+                    resumen['sin_cambios'].append(actividad)
+                    continue
+                estadisticas['listado'].procesados += 1
+                await _poner(colas['streams'], {'actividad': actividad}, estadisticas['listado'])
+        await colas['streams'].put(_FIN)
+
+    funciones = {
+        'streams': etapa_streams,
+        'transformacion': etapa_transformacion,
+        'escritura': etapa_escritura,
+    }
+
+    # Un hilo por trabajador para que ninguna etapa se quede sin hilos libres
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=sum(concurrencia.values()) + 1))
+
+    inicio = time.perf_counter()
+    monitor = asyncio.create_task(_monitor(list(estadisticas.values()), intervalo_monitor))
+    tareas = [listado()]
+    for i, nombre in enumerate(nombres):
+        siguiente = nombres[i + 1] if i + 1 < len(nombres) else None
+        tareas.append(_etapa(
+            funciones[nombre],
+            colas[nombre],
+            colas[siguiente] if siguiente else None,
+            concurrencia[nombre],
+            estadisticas[nombre],
+            resumen
+        ))
+    try:
+        await asyncio.gather(*tareas)
+    finally:
+        monitor.cancel()
+
+    resumen['segundos'] = time.perf_counter() - inicio
+    resumen['etapas'] = [e.resumen() for e in estadisticas.values()]
+    mostrar_estadisticas(resumen)
+    return resumen
+
+
+def mostrar_estadisticas(resumen):
+    """
+    Muestra el resultado del pipeline y las estadísticas de cada etapa.
+    """
+    segundos = max(resumen['segundos'], 1e-9)
+    print("\n" + "="*60)
+    print("   RESUMEN DEL PIPELINE ASÍNCRONO")
+    print("="*60)
+    print(f"✅ Correctas: {len(resumen['correctas'])}")
+    print(f"⏸️  Sin cambios (no reescritas): {len(resumen['sin_cambios'])}")
+    print(f"❌ Fallidas: {len(resumen['fallidas'])}")
+    print(f"⏭️  Omitidas (deporte no soportado): {len(resumen['omitidas'])}")
+    print(f"⏱️  Tiempo total: {resumen['segundos']:.1f} s")
+    print(f"🚀 Actividades/min: {len(resumen['correctas']) * 60 / segundos:.1f}")
+    print(f"📈 Muestras/s: {resumen['muestras'] / segundos:.0f}")
+    print(f"\n{'Etapa':<15}{'ok':>6}{'err':>5}{'media ms':>10}{'p95 ms':>9}{'cola máx':>10}{'bloqueo s':>11}")
+    for e in resumen['etapas']:
+        print(f"{e['etapa']:<15}{e['procesados']:>6}{e['errores']:>5}{e['latencia_media_ms']:>10}"
+              f"{e['latencia_p95_ms']:>9}{e['cola_max']:>10}{e['bloqueado_s']:>11}")
+    print("="*60)
+
+
+def cargar_actividades_async(actividades, usuario, access_token, config_influx, concurrencia=None,
+                             tamano_cola=TAMANO_COLA, limitador=None, forzar=False):
+    """
+    Equivalente síncrono de carga_masiva.cargar_actividades usando el pipeline.
+    """
+    return asyncio.run(ejecutar_pipeline(
+        usuario, access_token, config_influx, actividades=actividades,
+        concurrencia=concurrencia, tamano_cola=tamano_cola, limitador=limitador, forzar=forzar
+    ))
+
+
+def main():
+    """
+    Función principal del pipeline asíncrono (no interactiva)
+    """
+    parser = argparse.ArgumentParser(description="Pipeline asíncrono Strava → InfluxDB")
+    parser.add_argument("usuario", help="Usuario a cargar (p. ej. Alba)")
+    parser.add_argument("--desde", help="AAAA-MM-DD")
+    parser.add_argument("--hasta", help="AAAA-MM-DD")
+    parser.add_argument("--cola", type=int, default=TAMANO_COLA, help="tamaño de cada cola")
+    parser.add_argument("--forzar", action="store_true", help="reescribe también las actividades sin cambios")
+    for nombre, valor in CONCURRENCIA_POR_DEFECTO.items():
+        parser.add_argument(f"--{nombre}", type=int, default=valor, help=f"trabajadores de {nombre}")
+    args = parser.parse_args()
+
+    config = obtener_config_usuario(args.usuario)
+    if not all(config.values()):
+        print(f"❌ Error: Faltan credenciales de Strava para {args.usuario} en las variables de entorno")
+        return
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return
+    reenviar_spool(config_influx)
+
+    access_token = obtener_proveedor_token(
+        config['client_id'],
+        config['client_secret'],
+        config['refresh_token'],
+        args.usuario
+    )
+    if not access_token:
+        print("❌ No se pudo obtener el token de acceso. Abortando.")
+        return
+
+    concurrencia = {nombre: getattr(args, nombre) for nombre in CONCURRENCIA_POR_DEFECTO}
+    asyncio.run(ejecutar_pipeline(
+        args.usuario, access_token, config_influx,
+        despues=_leer_fecha(args.desde), antes=_leer_fecha(args.hasta),
+        concurrencia=concurrencia, tamano_cola=args.cola, forzar=args.forzar
+    ))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⏹️  Proceso interrumpido por el usuario.")
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
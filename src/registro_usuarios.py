@@ -0,0 +1,144 @@
+"""
+Registro de atletas (usuarios) y sus credenciales de Strava
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Los atletas se dan de alta en data/usuarios.json (o en la ruta indicada en
+REGISTRO_USUARIOS):
+
+    {
+      "usuarios": {
+        "Alba":   {"client_id": "123", "client_secret": "...", "refresh_token": "..."},
+        "Carlos": {"client_id": "456"}
+      }
+    }
+
+Cualquier credencial que falte en el registro se toma de las variables de
+entorno STRAVA_CLIENT_ID_<USUARIO>, STRAVA_CLIENT_SECRET_<USUARIO> y
+STRAVA_REFRESH_TOKEN_<USUARIO>, de modo que los .env existentes siguen
+funcionando sin registro. El fichero contiene secretos: se guarda con
+permisos 0600.
+
+El nombre forma parte de rutas (data/huellas/<usuario>/, la partición
+usuario=<usuario> del almacén...), así que solo admite letras, dígitos,
+"_" y "-".
+"""
+
+import json
+import os
+import re
+import threading
+
+RUTA_REGISTRO = os.getenv("REGISTRO_USUARIOS", "data/usuarios.json")
+CAMPOS_CREDENCIALES = ('client_id', 'client_secret', 'refresh_token')
+
+_PATRON_ENV = re.compile(r"^STRAVA_CLIENT_ID_(\w+)$")
+_PATRON_NOMBRE = re.compile(r"^[\w-]+$")
+_lock = threading.Lock()
+
+
+def cargar_registro(ruta=RUTA_REGISTRO):
+    """
+    Devuelve el diccionario nombre -> datos del registro (vacío si no existe).
+    """
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f).get('usuarios', {})
+
+
+def guardar_registro(usuarios, ruta=RUTA_REGISTRO):
+    """
+    Guarda el registro de forma atómica y con permisos solo para el propietario.
+    """
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+    temporal = ruta + ".tmp"
+    descriptor = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, "w", encoding="utf-8") as f:
+        json.dump({'usuarios': usuarios}, f, indent=2, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def registrar_usuario(nombre, ruta=RUTA_REGISTRO, **datos):
+    """
+    Da de alta (o actualiza) un atleta en el registro. Los valores None no
+    se guardan y se seguirán leyendo de las variables de entorno. Lanza
+    ValueError si el nombre no es válido como componente de ruta.
+    """
+    if not _PATRON_NOMBRE.match(nombre):
+        raise ValueError(f"Nombre de usuario no válido: {nombre!r} (solo letras, dígitos, '_' y '-')")
+    with _lock:
+        usuarios = cargar_registro(ruta)
+        entrada = usuarios.get(nombre, {})
+        entrada.update({clave: valor for clave, valor in datos.items() if valor is not None})
+        usuarios[nombre] = entrada
+        guardar_registro(usuarios, ruta)
+    return entrada
+
+
+def eliminar_usuario(nombre, ruta=RUTA_REGISTRO):
+    """
+    Da de baja un atleta del registro. Devuelve False si no estaba.
+    """
+    with _lock:
+        usuarios = cargar_registro(ruta)
+        if usuarios.pop(nombre, None) is None:
+            return False
+        guardar_registro(usuarios, ruta)
+    return True
+
+
+def _usuarios_entorno():
+    """
+    Usuarios con credenciales en variables de entorno (STRAVA_CLIENT_ID_<USUARIO>).
+    """
+    return [m.group(1).capitalize() for m in map(_PATRON_ENV.match, os.environ) if m]
+
+
+def listar_usuarios(ruta=RUTA_REGISTRO):
+    """
+    Nombres de los atletas disponibles: los del registro y, a continuación,
+    los que solo están configurados en variables de entorno.
+    """
+    usuarios = list(cargar_registro(ruta))
+    conocidos = {u.upper() for u in usuarios}
+    usuarios += sorted(u for u in _usuarios_entorno() if u.upper() not in conocidos)
+    return usuarios
+
+
+def config_usuario(usuario, ruta=RUTA_REGISTRO):
+    """
+    Devuelve las credenciales de Strava de un atleta: primero las del
+    registro y, para las que falten, las de las variables de entorno.
+    """
+    registro = cargar_registro(ruta)
+    # Búsqueda sin distinguir mayúsculas, igual que con las variables de entorno
+    entrada = next((datos for nombre, datos in registro.items() if nombre.upper() == usuario.upper()), {})
+    sufijo = usuario.upper()
+    return {
+        campo: entrada.get(campo) or os.getenv(f"STRAVA_{campo.upper()}_{sufijo}")
+        for campo in CAMPOS_CREDENCIALES
+    }
+
+
+def elegir_usuario(ruta=RUTA_REGISTRO):
+    """
+    Menú interactivo para elegir un atleta. Devuelve el nombre, o None si no
+    hay ninguno configurado.
+    """
+    usuarios = listar_usuarios(ruta)
+    if not usuarios:
+        print("❌ No hay usuarios registrados. Añade uno con: python src/cli.py usuarios alta NOMBRE")
+        return None
+
+    print("👤 ¿Quién eres?")
+    for i, nombre in enumerate(usuarios, 1):
+        print(f"{i}. {nombre}")
+
+    while True:
+        opcion = input(f"\nSelecciona 1-{len(usuarios)}: ").strip()
+        if opcion.isdigit() and 1 <= int(opcion) <= len(usuarios):
+            return usuarios[int(opcion) - 1]
+        print("❌ Opción inválida. Intenta de nuevo.")
@@ -0,0 +1,104 @@
+"""
+Resumen por actividad calculado en el momento de la ingesta
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Junto con los puntos de cada actividad se escribe una única fila en el
+measurement "Resumen" con las métricas que la memoria calculaba agrupando
+toda la tabla por usuario e id_actividad (distancia, duración, ritmo, FC,
+desnivel, eficiencia aeróbica y FC máxima en ventana móvil de 10 s), y la
+caja envolvente de la ruta GPS.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analitica import media_movil_tiempo
+from geo import caja_envolvente, coordenadas
+
+MEASUREMENT_RESUMEN = "Resumen"
+
+# Tags del resumen: una serie por usuario y deporte. El id de la actividad se
+# guarda como field (el timestamp de inicio ya identifica cada fila).
+TAGS_RESUMEN = ["usuario", "tipo_actividad"]
+
+# Fields que faltan cuando la actividad no tiene los datos (sin distancia,
+# pulsómetro o GPS). El line protocol no admite nulos, así que al reescribir
+# una actividad sin alguno de ellos hay que borrar antes su fila anterior
+CAMPOS_OPCIONALES = ['distancia_m', 'ritmo_min_km', 'fc_media', 'fc_max', 'fc_max_10s', 'eficiencia_aerobica',
+                     'lat_min', 'lat_max', 'lon_min', 'lon_max']
+
+
+def _columna(df, nombre):
+    """
+    Devuelve la columna como array float64 (NaN si no existe).
+    """
+    if nombre not in df.columns:
+        return np.full(len(df), np.nan)
+    return df[nombre].to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def calcular_resumen(df):
+    """
+    Calcula el resumen de una actividad a partir de su DataFrame de streams.
+    """
+    tiempos = df['timestamp_real'].to_numpy(dtype="datetime64[ns]")
+    segundos = (tiempos - tiempos[0]) / np.timedelta64(1, "s")
+    distancia = _columna(df, 'distance')
+    altitud = _columna(df, 'altitude')
+    velocidad = _columna(df, 'velocity_smooth')
+    pulso = _columna(df, 'heartrate')
+
+    distancia_m = float(np.nanmax(distancia)) if not np.isnan(distancia).all() else np.nan
+    duracion_s = float(segundos[-1]) if len(segundos) else 0.0
+    ritmo = (duracion_s / 60.0) / (distancia_m / 1000.0) if distancia_m and distancia_m > 0 else np.nan
+
+    # Desnivel positivo acumulado
+    desnivel = np.diff(altitud)
+    desnivel_positivo = float(np.nansum(desnivel[desnivel > 0])) if len(desnivel) else 0.0
+
+    # Eficiencia aeróbica media: AVG(velocity_smooth / heartrate)
+    con_pulso = pulso > 0
+    eficiencia = velocidad[con_pulso] / pulso[con_pulso]
+    eficiencia = float(np.nanmean(eficiencia)) if (~np.isnan(eficiencia)).any() else np.nan
+
+    lat, lon, validos = coordenadas(df)
+    caja = caja_envolvente(lat[validos], lon[validos]) or {}
+
+    hay_pulso = (~np.isnan(pulso)).any()
+    return {
+        'fecha_inicio': pd.Timestamp(tiempos[0]),
+        'fecha_fin': pd.Timestamp(tiempos[-1]),
+        'muestras': len(df),
+        'distancia_m': distancia_m,
+        'duracion_s': duracion_s,
+        'ritmo_min_km': ritmo,
+        'fc_media': float(np.nanmean(pulso)) if hay_pulso else np.nan,
+        'fc_max': float(np.nanmax(pulso)) if hay_pulso else np.nan,
+        'fc_max_10s': float(np.nanmax(media_movil_tiempo(segundos, pulso, 10.0))) if hay_pulso else np.nan,
+        'desnivel_positivo_m': desnivel_positivo,
+        'eficiencia_aerobica': eficiencia,
+        **caja,
+    }
+
+
+def dataframe_resumen(df, usuario, id_actividad, tipo_actividad):
+    """
+    Devuelve un DataFrame de una fila con el resumen listo para escribir en
+    el measurement "Resumen" (timestamp = inicio de la actividad).
+    """
+    resumen = calcular_resumen(df)
+    resumen['fecha_fin'] = resumen['fecha_fin'].isoformat()
+    resumen['id_actividad'] = str(id_actividad)
+    resumen['usuario'] = usuario
+    resumen['tipo_actividad'] = tipo_actividad
+    fila = pd.DataFrame([resumen])
+    # Los campos sin datos (p. ej. sin pulsómetro) no se escriben
+    return fila.dropna(axis=1)
+
+
+def campos_sin_datos(fila):
+    """
+    Fields opcionales que no lleva una fila de dataframe_resumen.
+    """
+    return [campo for campo in CAMPOS_OPCIONALES if campo not in fila.columns]
@@ -0,0 +1,148 @@
+"""
+Servicio residente para la línea de comandos
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Cada ejecución de cli.py es un proceso nuevo que vuelve a importar pandas,
+pyarrow e influxdb_client_3 y a abrir la conexión Flight con InfluxDB. Con
+cron lanzando consultas cientos de veces al día, ese arranque pesa más que
+la consulta. El servicio mantiene un proceso caliente con las dependencias
+ya importadas y el cliente de InfluxDB abierto, y ejecuta los comandos que
+le llegan por un socket Unix (data/cli.sock o la ruta de CLI_SOCKET):
+
+    python src/cli.py servicio                    # en primer plano (Ctrl+C para parar)
+    python src/cli.py --servicio query --deporte Run --limite 5
+    python src/cli.py servicio --parar
+
+El proceso cliente solo importa la biblioteca estándar. Si el servicio no
+está arrancado (o el sistema no tiene sockets Unix), el comando se ejecuta
+en el propio proceso como siempre.
+"""
+
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+
+RUTA_SOCKET = os.getenv("CLI_SOCKET", "data/cli.sock")
+
+
+class _Manejador(socketserver.StreamRequestHandler):
+    """
+    Una petición por conexión: una línea JSON con argv y el directorio de
+    trabajo del cliente; responde con la salida del comando y su código.
+    """
+
+    def handle(self):
+        import cli
+
+        peticion = json.loads(self.rfile.readline())
+        if peticion.get('ping'):
+            self._responder(0, "")
+            return
+        if peticion.get('parar'):
+            self._responder(0, "⏹️  Servicio detenido\n")
+            self.server.parar = True
+            return
+
+        salida = io.StringIO()
+        directorio = os.getcwd()
+        try:
+            # Las rutas relativas (--salida, data/) son las del cliente
+            os.chdir(peticion.get('cwd') or directorio)
+            with redirect_stdout(salida), redirect_stderr(salida):
+                try:
+                    codigo = cli.main(peticion['argv'])
+                except SystemExit as e:
+                    # argparse (--help, argumentos inválidos)
+                    codigo = e.code if isinstance(e.code, int) else 0 if e.code is None else 1
+                except Exception as e:
+                    print(f"\n❌ Error inesperado: {e}")
+                    codigo = 1
+        finally:
+            os.chdir(directorio)
+        self._responder(codigo, salida.getvalue())
+
+    def _responder(self, codigo, salida):
+        respuesta = {'codigo': codigo, 'salida': salida}
+        self.wfile.write(json.dumps(respuesta, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def servir(ruta=RUTA_SOCKET):
+    """
+    Arranca el servicio y atiende comandos hasta Ctrl+C o `servicio --parar`.
+    Los comandos se ejecutan de uno en uno: la salida se captura
+    redirigiendo stdout, que es global al proceso.
+    """
+    import cli
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("❌ Este sistema no tiene sockets Unix: el servicio no está disponible")
+        return False
+    if os.path.exists(ruta):
+        if enviar_peticion({'ping': True}, ruta) is not None:
+            print(f"❌ Ya hay un servicio escuchando en {ruta}")
+            return False
+        os.remove(ruta)  # socket huérfano de una ejecución anterior
+    directorio = os.path.dirname(ruta)
+    if directorio:
+        os.makedirs(directorio, exist_ok=True)
+
+    print("⏳ Importando dependencias...")
+    cli.precargar()
+    cli.compartir_clientes()
+
+    with socketserver.UnixStreamServer(ruta, _Manejador) as servidor:
+        os.chmod(ruta, 0o600)
+        servidor.parar = False
+        print(f"✅ Servicio escuchando en {ruta} (Ctrl+C para parar)")
+        try:
+            while not servidor.parar:
+                servidor.handle_request()
+        finally:
+            cli.cerrar_clientes()
+            if os.path.exists(ruta):
+                os.remove(ruta)
+    return True
+
+
+def enviar_peticion(peticion, ruta=RUTA_SOCKET):
+    """
+    Envía una petición al servicio y devuelve su respuesta, o None si no
+    hay ningún servicio escuchando en `ruta`.
+    """
+    if not hasattr(socket, "AF_UNIX") or not os.path.exists(ruta):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conexion:
+            conexion.connect(ruta)
+            conexion.sendall(json.dumps(peticion).encode("utf-8") + b"\n")
+            with conexion.makefile("rb") as lector:
+                linea = lector.readline()
+    except OSError:
+        return None
+    return json.loads(linea) if linea else None
+
+
+def ejecutar_remoto(argv, ruta=RUTA_SOCKET):
+    """
+    Ejecuta un comando de cli.py en el servicio y muestra su salida.
+    Devuelve el código de salida, o None si el servicio no está disponible.
+    """
+    respuesta = enviar_peticion({'argv': argv, 'cwd': os.getcwd()}, ruta)
+    if respuesta is None:
+        return None
+    sys.stdout.write(respuesta['salida'])
+    return respuesta['codigo']
+
+
+def parar(ruta=RUTA_SOCKET):
+    respuesta = enviar_peticion({'parar': True}, ruta)
+    if respuesta is None:
+        print(f"ℹ️  No hay ningún servicio escuchando en {ruta}")
+        return False
+    sys.stdout.write(respuesta['salida'])
+    return True
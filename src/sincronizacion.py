@@ -0,0 +1,159 @@
+"""
+Sincronización incremental de actividades de Strava con InfluxDB
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+Pensado para ejecutarse periódicamente (por ejemplo, con cron):
+
+    python src/sincronizacion.py Alba Alonso
+"""
+
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+
+from carga_masiva import ErrorListado, cargar_actividades, listar_actividades
+from cliente_strava import LimitadorTasa
+from main import obtener_config_influx, obtener_config_usuario, obtener_proveedor_token
+from registro_usuarios import listar_usuarios
+
+# Margen hacia atrás sobre la marca de agua para recoger actividades subidas con retraso
+MARGEN_HORAS = 24
+
+
+def ruta_estado(usuario, data_path="data/"):
+    """
+    Devuelve la ruta del fichero de estado de sincronización de un usuario.
+    """
+    return os.path.join(data_path, f"estado_sync_{usuario}.json")
+
+
+def cargar_estado(usuario, data_path="data/"):
+    """
+    Lee el estado de sincronización: fecha de inicio (epoch) de la actividad más
+    reciente ingerida y conjunto de IDs ya ingeridos.
+    """
+    ruta = ruta_estado(usuario, data_path)
+    if not os.path.exists(ruta):
+        return {'ultima_fecha': None, 'ids': set()}
+    with open(ruta, encoding="utf-8") as f:
+        estado = json.load(f)
+    return {'ultima_fecha': estado.get('ultima_fecha'), 'ids': set(estado.get('ids', []))}
+
+
+def guardar_estado(usuario, estado, data_path="data/"):
+    """
+    Guarda el estado de forma atómica (escritura a temporal + renombrado).
+    """
+    os.makedirs(data_path, exist_ok=True)
+    ruta = ruta_estado(usuario, data_path)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump({'ultima_fecha': estado['ultima_fecha'], 'ids': sorted(estado['ids'])}, f)
+    os.replace(temporal, ruta)
+
+
+def _epoch(start_date):
+    """
+    Convierte el start_date de Strava en timestamp epoch UTC.
+    """
+    return datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+
+
+def sincronizar_usuario(usuario, access_token, config_influx, max_hilos=4, limitador=None, data_path="data/",
+                        asincrono=False):
+    """
+    Descarga y sube solo las actividades nuevas de un usuario desde la última
+    sincronización, saltando los IDs ya ingeridos, y actualiza el estado.
+    Con `asincrono` la carga usa el pipeline de pipeline_async.
+    `access_token` es el token o la función de obtener_proveedor_token.
+
+    La marca de agua no pasa de la actividad fallida más antigua, así que la
+    siguiente sincronización la vuelve a listar e intentar. Si el listado de
+    Strava se corta a medias se lanza ErrorListado sin tocar el estado: las
+    páginas que faltan se piden en la próxima ejecución.
+    """
+    estado = cargar_estado(usuario, data_path)
+    despues = None
+    if estado['ultima_fecha'] is not None:
+        despues = estado['ultima_fecha'] - MARGEN_HORAS * 3600
+
+    print(f"\n🔄 Sincronizando {usuario}...")
+    actividades = listar_actividades(access_token, despues=despues, limitador=limitador, estricto=True)
+    nuevas = [a for a in actividades if str(a['id']) not in estado['ids']]
+    print(f"🆕 Actividades nuevas: {len(nuevas)}")
+    if not nuevas:
+        return None
+
+    if asincrono:
+        from pipeline_async import cargar_actividades_async
+        concurrencia = {'streams': max_hilos, 'escritura': max_hilos}
+        resumen = cargar_actividades_async(nuevas, usuario, access_token, config_influx, concurrencia,
+                                           limitador=limitador)
+    else:
+        resumen = cargar_actividades(nuevas, usuario, access_token, config_influx, max_hilos, limitador)
+
+    for actividad in resumen['correctas']:
+        estado['ids'].add(str(actividad['id']))
+        fecha = _epoch(actividad['start_date'])
+        if estado['ultima_fecha'] is None or fecha > estado['ultima_fecha']:
+            estado['ultima_fecha'] = fecha
+    fallidas = {str(id_actividad) for id_actividad in resumen['fallidas']}
+    fechas_fallidas = [_epoch(a['start_date']) for a in nuevas if str(a['id']) in fallidas]
+    if fechas_fallidas and estado['ultima_fecha'] is not None:
+        estado['ultima_fecha'] = min(estado['ultima_fecha'], min(fechas_fallidas))
+        print(f"⚠️  {len(fechas_fallidas)} actividades fallidas se reintentarán en la próxima sincronización")
+    guardar_estado(usuario, estado, data_path)
+    print(f"✅ Estado de {usuario} actualizado ({len(estado['ids'])} actividades ingeridas)")
+    return resumen
+
+
+def main():
+    """
+    Función principal del script de sincronización (no interactiva)
+    Sin actividades nuevas no se llegan a importar pandas ni pyarrow, así
+    que las ejecuciones periódicas que no encuentran nada terminan rápido.
+    """
+    from escritor_influx import reenviar_spool
+
+    parser = argparse.ArgumentParser(description="Sincronización incremental Strava → InfluxDB")
+    parser.add_argument("usuarios", nargs="*", help="Usuarios a sincronizar (por defecto, todos los registrados)")
+    parser.add_argument("--hilos", type=int, default=4, help="Descargas simultáneas")
+    parser.add_argument("--asincrono", action="store_true", help="Usar el pipeline asíncrono por etapas")
+    args = parser.parse_args()
+
+    config_influx = obtener_config_influx()
+    if config_influx is None:
+        return
+    reenviar_spool(config_influx)
+
+    limitador = LimitadorTasa()
+    for usuario in args.usuarios or listar_usuarios():
+        config = obtener_config_usuario(usuario)
+        if not all(config.values()):
+            print(f"❌ Error: Faltan credenciales de Strava para {usuario} (registro o variables de entorno)")
+            continue
+        access_token = obtener_proveedor_token(
+            config['client_id'],
+            config['client_secret'],
+            config['refresh_token'],
+            usuario
+        )
+        if not access_token:
+            print(f"❌ No se pudo obtener el token de acceso de {usuario}.")
+            continue
+        try:
+            sincronizar_usuario(usuario, access_token, config_influx, args.hilos, limitador,
+                                asincrono=args.asincrono)
+        except ErrorListado as e:
+            print(f"❌ Listado de {usuario} incompleto, no se actualiza su estado: {e}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\n⏹️  Proceso interrumpido por el usuario.")
+    except Exception as e:
+        print(f"\n❌ Error inesperado: {e}")
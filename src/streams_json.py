@@ -0,0 +1,162 @@
+"""
+Lectura incremental de la respuesta de streams de Strava
+Autores: Alba y Alonso
+Fecha: 2025-12-24
+
+`response.json()` necesita el cuerpo completo en memoria, lo decodifica a
+texto (otra copia) y crea una lista de objetos Python por muestra: con
+actividades de cientos de miles de muestras (ultras, bikepacking de varios
+días) el pico de memoria es muchas veces el tamaño de la respuesta.
+
+Aquí la respuesta (key_by_type=true) se recorre por fragmentos y cada array
+`data` se convierte con np.fromstring directamente en un buffer NumPy del
+tipo final de su columna. Tras el primer stream se conoce el número de
+muestras, así que los demás buffers se reservan con el tamaño exacto. En
+memoria solo quedan el fragmento en curso y los arrays finales.
+"""
+
+import codecs
+import re
+import warnings
+
+import numpy as np
+
+TAMANO_FRAGMENTO = 64 * 1024
+
+_PATRON_CLAVE = re.compile(r'"(\w+)"\s*:\s*\{')
+_PATRON_DATA = re.compile(r'"data"\s*:\s*\[')
+_FIN_PARES = re.compile(r'\]\s*\]')
+_SIN_CORCHETES = str.maketrans("[]", "  ")
+
+
+class _Buffer:
+    """
+    Array NumPy que se rellena por trozos. Si se conoce el tamaño se reserva
+    de una vez; si no, crece por duplicación.
+    """
+
+    def __init__(self, dtype, capacidad):
+        self.datos = np.empty(capacidad, dtype=dtype)
+        self.n = 0
+
+    def anadir(self, valores):
+        if self.datos.dtype.kind in "iu" and np.isnan(valores).any():
+            # Stream con huecos (null): float32 con NaN, como _array_stream
+            self.datos = self.datos.astype(np.float32)
+        fin = self.n + len(valores)
+        if fin > len(self.datos):
+            nuevo = np.empty(max(fin, 2 * len(self.datos), 4096), dtype=self.datos.dtype)
+            nuevo[:self.n] = self.datos[:self.n]
+            self.datos = nuevo
+        self.datos[self.n:fin] = valores
+        self.n = fin
+
+    def resultado(self):
+        if self.n == len(self.datos):
+            return self.datos
+        # Sin la capacidad sobrante (solo ocurre en el primer stream)
+        return self.datos[:self.n].copy()
+
+
+def _numeros(texto):
+    """
+    Convierte 'v1,v2,...' (null = NaN; corchetes de latlng ignorados) en float64.
+    """
+    texto = texto.translate(_SIN_CORCHETES).replace("null", "nan")
+    if not texto.strip():
+        return np.empty(0)
+    with warnings.catch_warnings():
+        # np.fromstring solo avisa si encuentra texto que no es un número
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(texto, sep=",")
+        except DeprecationWarning as e:
+            raise ValueError(f"Stream con valores no numéricos: {texto[:80]!r}") from e
+
+
+def leer_streams(fragmentos, dtypes=None):
+    """
+    Lee una respuesta de streams (key_by_type=true) a partir de un iterable
+    de fragmentos (bytes o str). Devuelve el mismo diccionario que
+    response.json(), pero con cada `data` como array NumPy del tipo indicado
+    en `dtypes` (float64 por defecto) y latlng como array (n, 2).
+    """
+    dtypes = dtypes or {}
+    decodificador = codecs.getincrementaldecoder("utf-8")()
+    streams = {}
+    muestras = None
+    texto = ""
+    clave = None
+    buffer = None
+    pares = False
+
+    for fragmento in fragmentos:
+        texto += decodificador.decode(fragmento) if isinstance(fragmento, bytes) else fragmento
+        while True:
+            if buffer is None:
+                # Fuera de un array: buscar el siguiente "data": [ y su stream
+                inicio = _PATRON_DATA.search(texto)
+                claves = _PATRON_CLAVE.findall(texto, 0, inicio.start() if inicio else len(texto))
+                if claves:
+                    clave = claves[-1]
+                if inicio is None:
+                    # Se conserva la cola por si el patrón ha quedado partido
+                    texto = texto[-64:]
+                    break
+                pares = clave == 'latlng'
+                if muestras is None:
+                    capacidad = 4096
+                else:
+                    capacidad = 2 * muestras if pares else muestras
+                buffer = _Buffer(np.float64 if pares else dtypes.get(clave, np.float64), capacidad)
+                texto = texto[inicio.end():]
+
+            # Dentro de un array: buscar su cierre
+            if pares and texto.lstrip().startswith("]"):
+                # latlng vacío: "data": []
+                fin = texto.index("]")
+                siguiente = fin + 1
+            elif pares:
+                cierre = _FIN_PARES.search(texto)
+                fin, siguiente = (cierre.start(), cierre.end()) if cierre else (-1, -1)
+            else:
+                fin = texto.find("]")
+                siguiente = fin + 1
+            if fin == -1:
+                # Array sin terminar: se convierte hasta la última coma completa
+                corte = texto.rfind(",")
+                if corte > 0:
+                    buffer.anadir(_numeros(texto[:corte]))
+                    texto = texto[corte + 1:]
+                break
+
+            buffer.anadir(_numeros(texto[:fin]))
+            texto = texto[siguiente:]
+            datos = buffer.resultado()
+            streams[clave] = {'data': datos.reshape(-1, 2) if pares else datos}
+            if muestras is None and len(datos):
+                muestras = len(datos) // 2 if pares else len(datos)
+            buffer = None
+
+    if buffer is not None:
+        raise ValueError("Respuesta de streams incompleta")
+    return streams
+
+
+def leer_respuesta(response, dtypes=None, tamano_fragmento=TAMANO_FRAGMENTO):
+    """
+    Lee una respuesta de requests abierta con stream=True. Devuelve
+    (streams, bytes leídos) y cierra la conexión.
+    """
+    leidos = 0
+
+    def fragmentos():
+        nonlocal leidos
+        for fragmento in response.iter_content(tamano_fragmento):
+            leidos += len(fragmento)
+            yield fragmento
+
+    try:
+        return leer_streams(fragmentos(), dtypes), leidos
+    finally:
+        response.close()